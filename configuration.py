@@ -61,6 +61,16 @@ class Configuration:
         
         self.legacy_percent = self.__get_legacy_percent("OTTM_LEGACY_PERCENT")
 
+        self.compute_dmm = self.__get_bool("OTTM_COMPUTE_DMM", False)
+        self.workers = self.__get_workers("OTTM_WORKERS")
+        self.lizard_workers = self.__get_workers("OTTM_LIZARD_WORKERS")
+        self.source_backend = self.__get_source_backend("OTTM_SOURCE_BACKEND")
+        self.batch_size = self.__get_batch_size("OTTM_BATCH_SIZE")
+        self.ck_incremental = self.__get_bool("OTTM_CK_INCREMENTAL", False)
+        self.kmeans_mini_batch = self.__get_bool("OTTM_KMEANS_MINI_BATCH", False)
+        self.model_dir = os.getenv("OTTM_MODEL_DIR", "data/models")
+        self.cache_dir = os.getenv("OTTM_CACHE_DIR", "data/cache")
+
 
     @staticmethod
     def __get_log_level(env_var):
@@ -152,6 +162,56 @@ class Configuration:
             )
         return retry_delay
 
+    @staticmethod
+    def __get_bool(env_var, default: bool) -> bool:
+        value = os.getenv(env_var, "")
+        if not value:
+            return default
+        if value.lower() in ["true", "1", "yes"]:
+            return True
+        if value.lower() in ["false", "0", "no"]:
+            return False
+        raise ConfigurationValidationException(
+            f"Incorrect value : {value}, {env_var} should be a boolean (true or false)"
+        )
+
+    @staticmethod
+    def __get_workers(env_var) -> int:
+        workers_str = os.getenv(env_var, "")
+        if not workers_str:
+            return os.cpu_count() or 1
+        try:
+            workers = int(workers_str)
+        except ValueError:
+            raise ConfigurationValidationException(
+                f"Incorrect value : {workers_str}, {env_var} should be an integer number of processes"
+            )
+        if workers < 1:
+            raise ConfigurationValidationException(f"{env_var} should be greater than 0")
+        return workers
+
+    @staticmethod
+    def __get_batch_size(env_var) -> int:
+        batch_size_str = os.getenv(env_var, "1000")
+        try:
+            batch_size = int(batch_size_str)
+        except ValueError:
+            raise ConfigurationValidationException(
+                f"Incorrect value : {batch_size_str}, {env_var} should be an integer number of rows"
+            )
+        if batch_size < 1:
+            raise ConfigurationValidationException(f"{env_var} should be greater than 0")
+        return batch_size
+
+    @staticmethod
+    def __get_source_backend(env_var) -> str:
+        source_backend = os.getenv(env_var, "git").lower()
+        if source_backend not in ["git", "checkout"]:
+            raise ConfigurationValidationException(
+                f"Incorrect value : {source_backend}, {env_var} should be git or checkout"
+            )
+        return source_backend
+
     @staticmethod
     def __get_required_value(env_var):
         value = os.getenv(env_var)
@@ -1,30 +1,63 @@
+import json
 import logging
 import os
 import subprocess
 import tempfile
 from os.path import exists
+from typing import Dict, Iterator, List, Tuple
+
 import pandas as pd
+from models.ckclass import CkClass
 from models.metric import Metric
+from connectors.fileanalyzer import get_blob_hash
+from utils.gittree import GitTree
 from utils.math import Math
 from utils.timeit import timeit
 
+# Number of blob hashes by query on the CK store
+CK_QUERY_SIZE = 500
+
+# Columns of the CK reports used to compute the metrics
+CLASS_COLUMNS = ['wmc', 'dit', 'noc', 'cbo', 'lcom', 'lcc', 'loc', 'fanin', 'fanout', 'totalMethodsQty',
+                 'publicMethodsQty', 'privateMethodsQty', 'modifiers', 'nosi', 'rfc', 'tcc', 'cboModified',
+                 'lcom*', 'returnQty', 'loopQty', 'tryCatchQty', 'parenthesizedExpsQty', 'numbersQty',
+                 'mathOperationsQty', 'maxNestedBlocksQty', 'anonymousClassesQty', 'innerClassesQty',
+                 'lambdasQty', 'uniqueWordsQty', 'logStatementsQty', 'variablesQty', 'comparisonsQty',
+                 'visibleMethodsQty', 'totalFieldsQty', 'stringLiteralsQty']
+# Values of the methods, fields and variables, summed by class: report -> (prefix, columns)
+MEMBER_COLUMNS = {
+    'method.csv': ('method', ['hasJavaDoc', 'methodsInvokedQty']),
+    'field.csv': ('field', ['usage']),
+    'variable.csv': ('variable', ['usage']),
+}
+
 
 class CkConnector:
     """
     Connector to CK CLI tool
     https://github.com/mauricioaniche/ck
 
+    The values of each class are stored in the ck_class table, keyed by the
+    blob hash of its file, the metrics of the version are the means of the
+    values of its classes. CK analyzes all the Java files of the version by
+    default. With OTTM_CK_INCREMENTAL, it only analyzes the files that are
+    not in the store: the values depending on the other classes (fan-in,
+    NOC, CBO, DIT, RFC) then come from the files analyzed along with them.
+
     Attributes:
     -----------
         - directory   Full path to a cloned GIT repository
         - session     Connection to a database managed by sqlalchemy
         - version     Sqlalchemy object representing a Version
+        - git_tree    Files of the version read from the git objects, None to read directory
     """
-    def __init__(self, directory, version, session, config):
+    def __init__(self, directory, version, session, config, git_tree: GitTree = None):
         self.directory = directory
         self.session = session
         self.version = version
         self.configuration = config
+        self.git_tree = git_tree
+        self.__new_entries = []
 
     def analyze_source_code(self):
         """
@@ -38,94 +71,235 @@ class CkConnector:
         if self.configuration.language != "Java":
             logging.info('CK is only used for Java language')
         elif not metric.ck_wmc:
-            self.compute_metrics(metric)
+            if self.compute_metrics(metric):
+                # Save metrics values into the database
+                self.save_cache_updates(self.session, self.get_cache_updates())
+                self.session.add(metric)
+                self.session.commit()
+                logging.info("CK metrics added to database for version " + self.version.tag)
         else:
             logging.info('CK analysis already done for this version')
 
-    def __compute_mean(self, metric, csv_file):
-        tmp = csv_file[metric].tolist()
-        # return Math.get_rounded_mean(tmp)
-        # TODO fixme
-        return Math.get_rounded_mean(tmp)
+    def __compute_mean(self, metric, classes):
+        return Math.get_rounded_mean([values[metric] for values in classes if metric in values])
+
+    def __compute_member_mean(self, prefix, metric, classes):
+        total = sum(values.get(f"{prefix}_{metric}_sum", 0) for values in classes)
+        count = sum(values.get(f"{prefix}_{metric}_count", 0) for values in classes)
+        # Same error as the mean of an empty list
+        return Math.get_rounded_mean([total / count] if count else [])
 
     @timeit
     def compute_metrics(self, metric):
         """
         Compute CK metrics. As the metrics were computed at the file or function level,
         we need to compute the average for the repository.
+        Return True if the metric object was filled with CK values
         """
         logging.info('CK::compute_metrics')
-        # Read csv files
+        files = list(self.__list_java_files())
+        blob_hashes = {blob_hash for _, blob_hash, _ in files}
+        stored = self.__load_stored_classes(blob_hashes) if self.configuration.ck_incremental else {}
+        missing = [(path, blob_hash, read) for path, blob_hash, read in files if blob_hash not in stored]
+        logging.info(f"CK: {len(files) - len(missing)} file(s) in the store, {len(missing)} to analyze")
+
+        if missing:
+            analyzed = self.__analyze_files(missing)
+            if analyzed is None:
+                return False
+            stored.update(analyzed)
+
+        # The classes of the version, a file present twice counts twice as in a CK report
+        classes = [values for _, blob_hash, _ in files
+                   for class_name, values in stored.get(blob_hash, []) if class_name is not None]
+        try:
+            metric.version_id = self.version.version_id
+
+            # Calculate mean CK values
+            metric.ck_wmc = self.__compute_mean('wmc', classes)
+            metric.ck_dit = self.__compute_mean('dit', classes)
+            metric.ck_noc = self.__compute_mean('noc', classes)
+            metric.ck_cbo = self.__compute_mean('cbo', classes)
+            metric.ck_lcom = self.__compute_mean('lcom', classes)
+            metric.ck_lcc = self.__compute_mean('lcc', classes)
+            metric.ck_loc = self.__compute_mean('loc', classes)
+            metric.ck_fan_in = self.__compute_mean('fanin', classes)
+            metric.ck_fan_out = self.__compute_mean('fanout', classes)
+            metric.ck_nom = self.__compute_mean('totalMethodsQty', classes)
+            metric.ck_nopm = self.__compute_mean('publicMethodsQty', classes)
+            metric.ck_noprm = self.__compute_mean('privateMethodsQty', classes)
+            metric.ck_modifiers = self.__compute_mean('modifiers', classes)
+            metric.ck_nosi = self.__compute_mean('nosi', classes)
+            metric.ck_rfc = self.__compute_mean('rfc', classes)
+            metric.ck_tcc = self.__compute_mean('tcc', classes)
+            metric.ck_cbo_modified = self.__compute_mean('cboModified', classes)
+            metric.ck_lcom_modified = self.__compute_mean('lcom*', classes)
+            metric.ck_qty_returns = self.__compute_mean('returnQty', classes)
+            metric.ck_qty_loops = self.__compute_mean('loopQty', classes)
+            metric.ck_qty_try_catch = self.__compute_mean('tryCatchQty', classes)
+            metric.ck_qty_parenth_exps = self.__compute_mean('parenthesizedExpsQty', classes)
+            metric.ck_qty_numbers = self.__compute_mean('numbersQty', classes)
+            metric.ck_qty_math_operations = self.__compute_mean('mathOperationsQty', classes)
+            metric.ck_qty_nested_blocks = self.__compute_mean('maxNestedBlocksQty', classes)
+            metric.ck_qty_ano_inner_cls_and_lambda = self.__compute_mean('anonymousClassesQty', classes) + self.__compute_mean(
+                'innerClassesQty', classes) + self.__compute_mean('lambdasQty', classes)
+            metric.ck_qty_unique_words = self.__compute_mean('uniqueWordsQty', classes)
+            metric.ck_numb_log_stmts = self.__compute_mean('logStatementsQty', classes)
+            metric.ck_qty_math_variables = self.__compute_mean('variablesQty', classes)
+            metric.ck_qty_comparisons = self.__compute_mean('comparisonsQty', classes)
+            metric.ck_num_methods = self.__compute_mean('totalMethodsQty', classes)
+            metric.ck_num_visible_methods = self.__compute_mean('visibleMethodsQty', classes)
+            metric.ck_num_fields = self.__compute_mean('totalFieldsQty', classes)
+            metric.ck_qty_str_literals = self.__compute_mean('stringLiteralsQty', classes)
+            metric.ck_has_javadoc = self.__compute_member_mean('method', 'hasJavaDoc', classes)
+            metric.ck_method_invok = self.__compute_member_mean('method', 'methodsInvokedQty', classes)
+            metric.ck_usage_fields = self.__compute_member_mean('field', 'usage', classes)
+            metric.ck_usage_vars = self.__compute_member_mean('variable', 'usage', classes)
+            return True
+        except Exception as e:
+            logging.error("An error occurred while computing CK metrics for version " + self.version.tag)
+            logging.error(str(e))
+        return False
+
+    def get_cache_updates(self) -> Dict:
+        """Classes analyzed by compute_metrics, to be saved by save_cache_updates"""
+        return {"new_entries": self.__new_entries}
+
+    @staticmethod
+    def save_cache_updates(session, cache_updates: Dict):
+        """
+        Insert the classes analyzed into the CK store
+        The caller commits the session
+        """
+        new_entries = cache_updates["new_entries"]
+        if session is None or not new_entries:
+            return
+        # Another process may have analyzed the same files in the meantime
+        existing = set()
+        blob_hashes = list({entry["blob_hash"] for entry in new_entries})
+        for i in range(0, len(blob_hashes), CK_QUERY_SIZE):
+            rows = session.query(CkClass.blob_hash) \
+                          .filter(CkClass.tool_version == new_entries[0]["tool_version"]) \
+                          .filter(CkClass.blob_hash.in_(blob_hashes[i:i + CK_QUERY_SIZE]))
+            existing.update(blob_hash for blob_hash, in rows)
+        session.bulk_insert_mappings(CkClass, [entry for entry in new_entries if entry["blob_hash"] not in existing])
+
+    @staticmethod
+    def get_tool_version(config) -> str:
+        """Values computed by another version of CK aren't reused"""
+        return os.path.basename(config.code_ck_path)
+
+    def __list_java_files(self) -> Iterator[Tuple[str, str, object]]:
+        """
+        List the Java files of the version
+        Yield (path, blob hash, content) where content is the bytes of the
+        file or None if it must be read from the git objects
+        """
+        if self.git_tree is not None:
+            for path, blob_hash in self.git_tree.list_files():
+                if path.endswith(".java"):
+                    yield path, blob_hash, None
+            return
+        for root, dirs, filenames in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if d != ".git"]
+            for filename in filenames:
+                if filename.endswith(".java"):
+                    full_path = os.path.join(root, filename)
+                    with open(full_path, "rb") as f:
+                        content = f.read()
+                    yield os.path.relpath(full_path, self.directory), get_blob_hash(content), content
+
+    def __load_stored_classes(self, blob_hashes) -> Dict[str, List[Tuple[str, Dict]]]:
+        if self.session is None:
+            return {}
+        stored = {}
+        blob_hashes = list(blob_hashes)
+        for i in range(0, len(blob_hashes), CK_QUERY_SIZE):
+            rows = self.session.query(CkClass.blob_hash, CkClass.class_name, CkClass.values) \
+                               .filter(CkClass.tool_version == self.get_tool_version(self.configuration)) \
+                               .filter(CkClass.blob_hash.in_(blob_hashes[i:i + CK_QUERY_SIZE]))
+            for blob_hash, class_name, values in rows:
+                stored.setdefault(blob_hash, []).append((class_name, json.loads(values) if values else None))
+        return stored
+
+    def __analyze_files(self, files) -> Dict[str, List[Tuple[str, Dict]]]:
+        """
+        Run CK on the files, written into a temporary directory
+        Return the classes of each blob hash, None if CK failed
+        """
+        with tempfile.TemporaryDirectory() as src_dir, tempfile.TemporaryDirectory() as tmp_dir:
+            blob_hashes = {}
+            git_files = [(path, blob_hash) for path, blob_hash, content in files if content is None]
+            git_contents = self.git_tree.read_blobs([blob_hash for _, blob_hash in git_files]) if git_files else []
+            contents = [(path, blob_hash, content) for path, blob_hash, content in files if content is not None] + \
+                       [(path, blob_hash, content) for (path, blob_hash), content in zip(git_files, git_contents)]
+            for path, blob_hash, content in contents:
+                full_path = os.path.join(src_dir, path)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                with open(full_path, "wb") as f:
+                    f.write(content)
+                blob_hashes[os.path.normpath(path)] = blob_hash
 
-        with tempfile.TemporaryDirectory() as tmp_dir:
             # Launch the CK utility and output values into a temporary directory
             logging.info('CK::generate_ck_files')
 
             process = subprocess.run([self.configuration.java_path, "-jar",
                                       self.configuration.code_ck_path,
-                                      self.directory, "True", "0", "True", os.path.join(tmp_dir, "")])
+                                      src_dir, "True", "0", "True", os.path.join(tmp_dir, "")])
             logging.info('Executed command line: ' + ' '.join(process.args))
             logging.info('Command return code ' + str(process.returncode))
 
-            if exists(os.path.join(tmp_dir, "class.csv")) and exists(os.path.join(tmp_dir, "method.csv")) and exists(
-                    os.path.join(tmp_dir, "field.csv")) and exists(os.path.join(tmp_dir, "variable.csv")):
-                try:
-                    logging.info('CK files generated correctly')
-                    metric.version_id = self.version.version_id
-
-                    # Read csv files
-                    csv_class = pd.read_csv(os.path.join(tmp_dir, "class.csv"))
-                    csv_method = pd.read_csv(os.path.join(tmp_dir, "method.csv"))
-                    csv_field = pd.read_csv(os.path.join(tmp_dir, "field.csv"))
-                    csv_variable = pd.read_csv(os.path.join(tmp_dir, "variable.csv"))
-
-                    # Calculate mean CK values
-                    metric.ck_wmc = self.__compute_mean('wmc', csv_class)
-                    metric.ck_dit = self.__compute_mean('dit', csv_class)
-                    metric.ck_noc = self.__compute_mean('noc', csv_class)
-                    metric.ck_cbo = self.__compute_mean('cbo', csv_class)
-                    metric.ck_lcom = self.__compute_mean('lcom', csv_class)
-                    metric.ck_lcc = self.__compute_mean('lcc', csv_class)
-                    metric.ck_loc = self.__compute_mean('loc', csv_class)
-                    metric.ck_fan_in = self.__compute_mean('fanin', csv_class)
-                    metric.ck_fan_out = self.__compute_mean('fanout', csv_class)
-                    metric.ck_nom = self.__compute_mean('totalMethodsQty', csv_class)
-                    metric.ck_nopm = self.__compute_mean('publicMethodsQty', csv_class)
-                    metric.ck_noprm = self.__compute_mean('privateMethodsQty', csv_class)
-                    metric.ck_modifiers = self.__compute_mean('modifiers', csv_class)
-                    metric.ck_nosi = self.__compute_mean('nosi', csv_class)
-                    metric.ck_rfc = self.__compute_mean('rfc', csv_class)
-                    metric.ck_tcc = self.__compute_mean('tcc', csv_class)
-                    metric.ck_cbo_modified = self.__compute_mean('cboModified', csv_class)
-                    metric.ck_lcom_modified = self.__compute_mean('lcom*', csv_class)
-                    metric.ck_qty_returns = self.__compute_mean('returnQty', csv_class)
-                    metric.ck_qty_loops = self.__compute_mean('loopQty', csv_class)
-                    metric.ck_qty_try_catch = self.__compute_mean('tryCatchQty', csv_class)
-                    metric.ck_qty_parenth_exps = self.__compute_mean('parenthesizedExpsQty', csv_class)
-                    metric.ck_qty_numbers = self.__compute_mean('numbersQty', csv_class)
-                    metric.ck_qty_math_operations = self.__compute_mean('mathOperationsQty', csv_class)
-                    metric.ck_qty_nested_blocks = self.__compute_mean('maxNestedBlocksQty', csv_class)
-                    metric.ck_qty_ano_inner_cls_and_lambda = self.__compute_mean('anonymousClassesQty', csv_class) + self.__compute_mean(
-                        'innerClassesQty', csv_class) + self.__compute_mean('lambdasQty', csv_class)
-                    metric.ck_qty_unique_words = self.__compute_mean('uniqueWordsQty', csv_class)
-                    metric.ck_numb_log_stmts = self.__compute_mean('logStatementsQty', csv_class)
-                    metric.ck_qty_math_variables = self.__compute_mean('variablesQty', csv_class)
-                    metric.ck_qty_comparisons = self.__compute_mean('comparisonsQty', csv_class)
-                    metric.ck_num_methods = self.__compute_mean('totalMethodsQty', csv_class)
-                    metric.ck_num_visible_methods = self.__compute_mean('visibleMethodsQty', csv_class)
-                    metric.ck_num_fields = self.__compute_mean('totalFieldsQty', csv_class)
-                    metric.ck_qty_str_literals = self.__compute_mean('stringLiteralsQty', csv_class)
-                    metric.ck_has_javadoc = self.__compute_mean("hasJavaDoc", csv_method)
-                    metric.ck_method_invok = self.__compute_mean("methodsInvokedQty", csv_method)
-                    metric.ck_usage_fields = self.__compute_mean("usage", csv_field)
-                    metric.ck_usage_vars = self.__compute_mean("usage", csv_variable)
-
-                    # Save metrics values into the database
-                    self.session.add(metric)
-                    self.session.commit()
-                    logging.info("CK metrics added to database for version " + self.version.tag)
-                except pd.errors.EmptyDataError:
-                    logging.error("No columns to parse from CK report / version " + self.version.tag)
-                except Exception as e:
-                    logging.error("An error occurred while reading CK report for version " + self.version.tag)
-                    logging.error(str(e))
+            if not all(exists(os.path.join(tmp_dir, report)) for report in ["class.csv"] + list(MEMBER_COLUMNS)):
+                return None
+            logging.info('CK files generated correctly')
+            try:
+                classes = self.read_ck_reports(tmp_dir, src_dir)
+            except pd.errors.EmptyDataError:
+                logging.error("No columns to parse from CK report / version " + self.version.tag)
+                return None
+            except Exception as e:
+                logging.error("An error occurred while reading CK report for version " + self.version.tag)
+                logging.error(str(e))
+                return None
+
+        analyzed = {}
+        for path, blob_hash in blob_hashes.items():
+            # A file without any class is stored too, so as not to analyze it again
+            analyzed[blob_hash] = classes.get(path, [(None, None)])
+        tool_version = self.get_tool_version(self.configuration)
+        self.__new_entries.extend(
+            {
+                "blob_hash": blob_hash,
+                "tool_version": tool_version,
+                "class_name": class_name,
+                "values": json.dumps(values) if values is not None else None
+            }
+            for blob_hash, file_classes in analyzed.items() for class_name, values in file_classes
+        )
+        return analyzed
+
+    @staticmethod
+    def read_ck_reports(report_dir, src_dir) -> Dict[str, List[Tuple[str, Dict]]]:
+        """
+        Read the CK reports, only the columns used by compute_metrics
+        Return the classes (name, values) of each file, by path relative to src_dir
+        """
+        class_report = pd.read_csv(os.path.join(report_dir, "class.csv"), usecols=['file', 'class'] + CLASS_COLUMNS)
+        # CK may report several classes of a file with the same name (inner, anonymous classes), each one counts
+        classes = {}
+        for values in class_report.to_dict('records'):
+            classes.setdefault((values.pop('file'), values.pop('class')), []).append(values)
+        for report, (prefix, columns) in MEMBER_COLUMNS.items():
+            member_report = pd.read_csv(os.path.join(report_dir, report), usecols=['file', 'class'] + columns)
+            sums = member_report.groupby(['file', 'class'])[columns].agg(['sum', 'count'])
+            sums.columns = [f"{prefix}_{column}_{aggregate}" for column, aggregate in sums.columns]
+            for key, values in sums.to_dict('index').items():
+                # Added once, to the first class of the name. The members of a class
+                # missing from class.csv count in the means of the members only
+                classes.setdefault(key, [{}])[0].update({name: float(value) for name, value in values.items()})
+
+        files = {}
+        for (file, class_name), class_values in classes.items():
+            path = os.path.normpath(os.path.relpath(os.path.realpath(file), os.path.realpath(src_dir)))
+            files.setdefault(path, []).extend((class_name, values) for values in class_values)
+        return files
@@ -1,25 +1,39 @@
+import hashlib
 import logging
 import subprocess
 import os
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
 from sqlalchemy.sql import func
 import pandas as pd
 
-from models.author import Author
 from models.ownership import Ownership
-from utils.database import save_file_if_not_found
+from utils.database import save_authors_if_not_found, save_files_if_not_found
+from utils.dirs import evict_old_files, make_private_dir
+
+# Folder of OTTM_CACHE_DIR of the outputs of the analyses, by hash of the git log and of code maat
+CODE_MAAT_CACHE_FOLDER = "code-maat"
+# Number of outputs kept in the cache, the least recently used are removed
+CODE_MAAT_CACHE_MAX_FILES = 1000
 
 class CodeMaatConnector:
     """
     Connector to code maat CLI tool
     https://github.com/adamtornhill/code-maat
 
+    The git log of the version is written once, the analyses run concurrently
+    (one JVM each, code maat runs one analysis per invocation) and their
+    outputs are cached by the hash of the log in OTTM_CACHE_DIR.
+
     Attributes:
     -----------
         - directory   Full path to a cloned GIT repository
         - session     Connection to a database managed by sqlalchemy
         - version     Sqlalchemy object representing a Version
+        - timings     Seconds spent in each analysis by the last run
     """
 
     def __init__(self, directory, version, session, config):
@@ -27,55 +41,90 @@ class CodeMaatConnector:
         self.session = session
         self.version = version
         self.configuration = config
+        self.timings = {}
 
     def analyze_git_log(self):
         """Populate the database from the GitHub API"""
         # Preserve the sequence below
         logging.info('CodeMaat::populate_db')
-        git_log_file = self.create_git_log_file()
         # Test if metrics have been already generated for this version
         ownership = self.session.query(Ownership).filter(Ownership.version_id == self.version.version_id).first()
-        if not ownership:
-            self.ownership_patterns(git_log_file)
-        else:
+        if ownership:
             logging.info('CodeMaat ownership pattern analysis already done for this version')
-        # git_log_file = self.create_git_log_file()
-        # self.ownership_patterns(git_log_file)
+            return
+        git_log_file = self.create_git_log_file()
+        try:
+            self.ownership_patterns(git_log_file)
+        finally:
+            os.remove(git_log_file)
         # self.number_of_authors_per_module(git_log_file)
         # self.logical_coupling(git_log_file)
 
     def create_git_log_file(self):
-        # Generate the git log for the version : use an intermediary bash file in order to avoid git log printing problems
+        """Generate the git log of the version, in the git2 format of code maat"""
         logging.info('create_git_log_file')
-        git_log_file = tempfile.mkstemp(suffix=".log")[1]
-        fd, bsh_file = tempfile.mkstemp(suffix=".bash")
-        fh = os.fdopen(fd, "w")
-        logging.info('Generate bash script for GIT log file: ' + bsh_file)
+        fd, git_log_file = tempfile.mkstemp(suffix=".log")
         logging.info('Generate GIT log file: ' + git_log_file)
-        bsh_stmt = f"cd {self.directory}\n"
-        bsh_stmt += f"{self.configuration.scm_path}"
-        bsh_stmt += " --no-pager log --all --numstat --date=short --pretty=format:\"--%h--%ad--%aN\" --no-renames"
-        bsh_stmt += " --since='" + self.version.start_date.isoformat() + "'"
-        bsh_stmt += " --until='" + self.version.end_date.isoformat() + "'"
-        bsh_stmt += f">{git_log_file}\n"
-        fh.write(bsh_stmt)
-        fh.close()
-        logging.info('Bash script: ' + bsh_stmt)
-        process = subprocess.run(["bash", bsh_file])
-        logging.info('Executed command line: ' + ' '.join(process.args))
+        args = [self.configuration.scm_path, "--no-pager", "log", "--all", "--numstat", "--date=short",
+                "--pretty=format:--%h--%ad--%aN", "--no-renames",
+                "--since=" + self.version.start_date.isoformat(),
+                "--until=" + self.version.end_date.isoformat()]
+        logging.info('Executed command line: ' + ' '.join(args))
+        with os.fdopen(fd, "wb") as log:
+            subprocess.run(args, cwd=self.directory, stdout=log, check=True)
         return git_log_file
 
+    def run_analyses(self, git_log_file, analyses: List[str]) -> Dict[str, str]:
+        """
+        Run code maat analyses (e.g. entity-ownership) on a git log, concurrently
+        The outputs already computed for the same log are reused
+        Return the output CSV file of each analysis
+        """
+        with open(git_log_file, "rb") as log:
+            log_hash = hashlib.sha1(log.read() + self.configuration.code_maat_path.encode()).hexdigest()
+        cache_dir = make_private_dir(os.path.join(self.configuration.cache_dir, CODE_MAAT_CACHE_FOLDER))
+
+        self.timings = {}
+        output_files = {analysis: os.path.join(cache_dir, f"{log_hash}-{analysis}.csv")
+                        for analysis in analyses}
+        missing = [analysis for analysis in analyses if not os.path.exists(output_files[analysis])]
+        for analysis in analyses:
+            if analysis not in missing:
+                logging.info('Code Maat ' + analysis + ' found in cache: ' + output_files[analysis])
+                os.utime(output_files[analysis])
+        with ThreadPoolExecutor(max_workers=self.configuration.workers) as executor:
+            list(executor.map(lambda analysis: self.__run_analysis(git_log_file, analysis, output_files[analysis]),
+                              missing))
+        if missing:
+            evict_old_files(cache_dir, CODE_MAAT_CACHE_MAX_FILES)
+        if self.timings:
+            logging.info('Code Maat timings: ' +
+                         ', '.join(f"{analysis} {seconds:.2f} s" for analysis, seconds in self.timings.items()))
+        return output_files
+
+    def __run_analysis(self, git_log_file, analysis, output_file):
+        start = time.perf_counter()
+        fd, tmp_file = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(output_file))
+        os.close(fd)
+        args = [self.configuration.java_path, "-jar", self.configuration.code_maat_path, "-l", git_log_file,
+                "-c", "git2", "-a", analysis, "-o", tmp_file]
+        logging.info('Executed command line: ' + ' '.join(args))
+        try:
+            subprocess.run(args, check=True)
+            # Only complete outputs enter the cache
+            os.replace(tmp_file, output_file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+        self.timings[analysis] = time.perf_counter() - start
+        logging.info('Code Maat output file: ' + output_file)
+
     def abs_churn(self, git_log_file):
         """
         Analyze git log through code churn axis
         """
         logging.info('abs_churn = ' + git_log_file)
-        output_file = tempfile.mkstemp(suffix=".csv")[1]
-        # java -jar ./ext-tools/code-maat-1.0.2.jar -l gitlogfile.log -c git2 -a abs-churn > code-maat-abs-churn.csv
-        process = subprocess.run([self.configuration.java_path, "-jar", self.configuration.code_maat_path, "-l", git_log_file,
-                 "-c", "git2", "-a", "abs-churn", "-o", output_file])
-        logging.info('Executed command line: ' + ' '.join(process.args))
-        logging.info('Code Maat output file: ' + output_file)
+        return self.run_analyses(git_log_file, ["abs-churn"])["abs-churn"]
 
     def number_of_authors_per_module(self, git_log_file):
         """
@@ -83,11 +132,7 @@ class CodeMaatConnector:
         https://github.com/adamtornhill/code-maat#mining-organizational-metrics
         """
         logging.info('number_of_authors_per_module = ' + git_log_file)
-        output_file = tempfile.mkstemp(suffix=".csv")[1]
-        process = subprocess.run([self.configuration.java_path, "-jar", self.configuration.code_maat_path, "-l", git_log_file,
-                 "-c", "git2", "-o", output_file])
-        logging.info('Executed command line: ' + ' '.join(process.args))
-        logging.info('Code Maat output file: ' + output_file)
+        return self.run_analyses(git_log_file, ["authors"])["authors"]
 
     def logical_coupling(self, git_log_file):
         """
@@ -95,11 +140,7 @@ class CodeMaatConnector:
         https://github.com/adamtornhill/code-maat#mining-logical-coupling
         """
         logging.info('logical_coupling = ' + git_log_file)
-        output_file = tempfile.mkstemp(suffix=".csv")[1]
-        process = subprocess.run([self.configuration.java_path, "-jar", self.configuration.code_maat_path, "-l", git_log_file,
-                 "-c", "git2", "-a", "coupling", "-o", output_file])
-        logging.info('Executed command line: ' + ' '.join(process.args))
-        logging.info('Code Maat output file: ' + output_file)
+        return self.run_analyses(git_log_file, ["coupling"])["coupling"]
 
     def code_age(self, git_log_file):
         """
@@ -107,11 +148,7 @@ class CodeMaatConnector:
         https://github.com/adamtornhill/code-maat#calculate-code-age
         """
         logging.info('code_age = ' + git_log_file)
-        output_file = tempfile.mkstemp(suffix=".csv")[1]
-        process = subprocess.run([self.configuration.java_path, "-jar", self.configuration.code_maat_path, "-l", git_log_file,
-                 "-c", "git2", "-a", "age", "-o", output_file])
-        logging.info('Executed command line: ' + ' '.join(process.args))
-        logging.info('Code Maat output file: ' + output_file)
+        return self.run_analyses(git_log_file, ["age"])["age"]
 
     def churn_by_author(self, git_log_file):
         """
@@ -119,11 +156,7 @@ class CodeMaatConnector:
         https://github.com/adamtornhill/code-maat#churn-by-author
         """
         logging.info('churn_by_author = ' + git_log_file)
-        output_file = tempfile.mkstemp(suffix=".csv")[1]
-        process = subprocess.run([self.configuration.java_path, "-jar", self.configuration.code_maat_path, "-l", git_log_file,
-                 "-c", "git2", "-a", "author-churn", "-o", output_file])
-        logging.info('Executed command line: ' + ' '.join(process.args))
-        logging.info('Code Maat output file: ' + output_file)
+        return self.run_analyses(git_log_file, ["author-churn"])["author-churn"]
 
     def churn_by_entity(self, git_log_file):
         """
@@ -131,11 +164,7 @@ class CodeMaatConnector:
         https://github.com/adamtornhill/code-maat#churn-by-entity
         """
         logging.info('churn_by_entity = ' + git_log_file)
-        output_file = tempfile.mkstemp(suffix=".csv")[1]
-        process = subprocess.run([self.configuration.java_path, "-jar", self.configuration.code_maat_path, "-l", git_log_file,
-                 "-c", "git2", "-a", "entity-churn", "-o", output_file])
-        logging.info('Executed command line: ' + ' '.join(process.args))
-        logging.info('Code Maat output file: ' + output_file)
+        return self.run_analyses(git_log_file, ["entity-churn"])["entity-churn"]
 
     def ownership_patterns(self, git_log_file):
         """
@@ -145,45 +174,33 @@ class CodeMaatConnector:
         https://github.com/adamtornhill/code-maat#ownership-patterns
         """
         logging.info('ownership_patterns = ' + git_log_file)
-        ownership_file = tempfile.mkstemp(suffix=".csv")[1]
-        process = subprocess.run([self.configuration.java_path, "-jar", self.configuration.code_maat_path, "-l", git_log_file,
-                 "-c", "git2", "-a", "entity-ownership", "-o", ownership_file])
-        logging.info('Executed command line: ' + ' '.join(process.args))
-        logging.info('Code Maat output file: ' + ownership_file)
-
-        effort_file = tempfile.mkstemp(suffix=".csv")[1]
-        process = subprocess.run([self.configuration.java_path, "-jar", self.configuration.code_maat_path, "-l", git_log_file,
-                 "-c", "git2", "-a", "entity-effort", "-o", effort_file])
-        logging.info('Executed command line: ' + ' '.join(process.args))
-        logging.info('Code Maat output file: ' + effort_file)
+        output_files = self.run_analyses(git_log_file, ["entity-ownership", "entity-effort"])
+        self.save_ownership_patterns(pd.read_csv(output_files["entity-ownership"]),
+                                     pd.read_csv(output_files["entity-effort"]))
 
+    def save_ownership_patterns(self, ownership: pd.DataFrame, effort: pd.DataFrame):
+        """
+        Insert the patterns of ownership into the database in a single transaction,
+        the authors and files are found or created in batches
+        """
         # Merge the two CSV / inner join on entity + author
-        ownership = pd.read_csv(ownership_file)
-        effort = pd.read_csv(effort_file)
-        df = pd.merge(ownership, effort, 
-                        on=['entity', 'author'], 
+        df = pd.merge(ownership, effort,
+                        on=['entity', 'author'],
                         how='inner')
 
-        # Insert the patterns of ownership into the database
-        for index, row in df.iterrows():
-            # Create the author if it doesn't exist
-            author = self.session.query(Author).filter(Author.name == row['author']).first()
-            if not author:
-                author = Author(name=row['author'])
-                self.session.add(author)
-                self.session.commit()
-
-            file = save_file_if_not_found(self.session, row['entity'])
-
-            # Create the pattern
-            pattern = Ownership(
-                version_id = self.version.version_id,
-                file_id = file.file_id,
-                author_id = author.author_id,
-                added = row['added'],
-                deleted = row['deleted'],
-                author_revs = row['author-revs'],
-                total_revs = row['total-revs']
-            )
-            self.session.add(pattern)
-            self.session.commit()
+        batch_size = self.configuration.batch_size
+        author_ids = save_authors_if_not_found(self.session, df['author'].unique(), batch_size)
+        file_ids = save_files_if_not_found(self.session, df['entity'].unique(), batch_size)
+
+        patterns = pd.DataFrame({
+            'version_id': self.version.version_id,
+            'file_id': df['entity'].map(file_ids),
+            'author_id': df['author'].map(author_ids),
+            'added': df['added'],
+            'deleted': df['deleted'],
+            'author_revs': df['author-revs'],
+            'total_revs': df['total-revs']
+        })
+        self.session.bulk_insert_mappings(Ownership, patterns.to_dict('records'))
+        self.session.commit()
+        logging.info(f"{len(patterns)} ownership pattern(s) saved")
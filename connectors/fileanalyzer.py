@@ -1,18 +1,79 @@
+import codecs
 import copy
 import glob
+import hashlib
+import io
+import json
 import logging
 import pathlib
 import math
-from typing import Iterator, Tuple
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
 
 import lizard
 from lizard_ext.keywords import IGNORED_WORDS
+from lizard_ext.version import version as lizard_version
 
 from utils.math import Math
 from utils.timeit import timeit
-from utils.proglang import guess_programing_language
+from utils.gittree import GitTree
+from utils.proglang import guess_file_language
+from models.lizardcache import LizardCache
 from models.metric import Metric
 
+# Number of blob hashes per query when looking up the cache
+CACHE_QUERY_SIZE = 500
+
+def get_blob_hash(content: bytes) -> str:
+    """Return the hash git gives to a file with this content (git hash-object)"""
+    header = b"blob " + str(len(content)).encode() + b"\0"
+    return hashlib.sha1(header + content).hexdigest()
+
+def _analyze_file_values(filename: str) -> Dict:
+    """
+    Analyze a source file with Lizard
+    Module level function so it can be sent to the worker processes
+    """
+    with open(filename, "rb") as f:
+        return _analyze_source_values(filename, f.read())
+
+def _analyze_source_values(filename: str, content: bytes) -> Dict:
+    """Analyze the content of a source file with Lizard"""
+    extensions = lizard.get_extensions(["wordcount"]) + [LizardExtension()]
+    file_analyze = lizard.FileAnalyzer(extensions).analyze_source_code(filename, _decode_source(content))
+    nb_lines, nb_blank_lines = _count_lines(content)
+    return {
+        "nloc": file_analyze.nloc,
+        "token_count": file_analyze.token_count,
+        "nb_functions": len(file_analyze.function_list),
+        "total_complexity": sum((f.cyclomatic_complexity for f in file_analyze.function_list)),
+        "average_complexity": file_analyze.average_cyclomatic_complexity,
+        "nb_operands": sum(file_analyze.wordCount.values()),
+        "operands": sorted(file_analyze.wordCount.keys()),
+        "nb_operators": sum(file_analyze.operatorCount.values()),
+        "operators": sorted(file_analyze.operatorCount.keys()),
+        "nb_lines": nb_lines,
+        "nb_blank_lines": nb_blank_lines
+    }
+
+def _decode_source(content: bytes) -> str:
+    """Decode the content as lizard does when it reads a file (lizard.auto_read)"""
+    encoding = "utf-8-sig" if content.startswith(codecs.BOM_UTF8) else None
+    try:
+        return io.TextIOWrapper(io.BytesIO(content), encoding=encoding).read()
+    except UnicodeDecodeError:
+        return content.decode("utf8", "ignore")
+
+def _count_lines(content: bytes) -> Tuple[int, int]:
+    nb_lines = 0
+    nb_blank_lines = 0
+    for line in io.TextIOWrapper(io.BytesIO(content), encoding="utf-8", errors="ignore"):
+        nb_lines += 1
+        if not line.strip():
+            nb_blank_lines += 1
+    return nb_lines, nb_blank_lines
+
 
 class FileAnalyzer:
     """Connector to Lizard
@@ -23,12 +84,16 @@ class FileAnalyzer:
      - token        Token for the GitHub API
      - repo         GitHub repository
      - project_id   Identifier of the project
+     - workers      Number of processes analyzing the files
+     - git_tree     Read the files from the git objects instead of the directory
     """
 
-    def __init__(self, directory, version, session):
+    def __init__(self, directory, version, session, workers=1, git_tree: GitTree = None):
         self.directory = directory
         self.session = session
         self.version = version
+        self.workers = workers
+        self.git_tree = git_tree
         self.__supported_languages = ["C","C++","Java","C#","JavaScript","TypeScript",
             "Objective-C","Swift","Python","Ruby","TTCN-3","PHP","Scala",
             "GDScript","Golang","Lua","Rust","Fortran","Kotlin"]
@@ -48,6 +113,14 @@ class FileAnalyzer:
         self.__nb_blank_lines_values = []
         self.__nb_comments_values = []
 
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Values of the analyzed files, by (blob hash, extension)
+        self.__new_cache_entries = {}
+        # Number of reuses, by lizard_cache_id or by (blob hash, extension) for new entries
+        self.__cache_hit_ids = {}
+        self.__new_cache_hits = {}
+
     def analyze_source_code(self):
         """
         Analyze the repository by using CK analysis tool
@@ -70,11 +143,10 @@ class FileAnalyzer:
         """
         Insert a new set of Lizard metrics into the database
         """
-        metric = Metric()
-        self.__get_metrics_values_from_source_code()
-        metric = self.__transform_values_into_metric(metric)
+        metric = self.compute_metric(Metric())
         metric.version_id = self.version.version_id
         self.session.add(metric)
+        FileAnalyzer.save_cache_updates(self.session, self.get_cache_updates())
         self.session.commit()
 
     @timeit
@@ -82,8 +154,7 @@ class FileAnalyzer:
         """
         Analyze a folder containing source files
         """
-        self.__get_metrics_values_from_source_code()
-        new_metric = self.__transform_values_into_metric(metric)
+        new_metric = self.compute_metric(metric)
         metric.lizard_total_nloc = new_metric.lizard_total_nloc
 
         metric.lizard_avg_nloc = new_metric.lizard_avg_nloc
@@ -111,77 +182,204 @@ class FileAnalyzer:
         metric.halstead_time = new_metric.halstead_time
         metric.halstead_bugs = new_metric.halstead_bugs
 
+        FileAnalyzer.save_cache_updates(self.session, self.get_cache_updates())
         self.session.commit()
 
-    def __get_metrics_values_from_source_code(self):
-        for filename in self.__get_supported_language_files():
-            
-            # lizard
-
-            file_analyze = self.__analyze_file(filename)
-            nb_lines, nb_blank_lines = self.__count_lines(filename)
+    def compute_metric(self, metric: Metric) -> Metric:
+        """
+        Return a copy of the metric completed with the Lizard values
+        Only reads the database, see get_cache_updates to save the new cache entries
+        """
+        self.__get_metrics_values_from_source_code()
+        return self.__transform_values_into_metric(metric)
 
-            nb_loc = file_analyze.nloc
-            self.__nb_loc_values.append(nb_loc)
+    def get_cache_updates(self) -> Dict:
+        """
+        Return the cache entries of the files analyzed by compute_metric
+        and the number of hits of the entries that were reused
+        """
+        new_entries = []
+        for (blob_hash, extension), values in self.__new_cache_entries.items():
+            entry = dict(values, blob_hash=blob_hash, extension=extension, tool_version=FileAnalyzer.get_tool_version(),
+                         hits=self.__new_cache_hits.get((blob_hash, extension), 0))
+            entry["operands"] = json.dumps(values["operands"])
+            entry["operators"] = json.dumps(values["operators"])
+            new_entries.append(entry)
+        return {"new_entries": new_entries, "hit_ids": dict(self.__cache_hit_ids)}
 
-            nb_token = file_analyze.token_count
-            self.__nb_tokens_values.append(nb_token)
+    @staticmethod
+    def save_cache_updates(session, cache_updates: Dict):
+        """
+        Insert the new entries of the Lizard cache and count the hits
+        The caller commits the session
+        """
+        new_entries = cache_updates["new_entries"]
+        hit_ids = dict(cache_updates["hit_ids"])
+        tool_version = FileAnalyzer.get_tool_version()
+
+        # Another process may have analyzed the same files in the meantime
+        existing = {}
+        for i in range(0, len(new_entries), CACHE_QUERY_SIZE):
+            blob_hashes = [entry["blob_hash"] for entry in new_entries[i:i + CACHE_QUERY_SIZE]]
+            rows = session.query(LizardCache.lizard_cache_id, LizardCache.blob_hash, LizardCache.extension) \
+                          .filter(LizardCache.tool_version == tool_version) \
+                          .filter(LizardCache.blob_hash.in_(blob_hashes)).all()
+            existing.update({(row.blob_hash, row.extension): row.lizard_cache_id for row in rows})
+        entries = []
+        for entry in new_entries:
+            cache_id = existing.get((entry["blob_hash"], entry["extension"]))
+            if cache_id is None:
+                entries.append(entry)
+            elif entry["hits"]:
+                hit_ids[cache_id] = hit_ids.get(cache_id, 0) + entry["hits"]
+        session.bulk_insert_mappings(LizardCache, entries)
+
+        # One update per distinct number of hits
+        ids_by_hits = {}
+        for cache_id, hits in hit_ids.items():
+            ids_by_hits.setdefault(hits, []).append(cache_id)
+        for hits, cache_ids in ids_by_hits.items():
+            for i in range(0, len(cache_ids), CACHE_QUERY_SIZE):
+                session.query(LizardCache) \
+                       .filter(LizardCache.lizard_cache_id.in_(cache_ids[i:i + CACHE_QUERY_SIZE])) \
+                       .update({LizardCache.hits: LizardCache.hits + hits}, synchronize_session=False)
 
-            nb_functions = len(file_analyze.function_list)
-            self.__nb_functions_values.append(nb_functions)
+    @staticmethod
+    def get_tool_version() -> str:
+        """Cache entries computed by another version of lizard or of LizardExtension aren't reused"""
+        return f"{lizard_version}-{LizardExtension.VERSION}"
 
-            total_complexity = sum((f.cyclomatic_complexity for f in file_analyze.function_list))
-            self.__total_complexities_values.append(total_complexity)
-            
-            average_complexity = file_analyze.average_cyclomatic_complexity
-            if average_complexity:
-                self.__average_complexities_values.append(average_complexity)
+    def __get_metrics_values_from_source_code(self):
+        keys = {}
+        if self.git_tree is None:
+            for filename in self.__get_supported_language_files():
+                with open(filename, "rb") as f:
+                    keys[filename] = (get_blob_hash(f.read()), pathlib.Path(filename).suffix)
+        else:
+            # git gives the blob hashes, only the files to analyze are read
+            for path, blob_hash in self.__get_supported_language_blobs():
+                keys[path] = (blob_hash, pathlib.Path(path).suffix)
+        filenames = list(keys)
+        cached_values = self.__load_cached_values(set(keys.values()))
+
+        # Identical files are only analyzed once
+        missing = {}
+        for filename in filenames:
+            key = keys[filename]
+            if key not in cached_values and key not in missing:
+                missing[key] = filename
+        analyzed_values = self.__analyze_files(list(missing.values()), [blob_hash for blob_hash, _ in missing])
+        for key, values in zip(missing, analyzed_values):
+            self.__new_cache_entries[key] = values
+        self.cache_misses = len(missing)
+
+        # The values are merged in the order of the files, as in a serial analysis
+        for filename in filenames:
+            key = keys[filename]
+            if key in self.__new_cache_entries:
+                values = self.__new_cache_entries[key]
+                if missing[key] != filename:
+                    self.cache_hits += 1
+                    self.__new_cache_hits[key] = self.__new_cache_hits.get(key, 0) + 1
+            else:
+                values = cached_values[key]
+                self.cache_hits += 1
+                cache_id = values["lizard_cache_id"]
+                self.__cache_hit_ids[cache_id] = self.__cache_hit_ids.get(cache_id, 0) + 1
+            self.__add_file_values(values)
+
+        logging.info(f"Lizard cache: {self.cache_hits} hit(s), {self.cache_misses} miss(es)")
+
+    def __load_cached_values(self, keys) -> Dict[Tuple[str, str], Dict]:
+        cached_values = {}
+        if self.session is None:
+            return cached_values
+        blob_hashes = sorted({blob_hash for blob_hash, _ in keys})
+        for i in range(0, len(blob_hashes), CACHE_QUERY_SIZE):
+            rows = self.session.query(LizardCache) \
+                               .filter(LizardCache.tool_version == FileAnalyzer.get_tool_version()) \
+                               .filter(LizardCache.blob_hash.in_(blob_hashes[i:i + CACHE_QUERY_SIZE])).all()
+            for row in rows:
+                if (row.blob_hash, row.extension) not in keys:
+                    continue
+                cached_values[(row.blob_hash, row.extension)] = {
+                    "lizard_cache_id": row.lizard_cache_id,
+                    "nloc": row.nloc,
+                    "token_count": row.token_count,
+                    "nb_functions": row.nb_functions,
+                    "total_complexity": row.total_complexity,
+                    "average_complexity": row.average_complexity,
+                    "nb_operands": row.nb_operands,
+                    "operands": json.loads(row.operands),
+                    "nb_operators": row.nb_operators,
+                    "operators": json.loads(row.operators),
+                    "nb_lines": row.nb_lines,
+                    "nb_blank_lines": row.nb_blank_lines
+                }
+        return cached_values
+
+    def __analyze_files(self, filenames: List[str], blob_hashes: List[str]) -> List[Dict]:
+        if self.git_tree is None:
+            analyze, args = _analyze_file_values, (filenames,)
+        else:
+            analyze, args = _analyze_source_values, (filenames, self.git_tree.read_blobs(blob_hashes))
+        if self.workers <= 1 or len(filenames) <= 1:
+            return list(map(analyze, *args))
+        workers = min(self.workers, len(filenames))
+        logging.info(f"Analyzing {len(filenames)} file(s) with {workers} Lizard processes")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map keeps the order of the files
+            chunksize = max(1, len(filenames) // (workers * 4))
+            return list(executor.map(analyze, *args, chunksize=chunksize))
+
+    def __add_file_values(self, values: Dict):
 
+        # lizard
 
-            # operators / operands
+        nb_loc = values["nloc"]
+        self.__nb_loc_values.append(nb_loc)
+        self.__nb_tokens_values.append(values["token_count"])
+        self.__nb_functions_values.append(values["nb_functions"])
+        self.__total_complexities_values.append(values["total_complexity"])
 
-            nb_operand = sum(file_analyze.wordCount.values())
-            self.__nb_operands_values.append(nb_operand)
-            unique_operands = set(file_analyze.wordCount.keys())
-            self.__unique_operands_values.update(unique_operands)
+        average_complexity = values["average_complexity"]
+        if average_complexity:
+            self.__average_complexities_values.append(average_complexity)
 
-            nb_operators = sum(file_analyze.operatorCount.values())
-            self.__nb_operators_values.append(nb_operators)
-            unique_operators = set(file_analyze.operatorCount.keys())
-            self.__unique_operators_values.update(unique_operators)
+        # operators / operands
 
-            # lines / comments
-            self.__nb_lines_values.append(nb_lines)
+        self.__nb_operands_values.append(values["nb_operands"])
+        self.__unique_operands_values.update(values["operands"])
+        self.__nb_operators_values.append(values["nb_operators"])
+        self.__unique_operators_values.update(values["operators"])
 
-            self.__nb_blank_lines_values.append(nb_blank_lines)
+        # lines / comments
 
-            nb_comments = nb_lines - nb_loc - nb_blank_lines
-            self.__nb_comments_values.append(nb_comments)
+        nb_lines = values["nb_lines"]
+        nb_blank_lines = values["nb_blank_lines"]
+        self.__nb_lines_values.append(nb_lines)
+        self.__nb_blank_lines_values.append(nb_blank_lines)
+        self.__nb_comments_values.append(nb_lines - nb_loc - nb_blank_lines)
 
     def __get_supported_language_files(self) -> Iterator[str]:
         # TODO: we should take into account the inclusion/exclusion env var
         for filename in glob.iglob(self.directory + '/**/**', recursive=True):
             # TODO: in  case of model seperation by language, we should make a 
             # switch according to the language
-            file_suffix = pathlib.Path(filename).suffix
-            file_language = guess_programing_language(file_suffix)
+            if not os.path.isfile(filename):
+                continue
+            file_language = guess_file_language(filename)
             if file_language in self.__supported_languages:
                 yield filename
 
-    def __analyze_file(self, filename: str):
-        extensions = lizard.get_extensions(["wordcount"]) + [LizardExtension()]
-        analyze_file = lizard.FileAnalyzer(extensions)
-        return analyze_file(filename)
-
-    def __count_lines(self, filename: str) -> Tuple[int, int]:
-        nb_lines = 0
-        nb_blank_lines = 0
-        with open(filename, encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                nb_lines += 1
-                if not line.strip():
-                    nb_blank_lines += 1
-        return nb_lines, nb_blank_lines
+    def __get_supported_language_blobs(self) -> Iterator[Tuple[str, str]]:
+        for path, blob_hash in self.git_tree.list_files():
+            # Hidden files and folders are skipped, as by the glob of the directory
+            if path.startswith(".") or "/." in path:
+                continue
+            file_language = guess_file_language(path)
+            if file_language in self.__supported_languages:
+                yield path, blob_hash
 
     def __transform_values_into_metric(self, metric: Metric) -> Metric:
         new_metric = copy.deepcopy(metric)
@@ -243,6 +441,8 @@ class FileAnalyzer:
 
 class LizardExtension(object):
 
+    # Increase when the counted values change, the cached values are computed again
+    VERSION = 1
     ignoreList = IGNORED_WORDS
 
     def __init__(self):
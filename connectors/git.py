@@ -2,8 +2,12 @@ from abc import ABC, abstractmethod
 import logging
 import datetime
 import json
+import multiprocessing
 
-from pydriller import Repository
+from concurrent.futures import ProcessPoolExecutor
+
+from pydriller import Git, Repository
+from sqlalchemy import or_
 
 from models.issue import Issue
 from models.version import Version
@@ -11,9 +15,28 @@ from models.commit import Commit
 from models.metric import Metric
 from models.author import Author
 from models.alias import Alias
+from models.pipelineprogress import PipelineProgress
 from utils.timeit import timeit
+from utils.gitlog import iter_commits_numstat
+from utils.database import upsert_rows
 from metrics.versions import compute_version_metrics
 
+# Columns refreshed when a commit is inserted again, the DMM metrics are kept
+COMMIT_UPSERT_COLUMNS = ["committer", "date", "message", "insertions", "deletions", "lines", "files"]
+
+# pydriller repository opened once per DMM worker process
+_dmm_git = None
+
+def _init_dmm_worker(directory, lock):
+    global _dmm_git
+    # pydriller writes into .git/config when opening the repository
+    with lock:
+        _dmm_git = Git(directory)
+
+def _get_commit_dmm(commit_hash):
+    commit = _dmm_git.get_commit(commit_hash)
+    return commit.dmm_unit_size, commit.dmm_unit_complexity, commit.dmm_unit_interfacing
+
 class GitConnector(ABC):
     """Connector to Github
     
@@ -65,41 +88,77 @@ class GitConnector(ABC):
         """
         Create commits into the database from GitHub commits
         Commits are not linked to version
+        The history is streamed from a single git log process, DMM metrics are
+        computed afterwards if enabled (see compute_commits_dmm)
         """
         logging.info('create_commits_from_repo')
 
         # Check what was the las inserted commit
         last_commit = self.session.query(Commit).filter(Commit.project_id == self.project_id).order_by(Commit.date.desc()).first()
         if last_commit is not None:
-            last_synced = last_commit.date + datetime.timedelta(seconds=1)
+            # Dates are stored without timezone, the last day is fetched again
+            # and the commits already in the database are upserted
+            last_synced = last_commit.date - datetime.timedelta(days=1)
             logging.info('Update existing database by fetching new commits since ' + str(last_synced))
-            git_commits = Repository(self.directory, since=last_synced, only_no_merge=True).traverse_commits()
         else:
+            last_synced = None
             logging.info('Create a database with all commits')
-            git_commits = Repository(self.directory, only_no_merge=True).traverse_commits()
+
+        git_commits = iter_commits_numstat(self.configuration.scm_path, self.directory, since=last_synced)
 
         commits = []
+        nb_commits = 0
         for git_commit in git_commits:
-            if git_commit.committer.name not in self.configuration.exclude_authors:
-                commits.append(
-                    Commit(
-                        project_id=self.project_id,
-                        hash=git_commit.hash,
-                        committer=git_commit.committer.name,
-                        date=git_commit.committer_date,
-                        message=git_commit.msg,
-                        insertions=git_commit.insertions,
-                        deletions=git_commit.deletions,
-                        lines=git_commit.lines,
-                        files=git_commit.files,
-                        dmm_unit_size=git_commit.dmm_unit_size,
-                        dmm_unit_complexity=git_commit.dmm_unit_complexity,
-                        dmm_unit_interfacing=git_commit.dmm_unit_interfacing
-                    )
-                )
-            
-        self.session.add_all(commits)
+            if git_commit["committer"] not in self.configuration.exclude_authors:
+                git_commit["project_id"] = self.project_id
+                commits.append(git_commit)
+            if len(commits) >= self.configuration.batch_size:
+                upsert_rows(self.session, Commit.__table__, commits, ["project_id", "hash"], COMMIT_UPSERT_COLUMNS)
+                nb_commits += len(commits)
+                commits = []
+
+        upsert_rows(self.session, Commit.__table__, commits, ["project_id", "hash"], COMMIT_UPSERT_COLUMNS)
+        nb_commits += len(commits)
+        self.session.commit()
+        logging.info(f"{nb_commits} commit(s) added or updated in the database")
+
+        if self.configuration.compute_dmm:
+            self.compute_commits_dmm()
+
+    @timeit
+    def compute_commits_dmm(self):
+        """
+        Compute the DMM metrics of the commits that don't have them yet
+        The computed commits are flagged, pydriller returns None for some of them
+        This is costly (a diff per commit), so the commits are dispatched
+        to a pool of processes
+        """
+        logging.info('compute_commits_dmm')
+        commits = self.session.query(Commit.commit_id, Commit.hash) \
+                              .filter(Commit.project_id == self.project_id) \
+                              .filter(Commit.dmm_unit_size.is_(None)) \
+                              .filter(or_(Commit.dmm_computed.is_(None), Commit.dmm_computed.is_(False))).all()
+        hashes = [commit.hash for commit in commits]
+        ids = [commit.commit_id for commit in commits]
+
+        with ProcessPoolExecutor(max_workers=self.configuration.workers,
+                                 initializer=_init_dmm_worker,
+                                 initargs=(self.directory, multiprocessing.Lock())) as executor:
+            dmm_values = executor.map(_get_commit_dmm, hashes, chunksize=64)
+            mappings = [
+                {
+                    "commit_id": commit_id,
+                    "dmm_unit_size": dmm_unit_size,
+                    "dmm_unit_complexity": dmm_unit_complexity,
+                    "dmm_unit_interfacing": dmm_unit_interfacing,
+                    "dmm_computed": True
+                }
+                for commit_id, (dmm_unit_size, dmm_unit_complexity, dmm_unit_interfacing) in zip(ids, dmm_values)
+            ]
+
+        self.session.bulk_update_mappings(Commit, mappings)
         self.session.commit()
+        logging.info(f"DMM metrics computed for {len(mappings)} commit(s)")
 
     def compute_version_metrics(self):
         """Compute version related metics:
@@ -108,7 +167,7 @@ class GitConnector(ABC):
         - Bug velocity
         - Average seniorship of the team
         """
-        compute_version_metrics(self.session, self.directory, self.project_id)
+        compute_version_metrics(self.session, self.directory, self.project_id, self.configuration.scm_path)
             
     def clean_next_release_metrics(self):
         """
@@ -120,6 +179,9 @@ class GitConnector(ABC):
             logging.info("No Metrics to clean up")
         else:
             self.session.query(Metric).filter(Metric.version_id == next_release.version_id).delete()
+            # Without their progress, the stages of populate are done again
+            self.session.query(PipelineProgress) \
+                        .filter(PipelineProgress.version_id == next_release.version_id).delete()
             self.session.commit()
             logging.info("Deleted Metrics associated with version " + next_release.name)
 
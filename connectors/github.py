@@ -2,7 +2,7 @@ import logging
 from time import sleep, time
 import github
 
-from sqlalchemy import desc, update
+from sqlalchemy import desc
 
 import models
 from models.issue import Issue
@@ -10,8 +10,14 @@ from models.version import Version
 from github import Github
 import datetime
 from connectors.git import GitConnector
+from utils.date import date_iso_8601_utc_to_datetime
+from utils.database import save_issues
+from utils.restclient import RestClient
 from utils.timeit import timeit
 
+GITHUB_API_URL = "https://api.github.com"
+ISSUES_PER_PAGE = 100
+
 class GitHubConnector(GitConnector):
     """
     Connector to Github
@@ -21,19 +27,27 @@ class GitHubConnector(GitConnector):
         GitConnector.__init__(self, project_id, directory, token, repo, current, session, config)
         self.api = Github(self.token)
         self.remote = self.api.get_repo(self.repo)
+        headers = {"Accept": "application/vnd.github+json"}
+        if self.token:
+            headers["Authorization"] = "token " + self.token
+        self.client = RestClient(GITHUB_API_URL, headers, workers=config.workers,
+                                 retry_delay=config.retry_delay)
 
     def _get_issues(self, since=None, labels=None):
-        if not since:
-            since = github.GithubObject.NotSet
-        if not labels:
-            labels = github.GithubObject.NotSet
+        """
+        Stream the issues from the REST API
+        Sorted by ascending creation date, an issue updated during the sync keeps
+        its page and doesn't shift the next ones (they are fetched concurrently),
+        the pages of the issues that didn't change keep their ETag and are
+        answered by 304 Not Modified
+        """
+        params = {"state": "all", "sort": "created", "direction": "asc", "per_page": ISSUES_PER_PAGE}
+        if since:
+            params["since"] = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+        if labels:
+            params["labels"] = ",".join(labels)
+        return self.client.get_pages(f"/repos/{self.repo}/issues", params)
 
-        try:
-            return self.remote.get_issues(state="all", since=since, labels=labels)
-        except github.GithubException.RateLimitExceededException:
-            sleep(self.configuration.retry_delay)
-            self._get_issues(since, labels)
-    
     def _get_releases(self, all=None, order_by=None, sort=None):
         if not all:
             all = None
@@ -52,6 +66,7 @@ class GitHubConnector(GitConnector):
     def create_issues(self):
         """
         Create issues into the database from GitHub Issues
+        The pages are fetched concurrently and saved in bulk, see RestClient
         """
         logging.info('GitHubConnector: create_issues')
 
@@ -60,54 +75,30 @@ class GitHubConnector(GitConnector):
                          .filter(Issue.project_id == self.project_id) \
                          .filter(Issue.source == 'git') \
                          .order_by(desc(models.issue.Issue.updated_at)).first()
+        since = None
         if last_issue is not None:
             # Update existing database by fetching new issues
-            if not self.configuration.issue_tags:
-                git_issues = self._get_issues(since=last_issue.updated_at + datetime.timedelta(seconds=1))
-            else:
-                git_issues = self._get_issues(since=last_issue.updated_at + datetime.timedelta(seconds=1),
-                                            labels=self.configuration.issue_tags)  # e.g. Filter by labels=['bug']
-        else:
-            # Create a database with all issues
-            if not self.configuration.issue_tags:
-                git_issues = self._get_issues()
-            else:
-                git_issues = self._get_issues(labels=self.configuration.issue_tags)  # e.g. Filter by labels=['bug']
-
-        # versions = self.session.query(Version).all()
-        logging.info('Syncing ' + str(git_issues.totalCount) + ' issue(s) from GitHub')
+            since = last_issue.updated_at + datetime.timedelta(seconds=1)
+        # e.g. Filter by labels=['bug']
+        git_issues = self._get_issues(since=since, labels=self.configuration.issue_tags)
 
-        new_bugs = []
-        # for version in versions:
-        for issue in git_issues:
-            # Check if the issue is linked to a selected version (included or not excluded)
-            # if version.end_date > issue.created_at > version.start_date:
-            if issue.user.login not in self.configuration.exclude_issuers:
-                
-                existing_issue_id = self._get_existing_issue_id(issue.number)
-                
-                if existing_issue_id:
-                    logging.info("Issue %s already exists, updating it", existing_issue_id)
-                    self.session.execute(
-                        update(Issue).where(Issue.issue_id == existing_issue_id) \
-                                     .values(title=issue.title, updated_at=issue.updated_at)
-                    )
-                else:
-                    new_bugs.append(
-                        Issue(
-                            project_id=self.project_id,
-                            title=issue.title,
-                            number=issue.number,
-                            source="git",
-                            created_at=issue.created_at,
-                            updated_at=issue.updated_at
-                        )
-                    )
-        
-        # Remove potential duplicated values
-        # list(dict.fromkeys(bugs))
-        self.session.add_all(new_bugs)
+        self.client.load_cache(self.session, f"/repos/{self.repo}/issues")
+        issues = (
+            {
+                "number": issue["number"],
+                "title": issue["title"],
+                "created_at": date_iso_8601_utc_to_datetime(issue["created_at"]),
+                "updated_at": date_iso_8601_utc_to_datetime(issue["updated_at"])
+            }
+            for issue in git_issues
+            if issue["user"]["login"] not in self.configuration.exclude_issuers
+        )
+        nb_new, nb_updated = save_issues(self.session, self.project_id, "git", issues,
+                                         self.configuration.batch_size)
+        self.client.save_cache(self.session, self.configuration.batch_size)
         self.session.commit()
+        logging.info(f"Synced {nb_new} new and {nb_updated} updated issue(s) from GitHub, "
+                     f"{self.client.nb_requests} request(s), {self.client.nb_not_modified} not modified")
 
     @timeit
     def create_versions(self):
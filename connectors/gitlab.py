@@ -1,73 +1,79 @@
 import logging
-from time import sleep
-import gitlab
+import urllib.error
+import urllib.parse
 
-from sqlalchemy import desc, update
+from sqlalchemy import desc
 
 from models.issue import Issue
 from models.version import Version
+from utils.database import save_issues
 from utils.date import date_iso_8601_to_datetime
+from utils.restclient import RestClient
 from utils.timeit import timeit
 from connectors.git import GitConnector
-from gitlab import Gitlab
 from datetime import datetime, timedelta
 
+GITLAB_URL = "https://gitlab.com"
+PER_PAGE = 100
+
 class GitLabConnector(GitConnector):
     """
     Connector to GitLab
 
+    The issues and releases are streamed from the REST API (v4) following the
+    next links of the pages (keyset pagination) and saved in bulk
+
     Attributes:
     -----------
      - base_url     URL to GitLab, empty if gitlab.com
     """
     def __init__(self, project_id, directory, base_url, token, repo, current, session, config):
         GitConnector.__init__(self, project_id, directory, token, repo, current, session, config)
-        if not base_url and not self.token:
-            logging.info("anonymous read-only access for public resources (GitLab.com)")
-            self.api = Gitlab()
-        if base_url and self.token:
-            logging.info("private token or personal token authentication (self-hosted GitLab instance)")
-            self.api = Gitlab(url=base_url, private_token=self.token)
-        if not base_url and self.token:
-            logging.info("private token or personal token authentication (GitLab.com)")
-            self.api = Gitlab(private_token=self.token)
-        
-        # Check the authentification. Doesn't work for public read only access
-        if base_url or self.token:
-            self.api.auth()
-
-        self.remote = self.api.projects.get(self.repo)
+        headers = {}
+        if self.token:
+            logging.info("private token or personal token authentication")
+            headers["PRIVATE-TOKEN"] = self.token
+        else:
+            logging.info("anonymous read-only access for public resources")
+        self.client = RestClient((base_url or GITLAB_URL).rstrip("/") + "/api/v4", headers,
+                                 workers=config.workers, retry_delay=config.retry_delay)
+        self.project_path = "/projects/" + urllib.parse.quote(self.repo, safe="")
 
     def _get_issues(self, since=None, labels=None):
-        if not since:
-            since = None
-        if not labels:
-            labels = None
+        params = {"scope": "all", "state": "all", "order_by": "updated_at", "sort": "asc", "per_page": PER_PAGE}
+        if since:
+            params["updated_after"] = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+        if labels:
+            params["labels"] = ",".join(labels)
 
         try:
-            return self.remote.issues.list(state="all", since=since, with_labels_details=labels, get_all=True)
-        except gitlab.GitlabJobRetryError:
-            sleep(self.configuration.retry_delay)
-            self._get_issues(since, labels)
-    
-    def _get_releases(self, all, order_by, sort):
-        if not all:
-            all = None
-        if not order_by:
-            order_by = None
-        if not sort:
-            sort = None
-            
-        try:
-            return self.remote.releases.list(all=all, order_by=order_by,sort=sort)
-        except gitlab.GitlabJobRetryError:
-            sleep(self.configuration.retry_delay)
-            self._get_releases(all, order_by, sort)
-        
+            # Read the first page to fall back on offset pagination if keyset isn't supported
+            issues = self.client.get_pages(self.project_path + "/issues", dict(params, pagination="keyset"))
+            first_issue = next(issues, None)
+        except urllib.error.HTTPError as error:
+            if error.code not in (400, 405):
+                raise
+            logging.info("Keyset pagination not supported for the issues, using offset pagination")
+            # The pages are fetched concurrently, sorted by creation an updated issue doesn't shift them
+            issues = self.client.get_pages(self.project_path + "/issues", dict(params, order_by="created_at"))
+            first_issue = next(issues, None)
+        if first_issue is not None:
+            yield first_issue
+            yield from issues
+
+    def _get_releases(self, all=None, order_by=None, sort=None):
+        params = {"per_page": PER_PAGE}
+        if order_by:
+            params["order_by"] = order_by
+        if sort:
+            params["sort"] = sort
+        return self.client.get_pages(self.project_path + "/releases", params)
+
     @timeit
     def create_issues(self):
         """
         Create issues into the database from GitLab Issues
+        Only the issues updated since the last sync are fetched
         """
         logging.info('GitLabConnector: create_issues')
 
@@ -76,54 +82,28 @@ class GitLabConnector(GitConnector):
                          .filter(Issue.project_id == self.project_id) \
                          .filter(Issue.source == 'git') \
                          .order_by(desc(Issue.updated_at)).first()
+        since = None
         if last_issue is not None:
             # Update existing database by fetching new issues
-            if not self.configuration.issue_tags:
-                git_issues = self._get_issues(since=last_issue.updated_at + timedelta(seconds=1), labels=None)
-            else:
-                git_issues = self._get_issues(since=last_issue.updated_at + timedelta(seconds=1),
-                                                    labels=self.configuration.issue_tags)  # e.g. Filter by labels=['bug']
-        else:
-            # Create a database with all issues
-            if not self.configuration.issue_tags:
-                git_issues = self._get_issues(since=None, labels=None)
-            else:
-                git_issues = self._get_issues(labels=self.configuration.issue_tags)    # e.g. Filter by labels=['bug']
-        
-        # versions = self.session.query(Version).all
-        logging.info('Syncing ' + str(len(git_issues)) + ' issue(s) from GitLab')
-
-        new_bugs = []
-        # for version in versions:
-        for issue in git_issues:
-            # Check if the issue is linked to a selected version (included or not +IN?.§ .?NBVCXd)
-            # if version.end_date > issue.created_at > version.start_date:
-            if issue.author['username'] not in self.configuration.exclude_issuers:
-                
-                updated_issue_date = date_iso_8601_to_datetime(issue.updated_at)
-                existing_issue_id = self._get_existing_issue_id(issue.iid)
-
-                if existing_issue_id:
-                    logging.info("Issue %s already exists, updating it", existing_issue_id)
-                    self.session.execute(
-                        update(Issue).where(Issue.issue_id == existing_issue_id) \
-                                     .values(title=issue.title, updated_at=updated_issue_date)
-                    )
-                else:
-                    new_bugs.append(
-                        Issue(
-                            project_id=self.project_id,
-                            title=issue.title,
-                            number=issue.iid,
-                            source="git",
-                            created_at=date_iso_8601_to_datetime(issue.created_at),
-                            updated_at=updated_issue_date,
-                        )
-                    )
-
-        self.session.add_all(new_bugs)
+            since = last_issue.updated_at + timedelta(seconds=1)
+        # e.g. Filter by labels=['bug']
+        git_issues = self._get_issues(since=since, labels=self.configuration.issue_tags)
+
+        issues = (
+            {
+                "number": issue["iid"],
+                "title": issue["title"],
+                "created_at": date_iso_8601_to_datetime(issue["created_at"]),
+                "updated_at": date_iso_8601_to_datetime(issue["updated_at"])
+            }
+            for issue in git_issues
+            if issue["author"]["username"] not in self.configuration.exclude_issuers
+        )
+        nb_new, nb_updated = save_issues(self.session, self.project_id, "git", issues,
+                                         self.configuration.batch_size)
         self.session.commit()
-    
+        logging.info(f"Synced {nb_new} new and {nb_updated} updated issue(s) from GitLab")
+
     @timeit
     def create_versions(self):
         """
@@ -137,12 +117,12 @@ class GitLabConnector(GitConnector):
         previous_release_published_at = self._get_first_commit_date()
 
         for release in releases:
-            release_published_at = date_iso_8601_to_datetime(release.released_at)
+            release_published_at = date_iso_8601_to_datetime(release["released_at"])
             versions.append(
                 Version(
                     project_id=self.project_id,
-                    name=release.name,
-                    tag=release.tag_name,
+                    name=release["name"],
+                    tag=release["tag_name"],
                     start_date=previous_release_published_at,
                     end_date=release_published_at,
                 )
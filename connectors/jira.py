@@ -1,65 +1,86 @@
+import base64
 import logging
-import requests
-from typing import List
-from datetime import timedelta, datetime
+from datetime import datetime
 
-from jira import JIRA
-from sqlalchemy import desc, update
+from sqlalchemy import desc
 
 from models.issue import Issue
+from utils.database import save_issues
 from utils.date import date_iso_8601_to_datetime, datetime_to_date_hours_minuts
+from utils.restclient import RestClient
 from utils.timeit import timeit
 
-requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
+# Only the fields used by the tool are requested
+JIRA_FIELDS = ["summary", "created", "updated", "reporter"]
+# Maximum number of issues by page, the server may allow less
+JIRA_MAX_RESULTS = 100
 
 class JiraConnector:
-    
+
     def __init__(self, project_id, session, config) -> None:
         self.config = config
         self.session = session
         self.project_id = project_id
-        self.__client = JIRA(
-                                server=self.config.jira_base_url,
-                                basic_auth=(self.config.jira_email, self.config.jira_token))
+        headers = {}
+        if self.config.jira_email or self.config.jira_token:
+            credentials = f"{self.config.jira_email}:{self.config.jira_token}".encode()
+            headers["Authorization"] = "Basic " + base64.b64encode(credentials).decode()
+        self.__client = RestClient(self.config.jira_base_url, headers, workers=self.config.workers,
+                                   retry_delay=self.config.retry_delay)
 
     @timeit
     def create_issues(self):
         """
         Create issues into the database from Jira Issues
+        The search results are streamed page by page and saved in bulk
         """
         logging.info('JiraConnector: create_issues')
 
         last_issue_date = self.__get_last_sinced_date()
 
         jira_issues = self._get_issues(updated_after=last_issue_date)
-        
-        logging.info('Syncing ' + str(len(jira_issues)) + ' issue(s) from Jira')
 
-        self.__save_issues(jira_issues)
+        issues = (
+            {
+                "number": issue["key"],
+                "title": issue["fields"]["summary"],
+                "created_at": date_iso_8601_to_datetime(issue["fields"]["created"]),
+                "updated_at": date_iso_8601_to_datetime(issue["fields"]["updated"])
+                              if issue["fields"].get("updated") else None
+            }
+            for issue in jira_issues
+            if self.__get_reporter(issue) not in self.config.exclude_issuers
+        )
+        nb_new, nb_updated = save_issues(self.session, self.project_id, "jira", issues, self.config.batch_size)
+        self.session.commit()
+        logging.info(f"Synced {nb_new} new and {nb_updated} updated issue(s) from Jira")
 
     def __get_last_sinced_date(self) -> datetime:
 
         last_issue_date = None
 
         last_issue = self.session.query(Issue) \
-                         .filter(Issue.project_id == self.project_id and Issue.source == 'jira') \
+                         .filter(Issue.project_id == self.project_id) \
+                         .filter(Issue.source == 'jira') \
                          .order_by(desc(Issue.updated_at)).first()
 
         if last_issue:
             last_issue_date = last_issue.updated_at
-        
+
         logging.info("Last issue date from database is : %s", last_issue_date)
 
         return last_issue_date
 
     def _get_issues(self, updated_after: datetime = None):
+        """Stream the issues of all the pages of the JQL search"""
 
         jql_query = self.__get_builded_jql_query(updated_after)
 
         logging.info("Performing JQL query to get Jira issues : %s", jql_query)
 
-        return self.__client.search_issues(jql_query)
-    
+        params = {"jql": jql_query, "fields": ",".join(JIRA_FIELDS), "maxResults": JIRA_MAX_RESULTS}
+        return self.__client.get_offset_pages("/rest/api/2/search", params, "issues")
+
     def __get_builded_jql_query(self, updated_after: datetime) -> str:
 
         jql_query = f'project={self.config.jira_project}'
@@ -76,54 +97,13 @@ class JiraConnector:
             updated_after_formated = datetime_to_date_hours_minuts(updated_after)
             jql_query += f' AND updatedDate >= "{updated_after_formated}"'
 
-        return jql_query
+        # The pages are read concurrently by offset: sorted by creation, an issue
+        # updated during the sync keeps its place and doesn't shift the next pages
+        jql_query += ' ORDER BY created ASC, key ASC'
 
-    def __save_issues(self, jira_issues) -> None:
-        new_ottm_issues = []
-
-        for issue in jira_issues:
-
-            if issue.fields.reporter not in self.config.exclude_issuers:
-                
-                updated_issue_date = None
-                if hasattr(issue.fields, "updated"):
-                        updated_issue_date = date_iso_8601_to_datetime(issue.fields.updated)
-                
-                existing_issue_id = self.__get_existing_issue_id(issue.key)
-                
-                if existing_issue_id:
-                    logging.info("Issue %s already exists, updating it", existing_issue_id)
-                    self.session.execute(
-                        update(Issue).where(Issue.issue_id == existing_issue_id) \
-                                     .values(title=issue.fields.summary, updated_at=updated_issue_date)
-                    )
-                else:
-                    ottm_issue = Issue(
-                        project_id=self.project_id,
-                        number=issue.key,
-                        title=issue.fields.summary,
-                        source="jira",
-                        created_at=date_iso_8601_to_datetime(issue.fields.created),
-                        updated_at=updated_issue_date,
-                    )
-                    new_ottm_issues.append(
-                        ottm_issue
-                    )
-
-        self.session.add_all(new_ottm_issues)
-        self.session.commit()
+        return jql_query
 
-    def __get_existing_issue_id(self, issue_number) -> int:
-        
-        existing_issue_id = None
-        
-        existing_issue = self.session.query(Issue) \
-                    .filter(Issue.project_id == self.project_id) \
-                    .filter(Issue.number == issue_number) \
-                    .filter(Issue.source == "jira") \
-                    .first() 
-        
-        if existing_issue: 
-            existing_issue_id = existing_issue.issue_id
-
-        return existing_issue_id
+    @staticmethod
+    def __get_reporter(issue) -> str:
+        reporter = issue["fields"].get("reporter")
+        return reporter.get("displayName") if reporter else None
@@ -1,28 +1,50 @@
-import copy
 import datetime
 import logging
+import os
+import subprocess
 from typing import Dict, List
 
-import pydriller
+from sqlalchemy import and_
 
-from models.file import File
 from models.commit import Commit
+from models.fileage import FileAge
+from models.fileagecheckpoint import FileAgeCheckpoint
+from models.filemodification import FileModification
 from models.legacy import Legacy
 from models.metric import Metric
 from models.version import Version
-from utils.database import save_file_if_not_found
+from utils.database import save_files_if_not_found, upsert_rows
+from utils.gitlog import iter_commits_name_status
+from utils.timeit import timeit
 
 class LegacyConnector:
-
-    def __init__(self, project_id, directory, version, session, config):
+    """
+    Find the legacy files modified by the commits of a version, i.e. the
+    files whose previous modification is older than OTTM_LEGACY_PERCENT
+    of the project age
+
+    The age of the files is indexed into the database from git log
+    --name-status, once for the whole history then incrementally.
+
+    Attributes:
+    -----------
+     - project_id   Identifier of the project
+     - directory    Folder where the project is cloned
+     - version      Version to analyze
+     - session      Database connection managed by sqlachemy
+     - config       Configuration
+    """
+
+    def __init__(self, project_id, directory, version, session, config, first_commit_date=None):
         self.session = session
         self.version = version
         self.project_id = project_id
+        self.directory = directory
         self.configuration = config
 
-        self.pydriler_git_repo = pydriller.Git(directory)
-        self.files_last_modification = {}
-        self.first_commit_date = self.__get_first_commit_date()
+        if first_commit_date is None:
+            first_commit_date = self.__get_first_commit_date()
+        self.first_commit_date = first_commit_date
 
     def __get_first_commit_date(self):
         project_first_commit: Commit = self.session.query(Commit) \
@@ -32,43 +54,137 @@ class LegacyConnector:
         return project_first_commit.date
 
     def get_legacy_files(self, version: Version):
-        metric = self.session.query(Metric).filter(Metric.version_id == self.version.version_id).first()
-        if metric and metric.nb_legacy_files:
-            logging.info('Legacy analysis already done for this version')
-        else:
-            
-            logging.info("Getting modified legacy files for version %s", version.name)
-            modified_legacy_files = {}
-
-            commits: List[Commit] = self.session.query(Commit).filter(Commit.project_id == self.project_id) \
-                                            .filter(Commit.date >= version.start_date) \
-                                            .filter(Commit.date <= version.end_date) \
-                                            .order_by(Commit.date.asc()).all()
-
-            for commit in commits:
-                logging.debug("Commit %s", commit.hash)
-
-                legacy_time_delta = self.__legacy_time_delta(commit.date)
-
-                commit_details = self.pydriler_git_repo.get_commit(commit.hash)
-                new_modified_legacy_files_for_commit = self.get_modified_legacy_files_for_commit(
-                    self.files_last_modification, commit_details, legacy_time_delta
-                )
-                modified_legacy_files = self.get_new_modified_legacy_files_for_version(
-                    modified_legacy_files, new_modified_legacy_files_for_commit
-                )
-                self.files_last_modification = self.get_new_files_last_modification_for_commit(
-                    self.files_last_modification, commit_details
-                )
-
-            logging.info(f"Version {version.name} : {len(modified_legacy_files)} legacy files modified")
-            
-            self.__save_legacy_files(modified_legacy_files, version.version_id)
-            self.__save_metric(modified_legacy_files, version.version_id)
+        """
+        Find and save the legacy files of the version with their number, in a single commit
+        The progress of populate (pipeline_progress) tells whether it was already done
+        """
+        self.update_file_age_index()
+        modified_legacy_files = self.compute_modified_legacy_files(version)
+
+        self.save_legacy_files(self.session, modified_legacy_files, version.version_id,
+                               self.configuration.batch_size)
+        self.__save_metric(modified_legacy_files, version.version_id)
+
+    @timeit
+    def update_file_age_index(self):
+        """
+        Walk the commits added since the last update and save the age of the
+        files (file_age) and the modifications of existing files (file_modification)
+        """
+        scm_path = self.configuration.scm_path
+        rev = self.configuration.current_branch
+        checkpoint = self.session.query(FileAgeCheckpoint) \
+                                 .filter(FileAgeCheckpoint.project_id == self.project_id).first()
+        if not checkpoint:
+            checkpoint = FileAgeCheckpoint(project_id=self.project_id)
+        elif not self.__is_ancestor(checkpoint.commit_hash, rev):
+            logging.info("Commit " + checkpoint.commit_hash + " is not in the history anymore, indexing the whole history")
+            self.session.query(FileAge).filter(FileAge.project_id == self.project_id).delete()
+            self.session.query(FileModification).filter(FileModification.project_id == self.project_id).delete()
+            checkpoint.commit_hash = None
+
+        head = subprocess.run([scm_path, "rev-parse", rev], cwd=self.directory,
+                              stdout=subprocess.PIPE, text=True, check=True).stdout.strip()
+        if checkpoint.commit_hash == head:
+            logging.info("File age index is up to date")
+            return
+        walked_rev = f"{checkpoint.commit_hash}..{head}" if checkpoint.commit_hash else head
+
+        ages = {path: last_modification for path, last_modification in
+                self.session.query(FileAge.path, FileAge.last_modification)
+                            .filter(FileAge.project_id == self.project_id)}
+        changed_paths = set()
+        removed_paths = set()
+        modifications = []
+        nb_modifications = 0
+        for git_commit in iter_commits_name_status(scm_path, self.directory, walked_rev):
+            # The commits of the excluded authors are not in the database
+            if git_commit["committer"] in self.configuration.exclude_authors:
+                continue
+            date = git_commit["date"].astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            for old_path, new_path in git_commit["modified_files"]:
+                if old_path is not None and new_path is not None and old_path in ages:
+                    modifications.append({
+                        "project_id": self.project_id,
+                        "commit_hash": git_commit["hash"],
+                        "old_path": old_path,
+                        "new_path": new_path,
+                        "date": date,
+                        "previous_date": ages[old_path]
+                    })
+                if old_path is not None:
+                    ages.pop(old_path, None)
+                    removed_paths.add(old_path)
+                    changed_paths.discard(old_path)
+                if new_path is not None:
+                    ages[new_path] = date
+                    changed_paths.add(new_path)
+                    removed_paths.discard(new_path)
+            if len(modifications) >= self.configuration.batch_size:
+                self.session.bulk_insert_mappings(FileModification, modifications)
+                nb_modifications += len(modifications)
+                modifications = []
+        self.session.bulk_insert_mappings(FileModification, modifications)
+        nb_modifications += len(modifications)
+
+        # Update the ages in place
+        removed_paths = list(removed_paths)
+        for i in range(0, len(removed_paths), self.configuration.batch_size):
+            self.session.query(FileAge).filter(FileAge.project_id == self.project_id) \
+                        .filter(FileAge.path.in_(removed_paths[i:i + self.configuration.batch_size])) \
+                        .delete(synchronize_session=False)
+        rows = [{"project_id": self.project_id, "path": path, "last_modification": ages[path]}
+                for path in changed_paths]
+        for i in range(0, len(rows), self.configuration.batch_size):
+            upsert_rows(self.session, FileAge.__table__, rows[i:i + self.configuration.batch_size],
+                        ["project_id", "path"], ["last_modification"])
+
+        checkpoint.commit_hash = head
+        self.session.add(checkpoint)
+        self.session.commit()
+        logging.info(f"File age index: {nb_modifications} modification(s) added, {len(ages)} file(s)")
+
+    def __is_ancestor(self, commit_hash: str, rev: str) -> bool:
+        process = subprocess.run([self.configuration.scm_path, "merge-base", "--is-ancestor", commit_hash, rev],
+                                 cwd=self.directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return process.returncode == 0
+
+    def compute_modified_legacy_files(self, version: Version) -> Dict[str, Dict[str, str]]:
+        """
+        Find the legacy files modified by the commits of a version
+        A single query on the file age index, see update_file_age_index
+        """
+        logging.info("Getting modified legacy files for version %s", version.name)
+        modifications = self.session.query(FileModification.old_path, FileModification.new_path,
+                                           FileModification.date, FileModification.previous_date,
+                                           Commit.date.label("commit_date")) \
+                                    .join(Commit, and_(Commit.project_id == FileModification.project_id,
+                                                       Commit.hash == FileModification.commit_hash)) \
+                                    .filter(FileModification.project_id == self.project_id) \
+                                    .filter(Commit.date >= version.start_date) \
+                                    .filter(Commit.date <= version.end_date) \
+                                    .order_by(Commit.date.asc(), FileModification.file_modification_id.asc()) \
+                                    .all()
+
+        modified_legacy_files = {}
+        for modification in modifications:
+            legacy_time_delta = self.__legacy_time_delta(modification.commit_date)
+            if modification.date - modification.previous_date < legacy_time_delta:
+                continue
+            # Follow the renames of the legacy files during the version
+            modified_legacy_files.pop(modification.old_path, None)
+            modified_legacy_files[modification.new_path] = {
+                "old_path": modification.old_path,
+                "new_path": modification.new_path,
+                "filename": os.path.basename(modification.new_path),
+            }
+
+        logging.info(f"Version {version.name} : {len(modified_legacy_files)} legacy files modified")
+        return modified_legacy_files
 
     def __legacy_time_delta(self, current_commit_date):
         delta_since_first_commit = current_commit_date - self.first_commit_date
-        
+
         # We consider as legacy something that was modified in the first x% days of the project
         x = self.configuration.legacy_percent
         legacy = round(((delta_since_first_commit.days / 100) * x), 1)
@@ -76,80 +192,21 @@ class LegacyConnector:
         return delta_since_first_commit - legacy_time_delta
 
     @staticmethod
-    def get_modified_legacy_files_for_commit(files_last_modification: Dict[str, datetime.datetime], 
-                                            commit_details: pydriller.Commit, 
-                                            legacy_time_delta: datetime.timedelta) -> List[Dict[str, str]]:
-
-        modified_legacy_files = []
-
-        for modified_file in commit_details.modified_files:
-
-            if modified_file.old_path is None or modified_file.old_path not in files_last_modification:
-                continue
-
-            last_modification_date = files_last_modification[modified_file.old_path]
-
-            if commit_details.committer_date - last_modification_date < legacy_time_delta:
-                continue
+    def save_legacy_files(session, legacy_files: List[str], version_id: int, batch_size: int):
+        """Replace the legacy files of the version, inserted in bulk, the caller commits"""
+        session.query(Legacy).filter(Legacy.version_id == version_id).delete()
 
-            if modified_file.new_path is None:
-                continue
-
-            modified_legacy_files.append({
-                "old_path": modified_file.old_path,
-                "new_path": modified_file.new_path,
-                "filename": modified_file.filename,
-            })
-
-        return modified_legacy_files
-
-    @staticmethod
-    def get_new_modified_legacy_files_for_version(
-                    modified_legacy_files: Dict[str, datetime.datetime], 
-                    new_commit_modified_legacy_files: List[Dict[str, str]]) -> Dict[str, datetime.datetime]:
-
-        new_modified_legacy_files = copy.deepcopy(modified_legacy_files)
-
-        for legacy_file in new_commit_modified_legacy_files:
-            new_modified_legacy_files.pop(legacy_file["old_path"], None)
-            new_modified_legacy_files[legacy_file["new_path"]] = legacy_file
-
-        return new_modified_legacy_files
-
-    @staticmethod
-    def get_new_files_last_modification_for_commit(files_last_modification: Dict[str, datetime.datetime], 
-                                                commit_details: pydriller.Commit) -> Dict[str, datetime.datetime]:
-        
-        new_files_last_modification = copy.deepcopy(files_last_modification)
-
-        for modified_file in commit_details.modified_files:
-            new_files_last_modification.pop(modified_file.old_path, None)
-            new_files_last_modification[modified_file.new_path] = commit_details.committer_date
-
-        return new_files_last_modification
-
-    def __save_legacy_files(self, legacy_files: List[str], version_id: int):
-        
-        self.__delete_existing_leagcy(version_id)
-        
-        for legacy_file in legacy_files:
-            
-            file: File = save_file_if_not_found(self.session, legacy_file)
-
-            legacy = Legacy(version_id=version_id, file_id=file.file_id)
-            self.session.add(legacy)
-            self.session.commit()
-
-    def __delete_existing_leagcy(self, version_id):
-        self.session.query(Legacy).filter(Legacy.version_id == version_id).delete()
+        file_ids = save_files_if_not_found(session, legacy_files, batch_size)
+        session.bulk_insert_mappings(Legacy, [{"version_id": version_id, "file_id": file_ids[legacy_file]}
+                                              for legacy_file in legacy_files])
 
     def __save_metric(self, legacy_files: List[str], version_id: int):
         metric = self.session.query(Metric).filter(Metric.version_id == version_id).first()
-        
+
         if not metric:
             metric = Metric(version_id=version_id)
-        
+
         metric.nb_legacy_files = len(legacy_files)
-        
+
         self.session.add(metric)
-        self.session.commit()
\ No newline at end of file
+        self.session.commit()
@@ -1,16 +1,33 @@
-from distutils.version import Version
 import logging
 import os
+from typing import Iterator, List
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Boolean, DateTime, Float, Integer, LargeBinary, select
 
-from models.metric import Metric
+from models.author import Author
+from models.commit import Commit
+from models.file import File
+from models.issue import Issue
+from models.legacy import Legacy
+from models.ownership import Ownership
 from models.version import Version
 from utils.database import get_included_and_current_versions_filter
+from utils.featurestore import FeatureStore
 from utils.timeit import timeit
 
+# Tables that can be exported along with the metrics, the rows of the project only
+EXPORT_TABLES = ["commit", "issue", "legacy", "ownership"]
+PARQUET_COMPRESSION = "zstd"
+
 class FlatFileExporter:
     """
     Export the database to a flat file
+
+    The rows are streamed by chunks of OTTM_BATCH_SIZE rows: a chunk is
+    appended to the CSV file or written as a row group of the Parquet file
     """
 
     def __init__(self, project_id, directory, session, config):
@@ -32,7 +49,7 @@ class FlatFileExporter:
         self.configuration = config
 
     @timeit
-    def export_to_csv(self, filename):
+    def export_to_csv(self, filename, columns: List[str] = None, tables: List[str] = None):
         """
         Export the database to CSV
 
@@ -40,23 +57,18 @@ class FlatFileExporter:
         -----------
         filename : str
             name of the file with extension - not the fullpath
+        columns : List[str]
+            columns of the metrics to export, all of them if empty
+        tables : List[str]
+            tables exported into <table>.csv too (commit, issue, legacy, ownership)
         """
         logging.info('export_to_csv')
+        self.__write_csv(filename, self.__get_metrics_chunks(columns))
+        for table in tables or []:
+            self.__write_csv(table + ".csv", self.__get_table_chunks(table))
 
-        excluded_versions = self.configuration.exclude_versions
-        included_and_current_versions = get_included_and_current_versions_filter(self.session, self.configuration)
-
-        metrics_statement = self.session.query(Version, Metric) \
-            .filter(Version.project_id == self.project_id) \
-            .filter(Version.include_filter(included_and_current_versions)) \
-            .filter(Version.exclude_filter(excluded_versions)) \
-            .join(Metric, Metric.version_id == Version.version_id).statement
-        logging.debug(metrics_statement)
-        df = pd.read_sql(metrics_statement, self.session.get_bind())
-        df.to_csv(os.path.join(self.directory, filename))
-        
     @timeit
-    def export_to_parquet(self, filename):
+    def export_to_parquet(self, filename, columns: List[str] = None, tables: List[str] = None):
         """
         Export the database to a parquet file
 
@@ -64,18 +76,99 @@ class FlatFileExporter:
         -----------
         filename : str
             name of the file with extension - not the fullpath
+        columns : List[str]
+            columns of the metrics to export, all of them if empty
+        tables : List[str]
+            tables exported into <table>.parquet too (commit, issue, legacy, ownership)
         """
         logging.info('export_to_parquet')
+        self.__write_parquet(filename, self.__get_metrics_chunks(columns))
+        for table in tables or []:
+            self.__write_parquet(table + ".parquet", self.__get_table_chunks(table))
 
+    def __get_metrics_chunks(self, columns: List[str]) -> Iterator[pa.RecordBatch]:
         excluded_versions = self.configuration.exclude_versions
         included_and_current_versions = get_included_and_current_versions_filter(self.session, self.configuration)
+        return FeatureStore(self.project_id, self.session, self.configuration) \
+            .iter_batches(columns, included_and_current_versions, excluded_versions, with_metrics=True,
+                          batch_size=self.configuration.batch_size)
+
+    def __get_table_chunks(self, table: str) -> Iterator[pa.Table]:
+        statement = self.__get_table_statement(table)
+        logging.debug(statement)
+        schema = pa.schema([(column.name, self.__get_arrow_type(column.type))
+                            for column in statement.selected_columns])
+        with self.session.get_bind().connect() as connection:
+            # Server side cursor, the PostgreSQL and MySQL drivers fetch the whole result otherwise
+            connection = connection.execution_options(stream_results=True)
+            for chunk in pd.read_sql(statement, connection, chunksize=self.configuration.batch_size):
+                # The types come from the columns, a chunk of NULL values isn't typed by pandas
+                yield pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+        # A table without any row still gets a file with its columns
+        yield schema.empty_table()
+
+    def __get_table_statement(self, table: str):
+        if table == "commit":
+            return select(Commit).filter(Commit.project_id == self.project_id).order_by(Commit.commit_id)
+        if table == "issue":
+            return select(Issue).filter(Issue.project_id == self.project_id).order_by(Issue.issue_id)
+        if table == "legacy":
+            return select(Legacy, Version.tag, File.path) \
+                .join(Version, Version.version_id == Legacy.version_id) \
+                .join(File, File.file_id == Legacy.file_id) \
+                .filter(Version.project_id == self.project_id) \
+                .order_by(Legacy.legacy_id)
+        if table == "ownership":
+            return select(Ownership, Version.tag, File.path, Author.name.label("author")) \
+                .join(Version, Version.version_id == Ownership.version_id) \
+                .join(File, File.file_id == Ownership.file_id) \
+                .join(Author, Author.author_id == Ownership.author_id) \
+                .filter(Version.project_id == self.project_id) \
+                .order_by(Ownership.ownership_id)
+        raise ValueError("Unsupported table " + table)
+
+    @staticmethod
+    def __get_arrow_type(column_type) -> pa.DataType:
+        if isinstance(column_type, Boolean):
+            return pa.bool_()
+        if isinstance(column_type, Integer):
+            return pa.int64()
+        if isinstance(column_type, Float):
+            return pa.float64()
+        if isinstance(column_type, DateTime):
+            return pa.timestamp("us")
+        if isinstance(column_type, LargeBinary):
+            return pa.binary()
+        return pa.string()
+
+    def __write_csv(self, filename, chunks):
+        path = os.path.join(self.directory, filename)
+        nb_rows = 0
+        with open(path, "w", newline="") as file:
+            for chunk in chunks:
+                if file.tell() and not chunk.num_rows:
+                    continue
+                df = chunk.to_pandas()
+                # Same index as a single DataFrame written at once
+                df.index = range(nb_rows, nb_rows + len(df))
+                df.to_csv(file, header=file.tell() == 0)
+                nb_rows += len(df)
+        logging.info(f"{nb_rows} row(s) exported to {path}")
 
-        metrics_statement = self.session.query(Version, Metric) \
-            .filter(Version.project_id == self.project_id) \
-            .filter(Version.include_filter(included_and_current_versions)) \
-            .filter(Version.exclude_filter(excluded_versions)) \
-            .join(Metric, Metric.version_id == Version.version_id).statement
-        logging.debug(metrics_statement)
-        df = pd.read_sql(metrics_statement, self.session.get_bind())
-        df.to_csv(os.path.join(self.directory, filename))
- 
\ No newline at end of file
+    def __write_parquet(self, filename, chunks):
+        path = os.path.join(self.directory, filename)
+        nb_rows = 0
+        writer = None
+        try:
+            for chunk in chunks:
+                if writer is not None and not chunk.num_rows:
+                    continue
+                if writer is None:
+                    writer = pq.ParquetWriter(path, chunk.schema, compression=PARQUET_COMPRESSION,
+                                              use_dictionary=True)
+                writer.write(chunk)
+                nb_rows += chunk.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        logging.info(f"{nb_rows} row(s) exported to {path}")
@@ -1,10 +1,15 @@
 from distutils.version import Version
+import hashlib
 import logging
 import os
+from typing import List, Tuple
+
+import joblib
+import numpy as np
 import pandas as pd
 from kneed import KneeLocator
 from sklearn.datasets import make_blobs
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score
 from sklearn.preprocessing import StandardScaler
 from kneed import KneeLocator
@@ -15,12 +20,29 @@ from sqlalchemy.orm import Session
 
 from configuration import Configuration
 from models.project import Project
-from models.metric import Metric
 from models.model import Model
-from models.version import Version
 from utils.database import get_included_and_current_versions_filter
+from utils.dirs import evict_old_files, make_private_dir
+from utils.featurestore import FeatureStore
 from utils.timeit import timeit
 
+# Folder of OTTM_CACHE_DIR of the inertias and model of the elbow, by hash of the features
+KMEANS_CACHE_FOLDER = "kmeans"
+# Number of feature sets kept in the cache, the least recently used are removed
+KMEANS_CACHE_MAX_FILES = 100
+KMEANS_MAX_CLUSTERS = 10
+KMEANS_KWARGS = {
+    "init": "random",
+    "n_init": 10,
+    "max_iter": 300,
+    "random_state": 42,
+}
+
+def _fit_kmeans(n_clusters: int, features: np.ndarray, mini_batch: bool):
+    if mini_batch:
+        return MiniBatchKMeans(n_clusters=n_clusters, **KMEANS_KWARGS).fit(features)
+    return KMeans(n_clusters=n_clusters, **KMEANS_KWARGS).fit(features)
+
 class MlHtmlExporter:
     """
     Generate an HTML report 
@@ -71,56 +93,20 @@ class MlHtmlExporter:
         excluded_versions = self.configuration.exclude_versions
         included_and_current_versions = get_included_and_current_versions_filter(self.session, self.configuration)
 
-        releases_statement = self.session.query(
-                Version.tag,
-                Version.name,
-                Version.bugs,
-                Version.avg_team_xp,
-                Version.changes,
-                Version.bug_velocity,
-                Version.code_churn_avg,
-                Metric.lizard_avg_complexity) \
-                .order_by(Version.end_date.desc()) \
-                .join(Metric, Version.version_id == Metric.version_id) \
-                .filter(Version.project_id == project.project_id) \
-                .filter(Version.include_filter(included_and_current_versions)) \
-                .filter(Version.exclude_filter(excluded_versions)) \
-                .statement
-        logging.debug(releases_statement)
-        df = pd.read_sql(releases_statement, self.session.get_bind())
+        df = FeatureStore(project.project_id, self.session, self.configuration) \
+            .get_versions(["tag", "name", "bugs", "avg_team_xp", "changes", "bug_velocity", "code_churn_avg",
+                           "lizard_avg_complexity", "end_date"],
+                          included_and_current_versions, excluded_versions, with_metrics=True)
+        df = df.sort_values("end_date", ascending=False).drop(columns=["end_date"]).reset_index(drop=True)
         df['bug_velocity'].round(decimals = 2)
         df_tr = df[['avg_team_xp', 'changes', 'bug_velocity', 'code_churn_avg', 'lizard_avg_complexity']]
 
         scaler = StandardScaler()
         scaled_features = scaler.fit_transform(df_tr.values)
 
-        # Try to determine the number of clusters
-        kmeans_kwargs = {
-            "init": "random",
-            "n_init": 10,
-            "max_iter": 300,
-            "random_state": 42,
-        }
-        sse = []
-        for k in range(1, 11):
-            kmeans = KMeans(n_clusters=k, **kmeans_kwargs)
-            kmeans.fit(scaled_features)
-            sse.append(kmeans.inertia_)
-        kl = KneeLocator(
-            range(1, 11), sse, curve="convex", direction="decreasing"
-        )
-        clusters = kl.elbow
-        logging.info('The number of clusters: ' + str(clusters))
-
-        # Find the clusters
-        kmeans = KMeans(
-            init="random",
-            n_clusters=clusters,
-            n_init=10,
-            max_iter=300,
-            random_state=42
-        )
-        kmeans.fit(scaled_features)
+        kmeans, sse = self.__find_clusters(scaled_features)
+        logging.info('The number of clusters: ' + str(kmeans.n_clusters))
+        logging.info('SSE by number of clusters: ' + str(sse))
         logging.info('The lowest SSE value: ' + str(kmeans.inertia_))
         logging.info('Final locations of the centroid: ' + str(kmeans.cluster_centers_))
         logging.info('The number of iterations required to converge: ' + str(kmeans.n_iter_))
@@ -164,3 +150,35 @@ class MlHtmlExporter:
         output_text = template.render(data)
         with open(filename, "w") as file:
             file.write(output_text)
+
+    def __find_clusters(self, features: np.ndarray) -> Tuple[KMeans, List[float]]:
+        """
+        Find the number of clusters with the elbow method, the models of each
+        number of clusters are fitted in parallel and the one of the elbow is kept
+        Return the model of the elbow and the SSE (inertia) of each number of clusters
+        """
+        mini_batch = self.configuration.kmeans_mini_batch
+        features_hash = hashlib.sha1(features.tobytes() + str(features.shape).encode() +
+                                     str((mini_batch, KMEANS_KWARGS)).encode()).hexdigest()
+        # The cached models are unpickled, only the user can write them
+        cache_dir = make_private_dir(os.path.join(self.configuration.cache_dir, KMEANS_CACHE_FOLDER))
+        cache_file = os.path.join(cache_dir, features_hash + ".joblib")
+        if os.path.exists(cache_file):
+            logging.info('KMeans found in cache: ' + cache_file)
+            cached = joblib.load(cache_file)
+            os.utime(cache_file)
+            return cached["model"], cached["sse"]
+
+        # There can't be more clusters than versions
+        nb_clusters = list(range(1, min(KMEANS_MAX_CLUSTERS, len(features)) + 1))
+        models = joblib.Parallel(n_jobs=self.configuration.workers)(
+            joblib.delayed(_fit_kmeans)(k, features, mini_batch) for k in nb_clusters)
+        sse = [model.inertia_ for model in models]
+        kl = KneeLocator(nb_clusters, sse, curve="convex", direction="decreasing")
+        if kl.elbow is None:
+            logging.info('No elbow found, a single cluster is used')
+        model = models[(kl.elbow or 1) - 1]
+
+        joblib.dump({"model": model, "sse": sse}, cache_file)
+        evict_old_files(cache_dir, KMEANS_CACHE_MAX_FILES)
+        return model, sse
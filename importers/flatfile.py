@@ -1,19 +1,38 @@
 import logging
 import sys
-from datetime import datetime
 from os.path import exists
+from typing import Dict, Iterator, List
 
+import numpy as np
 import pandas as pd
 import click
+from sqlalchemy import func
 
 from metrics.versions import compute_version_metrics
 from models.version import Version
 from models.issue import Issue
+from utils.database import save_issues
+
+# Columns that the CSV file must contain, by target table
+MANDATORY_COLUMNS = {
+    "version": ["project_id", "tag", "start_date", "end_date"],
+    "issue": ["project_id", "number", "created_at", "updated_at"]
+}
+DATE_COLUMNS = {
+    "version": ["start_date", "end_date"],
+    "issue": ["created_at", "updated_at"]
+}
+# Source of the imported issues when the CSV file has no source column
+CSV_ISSUE_SOURCE = "csv"
 
 
 class FlatFileImporter:
     """
     Import CSV file data to the database
+
+    The file is read by chunks of OTTM_BATCH_SIZE rows, the dates of a chunk
+    are parsed at once and its rows inserted in bulk. The metrics of the
+    versions affected by the import are computed once at the end.
     """
     def __init__(self, file_path:str, target_table:str, overwrite:bool, session, config) -> None:
         """
@@ -41,67 +60,115 @@ class FlatFileImporter:
         Import CSV to the database
         """
         logging.info('import_from_csv')
-        if self.target_table and str(self.target_table).lower() in ["issue", "version"]:
-            if self.file_path and exists(self.file_path):
-                # Read CSV file
-                csv_data = pd.read_csv(self.file_path).to_dict('records')
-
-                # Import Version
-                if str(self.target_table).capitalize() == "Version":
-                    # Overwrite option
-                    if self.overwrite:
-                        self.session.query(Version).delete()
-                        click.echo('Overwrite Version table')
-
-                    for version in csv_data:
-                        if all(item in list(version.keys()) for item in ['tag', 'start_date', 'end_date']):
-                            newVersion=Version(
-                                                project_id=version['project_id'],
-                                                name=version["name"], 
-                                                tag=version["tag"], 
-                                                start_date=datetime.strptime(version["start_date"], '%Y-%m-%d %H:%M:%S.%f'), 
-                                                end_date=datetime.strptime(version["end_date"], '%Y-%m-%d %H:%M:%S.%f'), 
-                                                )
-                            
-                            try:
-                                self.session.add(newVersion)
-                                compute_version_metrics(self.session, self.configuration.current_branch, newVersion.project_id)
-                                click.echo('Importing ' + str(len(csv_data)) + ' version(s) on database')
-                            except Exception:
-                                logging.error(Exception)
-                        else:
-                            logging.error("CSV file no contain minimal mandatory fields")
-                            sys.exit('CSV file no contain minimal mandatory fields')
-
-                # Import Issue
-                if str(self.target_table).capitalize() == "Issue":
-                    # Overwrite option
-                    if self.overwrite:
-                        self.session.query(Issue).delete()
-                        click.echo('Overwrite Issue table')
-
-                    for issue in csv_data:
-                        if all(item in list(issue.keys()) for item in ['number', 'created_at', 'updated_at']):
-                            newIssue=Issue(
-                                            project_id=issue['project_id'],
-                                            number=issue["number"],
-                                            title=issue["title"],
-                                            created_at=datetime.strptime(issue["created_at"], '%Y-%m-%d %H:%M:%S.%f'),
-                                            updated_at=datetime.strptime(issue["updated_at"], '%Y-%m-%d %H:%M:%S.%f'))
-
-                            try:
-                                self.session.add(newIssue)
-                                click.echo('Importing ' + str(len(csv_data)) + ' issue(s) on database')
-                            except Exception:
-                                logging.error(Exception)
-                        else:
-                            logging.error("CSV file no contain minimal mandatory fields")
-                            sys.exit('CSV file no contain minimal mandatory fields')  
-
-                self.session.commit()
-            else:
-                logging.error('File not found')
-                sys.exit('File not found')
-        else:
+        target_table = str(self.target_table).lower() if self.target_table else None
+        if target_table not in MANDATORY_COLUMNS:
             logging.error('Target table not found')
             sys.exit('Target table not found')
+        if not self.file_path or not exists(self.file_path):
+            logging.error('File not found')
+            sys.exit('File not found')
+
+        columns = pd.read_csv(self.file_path, nrows=0).columns
+        if not all(column in columns for column in MANDATORY_COLUMNS[target_table]):
+            logging.error("CSV file no contain minimal mandatory fields")
+            sys.exit('CSV file no contain minimal mandatory fields')
+
+        if target_table == "version":
+            affected_versions = self.__import_versions()
+        else:
+            affected_versions = self.__import_issues()
+        self.session.commit()
+
+        # The repository isn't cloned by the import, the code churn isn't computed
+        for project_id, version_ids in affected_versions.items():
+            if version_ids:
+                compute_version_metrics(self.session, None, project_id, version_ids=version_ids)
+
+    def __read_chunks(self, target_table: str) -> Iterator[pd.DataFrame]:
+        for chunk in pd.read_csv(self.file_path, chunksize=self.configuration.batch_size):
+            for column in DATE_COLUMNS[target_table]:
+                dates = pd.to_datetime(chunk[column])
+                chunk[column] = dates.astype(object).where(dates.notna(), None)
+            yield chunk.astype(object).where(chunk.notna(), None)
+
+    def __import_versions(self) -> Dict[int, List[int]]:
+        """Insert the versions, return the identifiers of the new versions by project"""
+        if self.overwrite:
+            self.session.query(Version).delete()
+            click.echo('Overwrite Version table')
+        last_version_id = self.session.query(func.max(Version.version_id)).scalar() or 0
+
+        nb_versions = 0
+        for chunk in self.__read_chunks("version"):
+            if "name" not in chunk:
+                chunk["name"] = chunk["tag"]
+            versions = chunk[["project_id", "name", "tag", "start_date", "end_date"]].to_dict("records")
+            self.session.bulk_insert_mappings(Version, versions)
+            nb_versions += len(versions)
+        click.echo('Importing ' + str(nb_versions) + ' version(s) on database')
+
+        affected_versions = {}
+        for project_id, version_id in self.session.query(Version.project_id, Version.version_id) \
+                                                  .filter(Version.version_id > last_version_id):
+            affected_versions.setdefault(project_id, []).append(version_id)
+        return affected_versions
+
+    def __import_issues(self) -> Dict[int, List[int]]:
+        """
+        Insert or update the issues of each project and source (the file is read once
+        by group), return by project the versions during which an issue was created,
+        before or after the import, all of them for the issues deleted by overwrite
+        """
+        overwritten_projects = []
+        if self.overwrite:
+            overwritten_projects = [project_id for project_id, in self.session.query(Issue.project_id).distinct()]
+            self.session.query(Issue).delete()
+            click.echo('Overwrite Issue table')
+
+        group_columns = ["project_id"] + (["source"] if "source" in pd.read_csv(self.file_path, nrows=0) else [])
+        groups = pd.read_csv(self.file_path, usecols=group_columns).fillna(CSV_ISSUE_SOURCE).drop_duplicates()
+
+        created_dates = {}
+        nb_new = nb_updated = 0
+        for group in groups.to_dict("records"):
+            project_id = int(group["project_id"])
+            source = group.get("source", CSV_ISSUE_SOURCE)
+            issues = self.__read_issues(project_id, source, created_dates.setdefault(project_id, []))
+            new, updated = save_issues(self.session, project_id, source, issues, self.configuration.batch_size)
+            nb_new += new
+            nb_updated += updated
+        click.echo(f'Importing {nb_new} new and {nb_updated} updated issue(s) on database')
+
+        affected_versions = {project_id: self.__get_versions_of_dates(project_id, dates)
+                             for project_id, dates in created_dates.items()}
+        for project_id in overwritten_projects:
+            affected_versions[project_id] = [version_id for version_id, in
+                                             self.session.query(Version.version_id)
+                                                         .filter(Version.project_id == project_id)]
+        return affected_versions
+
+    def __read_issues(self, project_id: int, source: str, created_dates: List) -> Iterator[Dict]:
+        for chunk in self.__read_chunks("issue"):
+            sources = chunk["source"].fillna(CSV_ISSUE_SOURCE) if "source" in chunk else CSV_ISSUE_SOURCE
+            chunk = chunk[(chunk["project_id"] == project_id) & (sources == source)]
+            if "title" not in chunk:
+                chunk = chunk.assign(title=None)
+            created_dates.extend(date for date in chunk["created_at"] if date is not None)
+            # The version the issue was created in before the import loses it
+            numbers = [str(number) for number in chunk["number"]]
+            created_dates.extend(date for date, in self.session.query(Issue.created_at)
+                                                               .filter(Issue.project_id == project_id)
+                                                               .filter(Issue.source == source)
+                                                               .filter(Issue.number.in_(numbers))
+                                 if date is not None)
+            yield from chunk[["number", "title", "created_at", "updated_at"]].to_dict("records")
+
+    def __get_versions_of_dates(self, project_id: int, dates: List) -> List[int]:
+        """Identifiers of the versions of the project including at least one of the dates"""
+        dates = np.sort(np.array(dates, dtype="datetime64[us]"))
+        versions = self.session.query(Version.version_id, Version.start_date, Version.end_date) \
+                               .filter(Version.project_id == project_id).all()
+        return [version_id for version_id, start_date, end_date in versions
+                if start_date and end_date and
+                np.searchsorted(dates, np.datetime64(end_date, "us"), side="right") >
+                np.searchsorted(dates, np.datetime64(start_date, "us"), side="left")]
@@ -10,6 +10,7 @@ from xmlrpc.client import boolean
 
 import click
 import sqlalchemy as db
+from sqlalchemy import func
 from sqlalchemy.exc import ArgumentError
 from dependency_injector.wiring import Provide, inject
 from dotenv import load_dotenv
@@ -24,11 +25,14 @@ from models.version import Version
 from models.issue import Issue
 from models.metric import Metric
 from models.model import Model
+from models.lizardcache import LizardCache
 from models.database import setup_database
 from connectors.git import GitConnector
+from connectors.fileanalyzer import FileAnalyzer
+from exporters.flatfile import EXPORT_TABLES
+from utils.featurestore import FEATURE_COLUMNS
 from utils.mlfactory import MlFactory
 from utils.database import get_included_and_current_versions_filter
-from utils.dirs import TmpDirCopyFilteredWithEnv
 from utils.gitfactory import GitConnectorFactory
 
 def lint_aliases(raw_aliases) -> boolean:
@@ -106,9 +110,11 @@ def cli(ctx):
 @cli.command()
 @click.option('--output', default='.', help='Destination folder', envvar="OTTM_OUTPUT_FOLDER")
 @click.option('--format', default='csv', help='Output format (csv,parquet)', envvar="OTTM_OUTPUT_FORMAT")
+@click.option('--columns', default='', help='Columns of the metrics to export, separated by commas (all by default)')
+@click.option('--tables', default='', help='Tables exported too, separated by commas (commit,issue,legacy,ownership)')
 @click.pass_context
 @inject
-def export(ctx, output, format, 
+def export(ctx, output, format, columns, tables,
            flat_file_exporter_provider = Provide[Container.flat_file_exporter_provider.provider]):
     """Export the database to a flat format"""
     logging.info("export")
@@ -123,12 +129,22 @@ def export(ctx, output, format,
         if format not in ['csv','parquet']:
             logging.error("Unsupported output format")
             sys.exit('Unsupported output format')
+    columns = [column.strip() for column in columns.split(",") if column.strip()]
+    unsupported_columns = [column for column in columns if column not in [c.name for c in FEATURE_COLUMNS]]
+    if unsupported_columns:
+        logging.error("Unsupported columns: " + ",".join(unsupported_columns))
+        sys.exit('Unsupported columns: ' + ",".join(unsupported_columns))
+    tables = [table.strip() for table in tables.split(",") if table.strip()]
+    unsupported_tables = [table for table in tables if table not in EXPORT_TABLES]
+    if unsupported_tables:
+        logging.error("Unsupported tables: " + ",".join(unsupported_tables))
+        sys.exit('Unsupported tables: ' + ",".join(unsupported_tables))
     os.makedirs(output, exist_ok=True)
     exporter = flat_file_exporter_provider(project.project_id, output)
     if format == 'csv':
-        exporter.export_to_csv("metrics.csv")
+        exporter.export_to_csv("metrics.csv", columns, tables)
     elif format == 'parquet':
-        exporter.export_to_parquet("metrics.parquet")
+        exporter.export_to_parquet("metrics.parquet", columns, tables)
     logging.info(f"Created export {output}/metrics.{format}")
 
 @cli.command()
@@ -211,6 +227,10 @@ def info(ctx, configuration = Provide[Container.configuration], session = Provid
     metrics_count = session.query(Metric).join(Version).filter(Version.project_id == project.project_id).count()
     trained_models = session.query(Model.name).filter(Model.project_id == project.project_id).all()
     trained_models = [r for r, in trained_models]
+    lizard_cache_entries, lizard_cache_hits = session.query(func.count(LizardCache.lizard_cache_id),
+                                                            func.coalesce(func.sum(LizardCache.hits), 0)) \
+                                                     .filter(LizardCache.tool_version == FileAnalyzer.get_tool_version()) \
+                                                     .one()
 
     out = """ -- OTTM Bug Predictor --
     Project  : {project}
@@ -222,6 +242,8 @@ def info(ctx, configuration = Provide[Container.configuration], session = Provid
     Issues   : {issues}
     Metrics  : {metrics}
 
+    Lizard cache : {lizard_cache_hits} hits / {lizard_cache_entries} entries
+
     Trained models : {models}
     """.format(
         project=configuration.source_project,
@@ -233,6 +255,8 @@ def info(ctx, configuration = Provide[Container.configuration], session = Provid
         excluded_versions=total_versions_count-filtered_version_count,
         issues=issues_count,
         metrics=metrics_count,
+        lizard_cache_hits=lizard_cache_hits,
+        lizard_cache_entries=lizard_cache_entries,
         models=", ".join(trained_models)
         )
     click.echo(out)
@@ -261,11 +285,10 @@ def populate(ctx, skip_versions,
              configuration = Provide[Container.configuration],
              git_factory_provider = Provide[Container.git_factory_provider.provider],
              jira_connector_provider = Provide[Container.jira_connector_provider.provider],
-             ck_connector_provider = Provide[Container.ck_connector_provider.provider],
-             file_analyzer_provider = Provide[Container.file_analyzer_provider.provider],
              jpeek_connector_provider = Provide[Container.jpeek_connector_provider.provider],
-             legacy_connector_provider = Provide[Container.legacy_connector_provider.provider],
-             codemaat_connector_provider = Provide[Container.codemaat_connector_provider.provider]):
+             codemaat_connector_provider = Provide[Container.codemaat_connector_provider.provider],
+             version_scheduler_provider = Provide[Container.version_scheduler_provider.provider],
+             feature_store_provider = Provide[Container.feature_store_provider.provider]):
     """Populate the database with the provided configuration"""
 
     # Checkout, execute the tool and inject CSV result into the database
@@ -289,35 +312,14 @@ def populate(ctx, skip_versions,
 
     # List the versions and checkout each one of them
     versions = session.query(Version).filter(Version.project_id == project.project_id).all()
-    for version in versions:
-        process = subprocess.run([configuration.scm_path, "checkout", version.tag],
-                                stdout=subprocess.PIPE,
-                                cwd=repo_dir)
-        logging.info('Executed command line: ' + ' '.join(process.args))
-
-        with TmpDirCopyFilteredWithEnv(repo_dir, configuration.include_folders, 
-                                       configuration.exclude_folders) as tmp_work_dir:
-
-            legacy = legacy_connector_provider(project.project_id, repo_dir, version)
-            legacy.get_legacy_files(version)
-
-            # Get statistics from git log with codemaat
-            # codemaat = codemaat_connector_provider(repo_dir, version)
-            # codemaat.analyze_git_log()
+    # The versions go through a pipeline: prepared (checked out into a worktree), analyzed
+    # by OTTM_WORKERS processes and written, the steps of several versions overlap
+    scheduler = version_scheduler_provider(project.project_id, repo_dir)
+    scheduler.analyze_versions(versions)
 
-            # Get metrics with CK
-            ck = ck_connector_provider(directory=tmp_work_dir, version=version)
-            ck.analyze_source_code()
+    # Materialize the feature matrix read by the models, the reports and the exports
+    feature_store_provider(project.project_id).refresh()
 
-            # Get statistics with lizard
-            lizard = file_analyzer_provider(directory=tmp_work_dir, version=version)
-            lizard.analyze_source_code()
-
-            # Get metrics with JPeek
-            # jp = jpeek_connector_provider(directory=tmp_work_dir, version=version)
-            # jp.analyze_source_code()
-
-    
 
 @click.command()
 @inject
@@ -0,0 +1,192 @@
+import bisect
+import json
+import logging
+import subprocess
+from datetime import datetime, timedelta
+from fractions import Fraction
+from typing import Dict, List
+
+from models.churncheckpoint import ChurnCheckpoint
+from models.version import Version
+from utils.gitlog import iter_commits_numstat
+from utils.timeit import timeit
+import utils.math as mt
+
+@timeit
+def compute_versions_churn(session, repo_dir:str, project_id:int, versions: List[Version], scm_path:str = "git"):
+    """
+    Compute the count, average, and max code churn of the versions
+
+    The history is walked once in date order, each commit is added to the
+    per-file accumulators of the versions it belongs to (by date, both bounds
+    included). The churn of a file is computed as in pydriller's CodeChurn:
+    added - deleted lines of each commit, renames are followed.
+
+    The state of the walk is saved into the churn_checkpoint table, so the
+    next run only walks the commits added since then. The versions whose dates
+    changed are walked again, and the whole history when the saved commit isn't
+    an ancestor of HEAD anymore (rebase, force-push).
+
+    Parameters:
+    -----------
+    - session : Session
+        SQLAlchemy session
+    - repo_dir : str
+        Local folder where the repository was clones
+    - project_id : int
+        Project Identifier
+    - versions : List[Version]
+        Versions of the project, ordered by start date
+    - scm_path : str
+        Path to the git executable
+    """
+    logging.info("compute_versions_churn")
+
+    checkpoint = session.query(ChurnCheckpoint).filter(ChurnCheckpoint.project_id == project_id).first()
+    if not checkpoint:
+        checkpoint = ChurnCheckpoint(project_id=project_id, data="{}")
+    head = subprocess.run([scm_path, "rev-parse", "HEAD"], cwd=repo_dir,
+                          stdout=subprocess.PIPE, text=True, check=True).stdout.strip()
+    if checkpoint.commit_hash and not _is_ancestor(scm_path, repo_dir, checkpoint.commit_hash, head):
+        # Rebased or force-pushed, the saved churn may count commits that are gone
+        logging.info("Commit " + checkpoint.commit_hash + " is not in the history anymore, walking the whole history")
+        checkpoint.commit_hash = None
+        checkpoint.commit_date = None
+        checkpoint.data = "{}"
+    last_commit_date = checkpoint.commit_date
+    previous_entries = json.loads(checkpoint.data)
+
+    # Reuse the churn of the versions whose dates didn't change
+    entries = {}
+    rewalk_from = None
+    for version in versions:
+        entry = previous_entries.get(version.tag)
+        if entry and _is_entry_valid(entry, version, last_commit_date):
+            entry["end"] = version.end_date.isoformat()
+        else:
+            entry = _new_entry(version)
+            if last_commit_date and version.start_date <= last_commit_date:
+                rewalk_from = min(rewalk_from or version.start_date, version.start_date)
+        entries[version.tag] = entry
+
+    # Walking again a period resets all the versions that overlap it
+    while rewalk_from:
+        overlapping = [version for version in versions
+                       if version.end_date >= rewalk_from and not _is_new_entry(entries[version.tag])]
+        if not overlapping:
+            break
+        for version in overlapping:
+            entries[version.tag] = _new_entry(version)
+            rewalk_from = min(rewalk_from, version.start_date)
+
+    if rewalk_from:
+        logging.info("Walking the history again since " + str(rewalk_from))
+        # git compares the dates in local time, the commits are filtered below
+        git_commits = iter_commits_numstat(scm_path, repo_dir, since=rewalk_from - timedelta(days=1),
+                                           rev=head, with_files=True)
+    elif checkpoint.commit_hash:
+        logging.info("Walking the history since commit " + checkpoint.commit_hash)
+        git_commits = iter_commits_numstat(scm_path, repo_dir, rev=f"{checkpoint.commit_hash}..{head}", with_files=True)
+    else:
+        logging.info("Walking the whole history")
+        git_commits = iter_commits_numstat(scm_path, repo_dir, rev=head, with_files=True)
+
+    starts = [version.start_date for version in versions]
+    nb_commits = 0
+    for git_commit in git_commits:
+        nb_commits += 1
+        # Dates are stored without timezone in the database
+        commit_date = git_commit["date"].replace(tzinfo=None)
+        if rewalk_from and commit_date < rewalk_from:
+            continue
+        if last_commit_date is None or commit_date > last_commit_date:
+            last_commit_date = commit_date
+        # Versions follow each other, look backward from the last one started
+        for i in range(bisect.bisect_right(starts, commit_date) - 1, -1, -1):
+            if versions[i].end_date < commit_date:
+                break
+            entry = entries[versions[i].tag]
+            if entry["closed"]:
+                logging.debug("Commit %s belongs to a closed version", git_commit["hash"])
+                continue
+            _add_commit_to_entry(entry, git_commit["modified_files"])
+    logging.info(f"{nb_commits} commit(s) walked to compute the churn")
+
+    for version in versions:
+        entry = entries[version.tag]
+        if entry["closed"]:
+            churn_count, churn_avg, churn_max = entry["values"]
+        else:
+            churn_count, churn_avg, churn_max = _get_churn_values(entry["files"])
+            if last_commit_date and version.end_date < last_commit_date:
+                # Later commits can't change this version anymore, drop the accumulators
+                entry["closed"] = True
+                entry["values"] = [churn_count, churn_avg, churn_max]
+                entry["files"] = {}
+                entry["renamed"] = {}
+
+        logging.info('Version ' + version.name + ' / Chrun count: ' + str(churn_count) +
+                     ' / Chrun avg: ' + str(churn_avg) + ' / Chrun max: ' + str(churn_max))
+        version.code_churn_count = churn_count
+        version.code_churn_avg = churn_avg
+        version.code_churn_max = churn_max
+
+    checkpoint.commit_hash = head
+    checkpoint.commit_date = last_commit_date
+    checkpoint.data = json.dumps(entries)
+    session.add(checkpoint)
+    session.commit()
+
+def _is_ancestor(scm_path: str, repo_dir: str, commit_hash: str, rev: str) -> bool:
+    process = subprocess.run([scm_path, "merge-base", "--is-ancestor", commit_hash, rev],
+                             cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return process.returncode == 0
+
+def _new_entry(version: Version) -> Dict:
+    return {
+        "start": version.start_date.isoformat(),
+        "end": version.end_date.isoformat(),
+        "closed": False,
+        "values": None,
+        # path -> [churn, number of commits, max churn of a commit]
+        "files": {},
+        # old path -> path the churn is counted on
+        "renamed": {},
+    }
+
+def _is_new_entry(entry: Dict) -> bool:
+    return not entry["closed"] and not entry["files"]
+
+def _is_entry_valid(entry: Dict, version: Version, last_commit_date: datetime) -> bool:
+    if entry["start"] != version.start_date.isoformat():
+        return False
+    if entry["end"] == version.end_date.isoformat():
+        return True
+    # The end of an open version can move as long as no walked commit is lost
+    return not entry["closed"] and last_commit_date is not None and version.end_date >= last_commit_date
+
+def _add_commit_to_entry(entry: Dict, modified_files):
+    files = entry["files"]
+    renamed = entry["renamed"]
+    for old_path, new_path, added, deleted in modified_files:
+        file_path = renamed.get(new_path, new_path)
+        if old_path != new_path:
+            renamed[old_path] = file_path
+        churn = added - deleted
+        values = files.get(file_path)
+        if values is None:
+            files[file_path] = [churn, 1, churn]
+        else:
+            values[0] += churn
+            values[1] += 1
+            values[2] = max(values[2], churn)
+
+def _get_churn_values(files: Dict):
+    if not files:
+        return 0, 0, 0
+    churn_count = sum(abs(churn) for churn, _, _ in files.values())
+    # Average per file rounded to an integer, as pydriller's CodeChurn.avg()
+    files_avg = [round(Fraction(churn, nb_commits)) for churn, nb_commits, _ in files.values()]
+    churn_avg = abs(mt.Math.get_rounded_mean(files_avg))
+    churn_max = max(max_churn for _, _, max_churn in files.values())
+    return churn_count, churn_avg, churn_max
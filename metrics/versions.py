@@ -1,30 +1,25 @@
 import logging
 import math
-import subprocess
 from datetime import datetime, timedelta
 from typing import List
 
-from git import BadName
-
 import pandas as pd
 from sqlalchemy import desc
-from sqlalchemy.sql import func
 from sklearn import preprocessing
-import pandas as pd
 import numpy as np
-from pydriller.metrics.process.code_churn import CodeChurn
 from configuration import Configuration
+from metrics.churn import compute_versions_churn
 
 from models.version import Version
-from models.metric import Metric
 from models.commit import Commit
 from models.issue import Issue
 from utils.database import get_included_and_current_versions_filter
+from utils.featurestore import FeatureStore
 from utils.timeit import timeit
-import utils.math as mt
 
 @timeit
-def compute_version_metrics(session, repo_dir:str, project_id:int):
+def compute_version_metrics(session, repo_dir:str, project_id:int, scm_path:str = "git",
+                            version_ids: List[int] = None):
     """
     Compute version related metics:
     - Rough volume of changes (total lines)
@@ -41,87 +36,118 @@ def compute_version_metrics(session, repo_dir:str, project_id:int):
         Local folder where the repository was clones
     - project_id : int
         Project Identifier
+    - scm_path : str
+        Path to the git executable
+    - version_ids : List[int]
+        Versions to compute, all the versions of the project if None
+        The code churn isn't computed without repo_dir
     """
     logging.info("compute_version_metrics")
 
     versions = session.query(Version) \
         .filter(Version.project_id == project_id) \
         .order_by(Version.start_date.asc()).all()
+    if not versions:
+        logging.info("No version to compute")
+        return
+
+    # Load the commits and the issues once, the metrics of all versions
+    # are computed in memory
+    commits_statement = session.query(Commit.date, Commit.committer, Commit.lines) \
+        .filter(Commit.project_id == project_id).statement
+    df_commits = pd.read_sql(commits_statement, session.get_bind())
+    issues_statement = session.query(Issue.created_at) \
+        .filter(Issue.project_id == project_id).statement
+    df_issues = pd.read_sql(issues_statement, session.get_bind())
+    if version_ids is not None:
+        version_ids = set(version_ids)
+    computed_versions = [version for version in versions if version_ids is None or version.version_id in version_ids]
+    df_versions = pd.DataFrame({
+        "version_id": [version.version_id for version in computed_versions],
+        "start_date": [version.start_date for version in computed_versions],
+        "end_date": [version.end_date for version in computed_versions],
+    })
+
+    df_values = compute_versions_values(df_versions, df_commits, df_issues)
+    session.bulk_update_mappings(Version, df_values.to_dict("records"))
+    session.commit()
+
+    # Compute the count, average, and max code churn on the versions
+    if repo_dir:
+        compute_versions_churn(session, repo_dir, project_id, versions, scm_path)
+
+def compute_versions_values(df_versions: pd.DataFrame, df_commits: pd.DataFrame,
+                            df_issues: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compute the number of bugs, the bug velocity, the rough volume of changes
+    and the average seniorship of the team for all versions at once
+
+    The commits and issues are sorted by date, the bounds of each version are
+    then found with a binary search (both bounds are included).
 
-    from_commit = session.query(Commit.hash) \
-        .filter(Commit.project_id == project_id) \
-            .order_by(Commit.date.asc()).first()[0]
-
-    for version in versions:
-        # Count the number of issues that occurred between the start and end dates
-        bugs_count = session.query(Issue).filter(
-            Issue.created_at.between(version.start_date, version.end_date)).filter(Issue.project_id == project_id).count()
-
-        # Compute the bug velocity of the release
-        delta = version.end_date - version.start_date
-        days = delta.days
-        if days > 0:
-            bug_velo_release = bugs_count / days
-        else:
-            bug_velo_release = bugs_count
-
-        # Compute a rough estimate of the total changes
-        rough_changes = session.query(
-            func.sum(Commit.lines).label("total_changes")
-        ).filter(Commit.date.between(version.start_date, version.end_date)).filter(Commit.project_id == project_id).scalar()
-        if rough_changes is None: rough_changes = 0
-
-        # Compute the average seniorship of the team
-        team_members = session.query(Commit.committer).filter(
-            Commit.date.between(version.start_date, version.end_date)
-        ).filter(Commit.project_id == project_id).group_by(Commit.committer).all()
-        seniority_total = 0
-        for member in team_members:
-            first_commit = session.query(
-                func.min(Commit.date).label("date")
-            ).filter(Commit.committer == member[0]).scalar()
-            delta = version.end_date - first_commit
-            seniority = delta.days
-            seniority_total += seniority
-        seniority_avg = seniority_total / max(len(team_members), 1)
-
-        # Compute the count, average, and max code churn on the version
-        if version.code_churn_count:
-            logging.info("Chrun already done for this version")
-        else :
-            logging.info("Counting churn between " + from_commit + " and " + version.tag)
-            metric = CodeChurn(path_to_repo=repo_dir,
-                            from_commit=from_commit,
-                            to_commit=version.tag)
-            files_count = metric.count()
-            files_avg = metric.avg()
-            files_max = metric.max()
-            churn_count = 0
-            for file_count in files_count.values():
-                churn_count += abs(file_count)
-
-            if files_avg:
-                churn_avg = abs(mt.Math.get_rounded_mean(list(files_avg.values())))
-            else:
-                churn_avg = 0
-
-            if files_max:
-                churn_max = max(list(files_max.values()))
-            else:
-                churn_max = 0
-
-            logging.info('Chrun count: ' + str(churn_count) + ' / Chrun avg: ' + str(churn_avg) + ' / Chrun max: ' + str(churn_max))
-            from_commit = version.tag
-
-            # Modify the version into the database
-            version.code_churn_count = churn_count
-            version.code_churn_avg = churn_avg
-            version.code_churn_max = churn_max
-            version.bugs=bugs_count
-            version.changes=rough_changes
-            version.avg_team_xp=seniority_avg
-            version.bug_velocity=bug_velo_release
-            session.commit()
+    Parameters:
+    -----------
+    - df_versions : DataFrame
+        version_id, start_date and end_date of the versions
+    - df_commits : DataFrame
+        date, committer and lines of the commits of the project
+    - df_issues : DataFrame
+        created_at of the issues of the project
+
+    Return a DataFrame with the columns version_id, bugs, bug_velocity, changes
+    and avg_team_xp
+    """
+    start_dates = _to_datetime64(df_versions["start_date"])
+    end_dates = _to_datetime64(df_versions["end_date"])
+
+    # Number of issues created during each version
+    issues_dates = _to_datetime64(df_issues["created_at"])
+    issues_dates = np.sort(issues_dates[~np.isnat(issues_dates)])
+    bugs = np.searchsorted(issues_dates, end_dates, side="right") \
+        - np.searchsorted(issues_dates, start_dates, side="left")
+
+    # Bug velocity (whole days, as with timedelta.days)
+    days = (end_dates - start_dates) // np.timedelta64(1, "D")
+    bug_velocity = np.where(days > 0, bugs / np.maximum(days, 1), bugs)
+
+    # Rough estimate of the total changes with a cumulative sum of the lines
+    df_commits = df_commits.assign(date=_to_datetime64(df_commits["date"])) \
+                           .sort_values("date", kind="stable")
+    commits_dates = df_commits["date"].values
+    lines = np.concatenate([[0], np.cumsum(df_commits["lines"].fillna(0).values)])
+    lower = np.searchsorted(commits_dates, start_dates, side="left")
+    upper = np.searchsorted(commits_dates, end_dates, side="right")
+    changes = lines[upper] - lines[lower]
+
+    # Average seniorship of the team, from the first commit of each committer
+    committer_codes, committers = pd.factorize(df_commits["committer"])
+    first_commit_dates = df_commits.groupby(committer_codes)["date"].min() \
+                                   .reindex(range(len(committers))).values
+    avg_team_xp = np.zeros(len(df_versions))
+    for i in range(len(df_versions)):
+        team = np.unique(committer_codes[lower[i]:upper[i]])
+        team = team[team >= 0]
+        if len(team) > 0:
+            seniority = (end_dates[i] - first_commit_dates[team]) // np.timedelta64(1, "D")
+            avg_team_xp[i] = seniority.sum() / len(team)
+
+    return pd.DataFrame({
+        "version_id": df_versions["version_id"].values,
+        "bugs": bugs.astype(int),
+        "bug_velocity": bug_velocity,
+        "changes": changes.astype(int),
+        "avg_team_xp": avg_team_xp,
+    })
+
+def _to_datetime64(dates) -> np.ndarray:
+    """Naive datetime64 values, as dates are stored without timezone in the database"""
+    dates = pd.Series(dates)
+    if dates.dtype == object:
+        dates = dates.map(lambda date: date.replace(tzinfo=None) if getattr(date, "tzinfo", None) else date)
+    dates = pd.to_datetime(dates)
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.values.astype("datetime64[us]")
 
 @timeit
 def assess_next_release_risk(session, configuration: Configuration, project_id:int):
@@ -142,14 +168,9 @@ def assess_next_release_risk(session, configuration: Configuration, project_id:i
     included_and_current_versions = get_included_and_current_versions_filter(session, configuration)
 
     # Get the version metrics and the average cyclomatic complexity
-    metrics_statement = session.query(Version, Metric) \
-        .filter(Version.project_id == project_id) \
-        .filter(Version.include_filter(included_and_current_versions)) \
-        .filter(Version.exclude_filter(excluded_versions)) \
-        .join(Metric, Metric.version_id == Version.version_id) \
-        .order_by(Version.start_date.asc()).statement
-    logging.debug(metrics_statement)
-    df = pd.read_sql(metrics_statement, session.get_bind())
+    df = FeatureStore(project_id, session, configuration) \
+        .get_versions(["name", "bugs", "bug_velocity", "changes", "avg_team_xp", "lizard_avg_complexity",
+                       "code_churn_avg"], included_and_current_versions, excluded_versions, with_metrics=True)
 
     # TODO : we should Remove outliers in the dataframe
     # while preserving the "Next Release" row
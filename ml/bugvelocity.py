@@ -5,9 +5,8 @@ from sklearn.model_selection import train_test_split
 import pandas as pd
 
 from ml.ml import ml
-from models.metric import Metric
 from models.version import Version
-from utils.database import get_included_and_current_versions_filter
+from utils.featurestore import FeatureStore
 from utils.timeit import timeit
 
 
@@ -29,13 +28,9 @@ class BugVelocity(ml):
         included_versions = self.configuration.include_versions
         excluded_versions = self.configuration.exclude_versions
 
-        releases_statement = self.session.query(Version). \
-            order_by(Version.start_date.asc()) \
-            .filter(Version.project_id == self.project_id) \
-            .filter(Version.include_filter(included_versions)) \
-            .filter(Version.exclude_filter(excluded_versions)) \
-            .filter(Version.name != self.configuration.next_version_name).statement
-        df = pd.read_sql(releases_statement, self.session.get_bind())
+        df = FeatureStore(self.project_id, self.session, self.configuration) \
+            .get_versions(["name", "bug_velocity", "bugs"], included_versions, excluded_versions)
+        df = df[df["name"] != self.configuration.next_version_name]
         X=df[['bug_velocity']]
         y=df[['bugs']].values.ravel()
 
@@ -5,14 +5,34 @@ from sklearn.metrics import mean_squared_error
 from sklearn.model_selection import train_test_split
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
-from sqlalchemy.orm import defer
 
 from ml.ml import ml
-from models.metric import Metric
-from models.version import Version
+from utils.featurestore import FeatureStore
 from utils.timeit import timeit
 from xgboost import XGBRegressor
 
+# Columns of the feature store used by the model, bugs is the target
+CODE_METRICS_COLUMNS = ["avg_team_xp", "bug_velocity", "bugs",
+                        "lizard_total_nloc", "lizard_avg_nloc", "lizard_avg_token",
+                        "lizard_fun_count", "lizard_fun_rt", "lizard_nloc_rt",
+                        "lizard_total_complexity", "lizard_avg_complexity",
+                        "lizard_total_operands_count", "lizard_unique_operands_count",
+                        "lizard_total_operators_count", "lizard_unique_operators_count",
+                        "comments_rt", "total_lines", "total_blank_lines",
+                        "total_comments", "ck_cbo", "ck_cbo_modified", "ck_fan_in",
+                        "ck_fan_out", "ck_dit", "ck_noc", "ck_nom", "ck_nopm",
+                        "ck_noprm", "ck_num_fields", "ck_num_methods",
+                        "ck_num_visible_methods", "ck_nosi", "ck_rfc", "ck_wmc",
+                        "ck_loc", "ck_lcom", "ck_qty_loops", "ck_qty_comparisons",
+                        "ck_qty_returns", "ck_qty_try_catch", "ck_qty_parenth_exps",
+                        "ck_qty_str_literals", "ck_qty_numbers", "ck_qty_math_operations",
+                        "ck_qty_math_variables", "ck_qty_nested_blocks",
+                        "ck_qty_ano_inner_cls_and_lambda", "ck_qty_unique_words", "ck_numb_log_stmts",
+                        "ck_has_javadoc", "ck_modifiers", "ck_usage_vars",
+                        "ck_usage_fields", "ck_method_invok", "halstead_length",
+                        "halstead_vocabulary", "halstead_volume", "halstead_difficulty",
+                        "halstead_effort", "halstead_time", "halstead_bugs"]
+
 
 class CodeMetrics(ml):
     def __init__(self, project_id, session, config):
@@ -26,34 +46,12 @@ class CodeMetrics(ml):
         included_versions = self.configuration.include_versions
         excluded_versions = self.configuration.exclude_versions
 
-        versions_metrics_statement = self.session.query(Version.avg_team_xp, Version.bug_velocity, Version.bugs,
-                                   Metric.lizard_total_nloc, Metric.lizard_avg_nloc, Metric.lizard_avg_token,
-                                   Metric.lizard_fun_count, Metric.lizard_fun_rt, Metric.lizard_nloc_rt,
-                                   Metric.lizard_total_complexity, Metric.lizard_avg_complexity,
-                                   Metric.lizard_total_operands_count, Metric.lizard_unique_operands_count,
-                                   Metric.lizard_total_operators_count, Metric.lizard_unique_operators_count,
-                                   Metric.comments_rt, Metric.total_lines, Metric.total_blank_lines,
-                                   Metric.total_comments, Metric.ck_cbo, Metric.ck_cbo_modified, Metric.ck_fan_in,
-                                   Metric.ck_fan_out, Metric.ck_dit, Metric.ck_noc, Metric.ck_nom, Metric.ck_nopm,
-                                   Metric.ck_noprm, Metric.ck_num_fields, Metric.ck_num_methods,
-                                   Metric.ck_num_visible_methods, Metric.ck_nosi, Metric.ck_rfc, Metric.ck_wmc,
-                                   Metric.ck_loc, Metric.ck_lcom, Metric.ck_qty_loops, Metric.ck_qty_comparisons,
-                                   Metric.ck_qty_returns, Metric.ck_qty_try_catch, Metric.ck_qty_parenth_exps,
-                                   Metric.ck_qty_str_literals, Metric.ck_qty_numbers, Metric.ck_qty_math_operations,
-                                   Metric.ck_qty_math_variables, Metric.ck_qty_nested_blocks,
-                                   Metric.ck_qty_ano_inner_cls_and_lambda, Metric.ck_qty_unique_words, Metric.ck_numb_log_stmts,
-                                   Metric.ck_has_javadoc, Metric.ck_modifiers, Metric.ck_usage_vars,
-                                   Metric.ck_usage_fields, Metric.ck_method_invok, Metric.halstead_length,
-                                   Metric.halstead_vocabulary, Metric.halstead_volume, Metric.halstead_difficulty,
-                                   Metric.halstead_effort, Metric.halstead_time, Metric.halstead_bugs). \
-            order_by(Version.end_date.desc()). \
-            filter(Version.project_id == self.project_id). \
-            filter(Version.include_filter(included_versions)). \
-            filter(Version.exclude_filter(excluded_versions)). \
-            filter(Metric.version_id == Version.version_id). \
-            filter(Version.name != self.configuration.next_version_name).statement
-
-        dataframe = pd.read_sql(versions_metrics_statement, self.session.get_bind())
+        dataframe = FeatureStore(self.project_id, self.session, self.configuration) \
+            .get_versions(["name", "end_date"] + CODE_METRICS_COLUMNS, included_versions, excluded_versions,
+                          with_metrics=True)
+        dataframe = dataframe[dataframe["name"] != self.configuration.next_version_name] \
+            .sort_values("end_date", ascending=False) \
+            .drop(columns=["name", "end_date"])
         dataframe = dataframe.dropna(axis=1, how='any', thresh=None, subset=None)
         X = dataframe.drop('bugs', axis=1)
         y = dataframe[['bugs']].values.ravel()
@@ -82,31 +80,10 @@ class CodeMetrics(ml):
         """Predict the next value"""
         logging.info("CodeMetrics::predict")
         self.restore()  # unpickle the model
-        versions_metrics_statement = self.session.query(Version.avg_team_xp, Version.bug_velocity, Version.bugs,
-                                   Metric.lizard_total_nloc, Metric.lizard_avg_nloc, Metric.lizard_avg_token,
-                                   Metric.lizard_fun_count, Metric.lizard_fun_rt, Metric.lizard_nloc_rt,
-                                   Metric.lizard_total_complexity, Metric.lizard_avg_complexity,
-                                   Metric.lizard_total_operands_count, Metric.lizard_unique_operands_count,
-                                   Metric.lizard_total_operators_count, Metric.lizard_unique_operators_count,
-                                   Metric.comments_rt, Metric.total_lines, Metric.total_blank_lines,
-                                   Metric.total_comments, Metric.ck_cbo, Metric.ck_cbo_modified, Metric.ck_fan_in,
-                                   Metric.ck_fan_out, Metric.ck_dit, Metric.ck_noc, Metric.ck_nom, Metric.ck_nopm,
-                                   Metric.ck_noprm, Metric.ck_num_fields, Metric.ck_num_methods,
-                                   Metric.ck_num_visible_methods, Metric.ck_nosi, Metric.ck_rfc, Metric.ck_wmc,
-                                   Metric.ck_loc, Metric.ck_lcom, Metric.ck_qty_loops, Metric.ck_qty_comparisons,
-                                   Metric.ck_qty_returns, Metric.ck_qty_try_catch, Metric.ck_qty_parenth_exps,
-                                   Metric.ck_qty_str_literals, Metric.ck_qty_numbers, Metric.ck_qty_math_operations,
-                                   Metric.ck_qty_math_variables, Metric.ck_qty_nested_blocks,
-                                   Metric.ck_qty_ano_inner_cls_and_lambda, Metric.ck_qty_unique_words, Metric.ck_numb_log_stmts,
-                                   Metric.ck_has_javadoc, Metric.ck_modifiers, Metric.ck_usage_vars,
-                                   Metric.ck_usage_fields, Metric.ck_method_invok, Metric.halstead_length,
-                                   Metric.halstead_vocabulary, Metric.halstead_volume, Metric.halstead_difficulty,
-                                   Metric.halstead_effort, Metric.halstead_time, Metric.halstead_bugs) \
-            .filter(Version.project_id == self.project_id) \
-            .filter(Metric.version_id == Version.version_id) \
-            .order_by(Version.end_date.asc()) \
-            .filter(Version.name == self.configuration.next_version_name).statement
-        dataframe = pd.read_sql(versions_metrics_statement, self.session.get_bind())
+        dataframe = FeatureStore(self.project_id, self.session, self.configuration) \
+            .get_versions(["name"] + CODE_METRICS_COLUMNS, with_metrics=True)
+        dataframe = dataframe[dataframe["name"] == self.configuration.next_version_name] \
+            .drop(columns=["name"])
         dataframe = dataframe.iloc[0]
 
         prediction_dataframe = self.model.predict(dataframe)
@@ -1,12 +1,8 @@
 import logging
-import pickle
 from abc import abstractmethod, ABC
-from datetime import datetime
-
-from sqlalchemy import and_
 
+from ml.registry import ModelRegistry
 from utils.timeit import timeit
-from models.model import Model
 
 
 class ml(ABC):
@@ -32,37 +28,15 @@ class ml(ABC):
 
     @timeit
     def store(self):
-        """Store a serialized trained model """
+        """Store the trained model into the model registry"""
         logging.info('store model ' + self.name)
-        model_in_db = self.session.query(Model).filter(and_(Model.name == self.name, Model.project_id == self.project_id)).first()
-        if model_in_db is None:
-            logging.info('insert the new model')
-            model_in_db = Model(
-                project_id = self.project_id,
-                name = self.name,
-                updated_at = datetime.now(),
-                mean_squared_error = self.mse,
-                data = pickle.dumps(self.model)
-                )
-            self.session.add(model_in_db)
-            self.session.commit()
-        else:
-            logging.info('update the existing model')
-            model_in_db.updated_at = datetime.now()
-            model_in_db.mean_squared_error = self.mse
-            model_in_db.data = pickle.dumps(self.model)
-            self.session.commit()
+        ModelRegistry(self.session, self.configuration).save(self.project_id, self.name, self.model, self.mse)
 
     @timeit
     def restore(self):
-        """Restore a pickled model"""
+        """Restore the model from the model registry, loaded once per process"""
         logging.info('restore model ' + self.name)
-        model_in_db = self.session.query(Model).filter(and_(Model.name == self.name, Model.project_id == self.project_id)).first()
-        if model_in_db is None:
-            logging.error('Cannot find model ' + self.name)
-            self.model = None
-        else:
-            self.model = pickle.loads(model_in_db.data)
+        self.model = ModelRegistry(self.session, self.configuration).load(self.project_id, self.name)
 
     @abstractmethod
     def train(self):
@@ -0,0 +1,128 @@
+import logging
+import os
+import pickle
+from datetime import datetime
+from typing import Dict, Tuple
+
+import joblib
+from sqlalchemy import and_
+
+from models.model import Model
+
+JOBLIB_FORMAT = "joblib"
+XGBOOST_FORMAT = "xgboost"
+
+# Models already loaded by this process, by (project_id, name, updated_at)
+_loaded_models: Dict[Tuple, object] = {}
+
+class ModelRegistry:
+    """
+    Store of the trained models
+
+    The model row keeps the metadata, the estimator is written into a file of
+    OTTM_MODEL_DIR: the XGBoost models in their native format (save_raw),
+    the other ones with joblib (numpy arrays memory-mapped when loaded). The
+    row keeps the file name, the file is looked for in OTTM_MODEL_DIR.
+    A model is loaded once per process, until it is trained again.
+
+    Attributes:
+    -----------
+     - session      Database connection managed by sqlachemy
+     - directory    Folder of the artifacts
+    """
+
+    def __init__(self, session, config):
+        self.session = session
+        self.directory = config.model_dir
+
+    def save(self, project_id: int, name: str, estimator, mean_squared_error: float):
+        """Save a trained model, replacing the previous one"""
+        model_in_db = self.__get_model(project_id, name)
+        if model_in_db is None:
+            logging.info('insert the new model')
+            model_in_db = Model(project_id=project_id, name=name)
+            self.session.add(model_in_db)
+        else:
+            logging.info('update the existing model')
+        previous_path = self.__get_artifact_path(model_in_db)
+
+        updated_at = datetime.now()
+        artifact_format = XGBOOST_FORMAT if hasattr(estimator, "get_booster") else JOBLIB_FORMAT
+        os.makedirs(self.directory, exist_ok=True)
+        artifact_name = f"{project_id}-{name}-{updated_at:%Y%m%d%H%M%S%f}.{artifact_format}"
+        artifact_path = os.path.join(self.directory, artifact_name)
+        if artifact_format == XGBOOST_FORMAT:
+            with open(artifact_path, "wb") as file:
+                file.write(_save_raw(estimator.get_booster()))
+        else:
+            joblib.dump(estimator, artifact_path)
+
+        model_in_db.updated_at = updated_at
+        model_in_db.mean_squared_error = mean_squared_error
+        # Relative to the folder of the artifacts, wherever it is configured
+        model_in_db.artifact_path = artifact_name
+        model_in_db.artifact_format = artifact_format
+        model_in_db.data = None
+        self.session.commit()
+        self.__cache(project_id, name, updated_at, estimator)
+
+        if previous_path and previous_path != artifact_path and os.path.exists(previous_path):
+            os.remove(previous_path)
+
+    def load(self, project_id: int, name: str):
+        """Return the estimator of a trained model, None if it isn't found"""
+        model_in_db = self.__get_model(project_id, name)
+        if model_in_db is None:
+            logging.error('Cannot find model ' + name)
+            return None
+        key = (project_id, name, model_in_db.updated_at)
+        if key not in _loaded_models:
+            artifact_path = self.__get_artifact_path(model_in_db)
+            if artifact_path is not None and not os.path.exists(artifact_path):
+                logging.error('Cannot find the artifact of model ' + name + ': ' + artifact_path)
+                return None
+            self.__cache(project_id, name, model_in_db.updated_at,
+                         self.__read_artifact(model_in_db, artifact_path))
+        return _loaded_models[key]
+
+    def __get_artifact_path(self, model_in_db: Model) -> str:
+        """
+        Path of the artifact in the configured folder, None for the models stored
+        before the registry. The models saved with a path keep their file name
+        """
+        if model_in_db.artifact_path is None:
+            return None
+        return os.path.join(self.directory, os.path.basename(model_in_db.artifact_path))
+
+    def __get_model(self, project_id: int, name: str) -> Model:
+        return self.session.query(Model).filter(and_(Model.name == name, Model.project_id == project_id)).first()
+
+    @staticmethod
+    def __cache(project_id: int, name: str, updated_at: datetime, estimator):
+        """Keep the last version of the model only"""
+        for key in [key for key in _loaded_models if key[:2] == (project_id, name)]:
+            del _loaded_models[key]
+        _loaded_models[(project_id, name, updated_at)] = estimator
+
+    @staticmethod
+    def __read_artifact(model_in_db: Model, artifact_path: str):
+        if artifact_path is None:
+            # Stored before the registry
+            return pickle.loads(model_in_db.data)
+        if model_in_db.artifact_format == XGBOOST_FORMAT:
+            from xgboost import XGBRegressor
+            estimator = XGBRegressor()
+            with open(artifact_path, "rb") as file:
+                estimator.load_model(bytearray(file.read()))
+            return estimator
+        return joblib.load(artifact_path, mmap_mode="r")
+
+def _save_raw(booster) -> bytearray:
+    """
+    Serialize a booster in the UBJSON format where available (XGBoost >= 1.6), the
+    feature names are kept with the model, unlike with the legacy binary format
+    """
+    try:
+        return booster.save_raw(raw_format="ubj")
+    except TypeError:
+        return booster.save_raw()
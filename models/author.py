@@ -4,5 +4,5 @@ from models.database import Base
 class Author(Base):
     __tablename__ = "author"
     author_id = Column(Integer, primary_key=True)
-    name = Column(String)
+    name = Column(String, index=True)
     email = Column(String)
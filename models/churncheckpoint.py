@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from models.database import Base
+
+class ChurnCheckpoint(Base):
+    """
+    State of the code churn computation, the next run only walks the commits
+    that were added since the last walked commit
+
+    Attributes
+    ----------
+    project_id : int
+        Identifier of the project
+    commit_hash : str
+        Last walked commit
+    commit_date : datetime
+        Date of the most recent walked commit
+    data : str
+        JSON document with the churn of each version (values of the closed
+        versions, per-file accumulators of the open ones)
+    """
+    __tablename__ = "churn_checkpoint"
+    churn_checkpoint_id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("project.project_id"), unique=True)
+    commit_hash = Column(String)
+    commit_date = Column(DateTime)
+    data = Column(Text)
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, Text
+from models.database import Base
+
+class CkClass(Base):
+    """
+    CK values of a class, keyed by the git blob hash of the file declaring it
+    The files that didn't change since a previous version aren't analyzed again
+
+    Attributes
+    ----------
+    blob_hash : str
+        Git blob hash of the file content
+    tool_version : str
+        CK jar that computed the values
+    class_name : str
+        Name of the class, None for a file without any class
+    values : str
+        JSON of the class values (wmc, dit...) and of the sums and counts of the
+        values of its methods, fields and variables
+    """
+    __tablename__ = "ck_class"
+    ck_class_id = Column(Integer, primary_key=True)
+    blob_hash = Column(String, index=True)
+    tool_version = Column(String)
+    class_name = Column(String)
+    values = Column(Text)
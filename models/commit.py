@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Index, Boolean
 from sqlalchemy.orm import relationship, backref
 from models.database import Base
 
@@ -35,12 +35,19 @@ class Commit(Base):
         DMM metric value for the unit complexity property
     dmm_unit_interfacing : float
         DMM metric value for the unit interfacing property
+    dmm_computed : bool
+        True once the DMM metrics were computed, they are None for the merges
+        and the commits without supported language changes
     """
     __tablename__ = "commit"
+    __table_args__ = (
+        Index("ix_commit_project_id_hash", "project_id", "hash", unique=True),
+        Index("ix_commit_project_id_date", "project_id", "date"),
+    )
     commit_id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey("project.project_id"))
     hash = Column(String)
-    committer = Column(String)
+    committer = Column(String, index=True)
     date = Column(DateTime)
     message = Column(String)
     insertions = Column(Integer)
@@ -50,3 +57,4 @@ class Commit(Base):
     dmm_unit_size = Column(Float)
     dmm_unit_complexity = Column(Float)
     dmm_unit_interfacing = Column(Float)
+    dmm_computed = Column(Boolean)
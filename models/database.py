@@ -1,3 +1,6 @@
+import logging
+
+from sqlalchemy import Index, Table, func, inspect, select
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -5,3 +8,49 @@ Base = declarative_base()
 def setup_database(engine):
     """Create the database schema from models"""
     Base.metadata.create_all(bind=engine)
+    migrate_database(engine)
+
+def migrate_database(engine):
+    """
+    Add the nullable columns and the indexes declared in the models to the
+    databases created before they existed (create_all doesn't change the
+    existing tables)
+    Before creating a unique index, the duplicated rows are removed
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns or not column.nullable:
+                continue
+            logging.info("Adding column " + column.name + " to " + table.name)
+            quote = engine.dialect.identifier_preparer.quote
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+                                           f"{column_type}")
+            existing_columns.add(column.name)
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            if any(column.name not in existing_columns for column in index.columns):
+                logging.warning("Index " + index.name + " not created, the table " + table.name +
+                                " lacks some of its columns")
+                continue
+            logging.info("Creating index " + index.name)
+            with engine.begin() as connection:
+                if index.unique:
+                    _remove_duplicated_rows(connection, table, index)
+                index.create(bind=connection)
+
+def _remove_duplicated_rows(connection, table: Table, index: Index):
+    """Keep the first row (lowest primary key) of each value of the index"""
+    primary_key = list(table.primary_key.columns)[0]
+    first_rows = select(func.min(primary_key).label("row_id")) \
+                 .group_by(*index.columns).subquery()
+    result = connection.execute(table.delete().where(primary_key.not_in(select(first_rows.c.row_id))))
+    if result.rowcount:
+        logging.info(f"{result.rowcount} duplicated row(s) removed from {table.name}")
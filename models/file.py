@@ -6,5 +6,5 @@ class File(Base):
     """File in the repository"""
     __tablename__ = "file"
     file_id = Column(Integer, primary_key=True)
-    path = Column(String)
+    path = Column(String, index=True)
     language = Column(String)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint
+from models.database import Base
+
+class FileAge(Base):
+    """
+    Date of the last modification of each file of the project, updated in
+    place as new commits are indexed (see LegacyConnector.update_file_age_index)
+
+    Attributes
+    ----------
+    project_id : int
+        Identifier of the project
+    path : str
+        Current path of the file
+    last_modification : datetime
+        UTC date of the last commit that modified the file
+    """
+    __tablename__ = "file_age"
+    __table_args__ = (UniqueConstraint("project_id", "path"),)
+    file_age_id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("project.project_id"))
+    path = Column(String)
+    last_modification = Column(DateTime)
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, ForeignKey
+from models.database import Base
+
+class FileAgeCheckpoint(Base):
+    """
+    Last commit indexed into the file_age and file_modification tables,
+    the next update only walks the commits added since then
+
+    Attributes
+    ----------
+    project_id : int
+        Identifier of the project
+    commit_hash : str
+        Last indexed commit
+    """
+    __tablename__ = "file_age_checkpoint"
+    file_age_checkpoint_id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("project.project_id"), unique=True)
+    commit_hash = Column(String)
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
+from models.database import Base
+
+class FileModification(Base):
+    """
+    Modification of an existing file by a commit, with the date of the
+    previous modification of the file. The legacy files of a version are
+    the ones whose previous modification is old enough
+
+    Attributes
+    ----------
+    project_id : int
+        Identifier of the project
+    commit_hash : str
+        Commit modifying the file
+    old_path : str
+        Path of the file before the commit
+    new_path : str
+        Path of the file after the commit
+    date : datetime
+        UTC date of the commit
+    previous_date : datetime
+        UTC date of the previous modification of the file
+    """
+    __tablename__ = "file_modification"
+    __table_args__ = (Index("ix_file_modification_project_id_commit_hash", "project_id", "commit_hash"),)
+    file_modification_id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey("project.project_id"))
+    commit_hash = Column(String)
+    old_path = Column(String)
+    new_path = Column(String)
+    date = Column(DateTime)
+    previous_date = Column(DateTime)
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from models.database import Base
+
+class HttpCache(Base):
+    """
+    Last response of an issue tracker API for an URL, sent back as
+    If-None-Match so that the unchanged pages are answered by 304 Not Modified
+
+    Attributes
+    ----------
+    url : str
+        URL of the request, query string included
+    etag : str
+        ETag header of the response
+    link : str
+        Link header of the response (pagination)
+    body : str
+        Body of the response
+    updated_at : datetime
+        Date of the response
+    """
+    __tablename__ = "http_cache"
+    http_cache_id = Column(Integer, primary_key=True)
+    url = Column(String, unique=True)
+    etag = Column(String)
+    link = Column(Text)
+    body = Column(Text)
+    updated_at = Column(DateTime)
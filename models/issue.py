@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint, Index
 from models.database import Base
 
 class Issue(Base):
@@ -13,4 +13,6 @@ class Issue(Base):
     updated_at = Column(DateTime)
     __table_args__ = (
         UniqueConstraint("project_id", "number", "source"),
+        Index("ix_issue_project_id_created_at", "project_id", "created_at"),
+        Index("ix_issue_project_id_source_updated_at", "project_id", "source", "updated_at"),
     )
\ No newline at end of file
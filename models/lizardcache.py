@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, Float, Text, UniqueConstraint
+from models.database import Base
+
+class LizardCache(Base):
+    """
+    Lizard values of a source file, keyed by the git blob hash of its content
+    Identical files are only analyzed once across versions
+
+    Attributes
+    ----------
+    blob_hash : str
+        Git blob hash of the file content
+    extension : str
+        Suffix of the file, lizard picks the language reader from it
+    tool_version : str
+        Version of lizard and of the LizardExtension that computed the values
+    nloc, token_count, nb_functions, total_complexity, average_complexity : int, float
+        Lizard values of the file
+    nb_operands, operands, nb_operators, operators : int, str
+        Number of operands / operators, the unique ones as a JSON list
+    nb_lines, nb_blank_lines : int
+        Line counts of the file
+    hits : int
+        Number of times the values were reused
+    """
+    __tablename__ = "lizard_cache"
+    __table_args__ = (UniqueConstraint("blob_hash", "extension", "tool_version"),)
+    lizard_cache_id = Column(Integer, primary_key=True)
+    blob_hash = Column(String, index=True)
+    extension = Column(String)
+    tool_version = Column(String)
+    nloc = Column(Integer)
+    token_count = Column(Integer)
+    nb_functions = Column(Integer)
+    total_complexity = Column(Integer)
+    average_complexity = Column(Float)
+    nb_operands = Column(Integer)
+    operands = Column(Text)
+    nb_operators = Column(Integer)
+    operators = Column(Text)
+    nb_lines = Column(Integer)
+    nb_blank_lines = Column(Integer)
+    hits = Column(Integer, default=0)
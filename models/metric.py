@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, ForeignKey, Float
+import time
+from sqlalchemy import BigInteger, Column, Integer, ForeignKey, Float
 from sqlalchemy.orm import relationship, backref
 from models.database import Base
 from models.version import Version
@@ -84,4 +85,7 @@ class Metric(Base):
     halstead_bugs = Column(Float)
 
     # legacy
-    nb_legacy_files = Column(Integer)
\ No newline at end of file
+    nb_legacy_files = Column(Integer)
+
+    # Time of the last write in nanoseconds, the feature store is built again when it changes
+    revision = Column(BigInteger, default=time.time_ns, onupdate=time.time_ns)
\ No newline at end of file
@@ -3,6 +3,10 @@ from sqlalchemy.orm import relationship, backref
 from models.database import Base
 
 class Model(Base):
+    """
+    Trained model of a project, its artifact is a file of the model registry
+    (data holds the pickled estimator of the models stored before the registry)
+    """
     __tablename__ = "model"
     model_id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey("project.project_id"))
@@ -10,4 +14,5 @@ class Model(Base):
     updated_at = Column(DateTime)
     mean_squared_error = Column(Float)
     data = Column(LargeBinary)
-
+    artifact_path = Column(String)
+    artifact_format = Column(String)
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, UniqueConstraint
+from models.database import Base
+
+class PipelineProgress(Base):
+    """
+    Progress of a stage of populate (legacy, lizard, ck) for a version
+    A stage is done again only if its inputs or its tool changed, or if it
+    didn't complete
+
+    Attributes
+    ----------
+    version_id : int
+        Identifier of the version
+    stage : str
+        Name of the stage
+    status : str
+        running, done or failed
+    duration : float
+        Seconds spent by the stage
+    fingerprint : str
+        Hash of the inputs of the stage (tree of the version, configuration)
+    tool_version : str
+        Version of the tool that ran the stage
+    error : str
+        Message of the error when the stage failed
+    updated_at : datetime
+        Date of the last change of status
+    """
+    __tablename__ = "pipeline_progress"
+    __table_args__ = (UniqueConstraint("version_id", "stage"),)
+    pipeline_progress_id = Column(Integer, primary_key=True)
+    version_id = Column(Integer, ForeignKey("version.version_id"))
+    stage = Column(String)
+    status = Column(String)
+    duration = Column(Float)
+    fingerprint = Column(String)
+    tool_version = Column(String)
+    error = Column(String)
+    updated_at = Column(DateTime)
@@ -1,5 +1,6 @@
 import logging
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, DateTime, Float
+import time
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, Table, DateTime, Float, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.hybrid import hybrid_method
 from models.database import Base
@@ -9,6 +10,7 @@ class Version(Base):
     Versions end when they are published
     """
     __tablename__ = "version"
+    __table_args__ = (Index("ix_version_project_id_name", "project_id", "name"),)
     version_id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey("project.project_id"))
     # By convention, the next version is nammed "Next Release"
@@ -33,6 +35,8 @@ class Version(Base):
     code_churn_max = Column(Integer)
     # Average code churn per file
     code_churn_avg = Column(Float)
+    # Time of the last write in nanoseconds, the feature store is built again when it changes
+    revision = Column(BigInteger, default=time.time_ns, onupdate=time.time_ns)
 
     @hybrid_method
     def include_filter(self, included_versions):
@@ -1,3 +1,12 @@
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import urllib.parse
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
 from dotenv import load_dotenv
 
@@ -5,3 +14,191 @@ from dotenv import load_dotenv
 @pytest.fixture
 def helpers():
     load_dotenv()
+
+
+def create_repo(directory, files):
+    """Create a git repository with a single commit tagged v1"""
+    for path, content in files.items():
+        file_path = directory / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(content)
+    for args in (["init", "-q"], ["add", "."],
+                 ["-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-m", "init"],
+                 ["tag", "v1"]):
+        subprocess.run(["git"] + args, cwd=directory, check=True)
+    return str(directory)
+
+
+def commit_files(directory, files, date, tag=None):
+    """
+    Commit the files of a repository at a date (author and committer), a None
+    content deletes the file. Return the hash of the commit
+    """
+    for path, content in files.items():
+        if content is None:
+            (directory / path).unlink()
+        else:
+            (directory / path).parent.mkdir(parents=True, exist_ok=True)
+            (directory / path).write_text(content)
+    env = dict(os.environ, GIT_AUTHOR_DATE=date.isoformat(), GIT_COMMITTER_DATE=date.isoformat())
+    for args in (["add", "-A"],
+                 ["-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-m", date.isoformat()]):
+        subprocess.run(["git"] + args, cwd=directory, env=env, check=True)
+    if tag:
+        subprocess.run(["git", "tag", tag], cwd=directory, check=True)
+    return subprocess.run(["git", "rev-parse", "HEAD"], cwd=directory, stdout=subprocess.PIPE,
+                          text=True, check=True).stdout.strip()
+
+
+class RecordedHttpServer:
+    """
+    Local stand-in of an issue tracker API replaying recorded responses
+
+    Attributes:
+    -----------
+     - pages        Recorded responses by path (query string included): body or (body, headers),
+                    {url} in the headers is replaced by the URL of the server. A function of the
+                    path returning the response (None if not found) generates the responses instead
+     - rate_limit   Number of requests allowed by window of reset_delay seconds, None if unlimited
+     - latency      Seconds waited before each response, emulates the network
+     - rate_limit_prefix  Prefix of the rate limit headers, X-RateLimit- (GitHub) or RateLimit- (GitLab)
+     - requests     (path, status) of the requests received
+    """
+
+    def __init__(self, pages, rate_limit=None, reset_delay=1, latency=0, rate_limit_prefix="X-RateLimit-"):
+        self.pages = pages
+        self.latency = latency
+        self.rate_limit_prefix = rate_limit_prefix
+        self.rate_limit = rate_limit
+        self.reset_delay = reset_delay
+        self.requests = []
+        self.__remaining = rate_limit
+        self.__reset = time.time() + reset_delay
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__handler())
+        self.url = f"http://127.0.0.1:{self.__server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def _respond(self, path, if_none_match):
+        """Status, headers and body of the response to a request"""
+        page = self.pages(path) if callable(self.pages) else self.pages.get(path)
+        if page is None:
+            return 404, {}, b"{}"
+        body, headers = page if isinstance(page, tuple) else (page, {})
+        body = json.dumps(body).encode()
+        headers = {name: value.replace("{url}", self.url) for name, value in headers.items()}
+        headers["ETag"] = '"' + hashlib.sha1(body).hexdigest() + '"'
+        with self.__lock:
+            if self.rate_limit is not None and time.time() >= self.__reset:
+                self.__remaining = self.rate_limit
+                self.__reset = time.time() + self.reset_delay
+            if if_none_match == headers["ETag"]:
+                # Conditional requests don't count in the rate limit
+                status, body = 304, b""
+            elif self.rate_limit is not None and self.__remaining == 0:
+                status, body = 403, b'{"message": "API rate limit exceeded"}'
+            else:
+                status = 200
+                if self.rate_limit is not None:
+                    self.__remaining -= 1
+            if self.rate_limit is not None:
+                headers[self.rate_limit_prefix + "Limit"] = str(self.rate_limit)
+                headers[self.rate_limit_prefix + "Remaining"] = str(self.__remaining)
+                headers[self.rate_limit_prefix + "Reset"] = str(int(self.__reset + 0.999))
+            self.requests.append((path, status))
+        return status, headers, body
+
+    def __handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(server.latency)
+                status, headers, body = server._respond(self.path, self.headers.get("If-None-Match"))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def jira_issue(i):
+    date = f"2022-01-{i % 28 + 1:02d}T10:00:00.000+0000"
+    return {"key": f"PRJ-{i}", "fields": {"summary": f"Issue {i}", "created": date, "updated": date,
+                                          "reporter": {"displayName": "bot" if i % 10 == 0 else "dev"}}}
+
+
+def fake_jira_search(nb_issues, max_results=100):
+    """Responses of the search of a fake Jira REST API, the server caps maxResults"""
+    def search(path):
+        url = urllib.parse.urlsplit(path)
+        if url.path != "/rest/api/2/search":
+            return None
+        query = urllib.parse.parse_qs(url.query)
+        start = int(query.get("startAt", ["0"])[0])
+        size = min(int(query.get("maxResults", ["50"])[0]), max_results)
+        issues = [jira_issue(i) for i in range(start, min(start + size, nb_issues))]
+        return {"startAt": start, "maxResults": size, "total": nb_issues, "issues": issues}
+    return search
+
+
+def gitlab_api(issues, releases, per_page=2):
+    """
+    Responses of a fake GitLab REST API (v4), the issues are paginated by keyset:
+    each page links to the next one with a cursor
+    """
+    def api(path):
+        url = urllib.parse.urlsplit(path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path.endswith("/releases"):
+            return releases
+        if not url.path.endswith("/issues"):
+            return None
+        updated_after = query.get("updated_after", [""])[0]
+        selected = [issue for issue in issues if issue["updated_at"] > updated_after]
+        start = int(query.get("cursor", ["0"])[0])
+        headers = {}
+        if start + per_page < len(selected):
+            next_query = dict(query, cursor=[str(start + per_page)])
+            next_url = "{url}" + url.path + "?" + urllib.parse.urlencode(next_query, doseq=True)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return selected[start:start + per_page], headers
+    return api
+
+
+def github_api(issues, per_page=2):
+    """
+    Responses of a fake GitHub REST API (v3), the issues are paginated by page
+    number: the Link header of each page gives the next and the last ones
+    """
+    def api(path):
+        url = urllib.parse.urlsplit(path)
+        query = urllib.parse.parse_qs(url.query)
+        if not url.path.endswith("/issues"):
+            return None
+        since = query.get("since", [""])[0]
+        selected = sorted((issue for issue in issues if issue["updated_at"] >= since),
+                          key=lambda issue: issue["created_at"])
+        page = int(query.get("page", ["1"])[0])
+        last_page = max((len(selected) + per_page - 1) // per_page, 1)
+        links = []
+        for rel, number in (("next", page + 1), ("last", last_page)):
+            if page < last_page:
+                page_query = urllib.parse.urlencode(dict(query, page=[str(number)]), doseq=True)
+                links.append(f'<{{url}}{url.path}?{page_query}>; rel="{rel}"')
+        headers = {"Link": ", ".join(links)} if links else {}
+        return selected[(page - 1) * per_page:page * per_page], headers
+    return api
@@ -0,0 +1,50 @@
+"""
+Compare the commit ingestion of pydriller (one diff per commit) with the
+streaming git log --numstat parser used by GitConnector
+
+    python -m tests.benchmarks.bench_commit_ingestion [nb_commits]
+"""
+import sys
+import tempfile
+import time
+
+from pydriller import Repository
+
+from tests.benchmarks.synthetic_repo import create_synthetic_repo
+from utils.gitlog import iter_commits_numstat
+
+
+def ingest_with_pydriller(directory):
+    return [
+        (c.hash, c.committer.name, c.msg, c.insertions, c.deletions, c.lines, c.files)
+        for c in Repository(directory, only_no_merge=True).traverse_commits()
+    ]
+
+
+def ingest_with_git_log(directory):
+    return [
+        (c["hash"], c["committer"], c["message"], c["insertions"], c["deletions"], c["lines"], c["files"])
+        for c in iter_commits_numstat("git", directory)
+    ]
+
+
+def main(nb_commits):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        directory = create_synthetic_repo(tmp_dir, nb_commits)
+
+        start = time.perf_counter()
+        expected = ingest_with_pydriller(directory)
+        pydriller_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = ingest_with_git_log(directory)
+        git_log_time = time.perf_counter() - start
+
+    assert actual == expected, "git log parser and pydriller disagree"
+    print(f"{nb_commits} commits")
+    print(f"pydriller : {pydriller_time:.2f} s")
+    print(f"git log   : {git_log_time:.2f} s ({pydriller_time / git_log_time:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
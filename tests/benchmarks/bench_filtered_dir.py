@@ -0,0 +1,67 @@
+"""
+Compare the filtered copy of a repository (shutil.copytree) with the hard
+link view built by TmpDirCopyFilteredWithEnv
+
+    python -m tests.benchmarks.bench_filtered_dir [nb_files]
+"""
+import fnmatch
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from utils.dirs import TmpDirCopyFilteredWithEnv
+
+INCLUDE_FOLDERS = ["src/main"]
+EXCLUDE_FOLDERS = ["*/generated", "src/main/module1*"]
+
+
+def create_tree(directory, nb_files):
+    for i in range(nb_files):
+        folder = os.path.join(directory, "src", "main" if i % 4 else "test",
+                              f"module{i % 50}", "generated" if i % 10 == 0 else "core")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"File{i}.java"), "w") as f:
+            f.write(f"public class File{i} {{}}\n" * 200)
+
+
+def copy_filtered(src_dir, dst_dir):
+    """Previous implementation, copytree of each included folder"""
+    def ignore(path, names):
+        full_names = [os.path.join(path, n) for n in names]
+        ignored_full_names = []
+        for excluded_dir in EXCLUDE_FOLDERS:
+            ignored_full_names.extend(fnmatch.filter(full_names, os.path.join(src_dir, excluded_dir)))
+        return [os.path.basename(i) for i in ignored_full_names]
+
+    for d in INCLUDE_FOLDERS:
+        shutil.copytree(os.path.join(src_dir, d), os.path.join(dst_dir, d), ignore=ignore)
+
+
+def list_files(directory):
+    return sorted(os.path.relpath(os.path.join(root, f), directory)
+                  for root, _, filenames in os.walk(directory) for f in filenames)
+
+
+def main(nb_files):
+    with tempfile.TemporaryDirectory() as src_dir, tempfile.TemporaryDirectory() as copy_dir:
+        create_tree(src_dir, nb_files)
+
+        start = time.perf_counter()
+        copy_filtered(src_dir, copy_dir)
+        copy_time = time.perf_counter() - start
+        expected = list_files(copy_dir)
+
+        start = time.perf_counter()
+        with TmpDirCopyFilteredWithEnv(src_dir, INCLUDE_FOLDERS, EXCLUDE_FOLDERS) as tmp_work_dir:
+            link_time = time.perf_counter() - start
+            assert list_files(tmp_work_dir) == expected
+
+    print(f"{nb_files} files, {len(expected)} kept")
+    print(f"copytree   : {copy_time:.2f} s")
+    print(f"hard links : {link_time:.2f} s ({copy_time / link_time:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
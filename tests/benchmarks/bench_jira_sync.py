@@ -0,0 +1,80 @@
+"""
+Sync the issues of a fake Jira REST API, offline
+
+    python -m tests.benchmarks.bench_jira_sync [nb_issues] [nb_saved_one_by_one]
+
+Compare the previous save (one SELECT per issue) with the bulk upsert of
+save_issues, and the sequential fetch of the pages with the concurrent one (the server
+answers after LATENCY seconds).
+The save one by one is too slow for 100k issues, its time is measured on the
+first nb_saved_one_by_one issues and extrapolated.
+"""
+import sys
+import time
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from connectors.jira import JiraConnector
+from models.database import setup_database
+from models.issue import Issue
+from models.project import Project  # referenced by the issue table
+from tests.__fixtures__ import RecordedHttpServer, fake_jira_search, jira_issue
+from utils.date import date_iso_8601_to_datetime
+
+# Round trip of a request to a remote Jira, in seconds
+LATENCY = 0.1
+
+
+def create_session():
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    return sessionmaker(bind=engine)()
+
+
+def save_one_by_one(session, jira_issues):
+    """Previous implementation, one SELECT per issue"""
+    for issue in jira_issues:
+        existing_issue = session.query(Issue).filter(Issue.project_id == 1) \
+                                .filter(Issue.number == issue["key"]).filter(Issue.source == "jira").first()
+        if not existing_issue:
+            session.add(Issue(project_id=1, number=issue["key"], title=issue["fields"]["summary"], source="jira",
+                              created_at=date_iso_8601_to_datetime(issue["fields"]["created"]),
+                              updated_at=date_iso_8601_to_datetime(issue["fields"]["updated"])))
+    session.commit()
+
+
+def sync(server_url, nb_issues, workers):
+    session = create_session()
+    config = SimpleNamespace(jira_base_url=server_url, jira_project="PRJ", jira_email="", jira_token="",
+                             jira_issue_type=[], issue_tags=[], exclude_issuers=[],
+                             workers=workers, retry_delay=60, batch_size=1000)
+    start = time.perf_counter()
+    JiraConnector(1, session, config).create_issues()
+    elapsed = time.perf_counter() - start
+    assert session.query(Issue).count() == nb_issues
+    session.close()
+    return elapsed
+
+
+def main(nb_issues, nb_saved_one_by_one):
+    session = create_session()
+    start = time.perf_counter()
+    save_one_by_one(session, [jira_issue(i) for i in range(nb_saved_one_by_one)])
+    one_by_one_time = (time.perf_counter() - start) * nb_issues / nb_saved_one_by_one
+    session.close()
+
+    with RecordedHttpServer(fake_jira_search(nb_issues), latency=LATENCY) as server:
+        sequential_time = sync(server.url, nb_issues, workers=1)
+        concurrent_time = sync(server.url, nb_issues, workers=4)
+
+    print(f"{nb_issues} issues")
+    print(f"save one by one (extrapolated) : {one_by_one_time:.2f} s")
+    print(f"sync, 1 request at a time      : {sequential_time:.2f} s")
+    print(f"sync, 4 concurrent requests    : {concurrent_time:.2f} s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5000)
@@ -0,0 +1,85 @@
+"""
+Compare the language detection scanning the whole Linguist map on each call
+with the extension / file name indexes of guess_programing_language
+
+    python -m tests.benchmarks.bench_proglang [nb_paths] [nb_scanned_paths]
+
+The scan is too slow for 1M paths, its time is measured on the first
+nb_scanned_paths paths and extrapolated.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+from utils.proglang import LANGUAGES_FILE, guess_programing_language
+
+EXTENSIONS = [".java", ".py", ".c", ".h", ".cpp", ".js", ".ts", ".go", ".rs", ".kt", ".xml", ".md",
+              ".json", ".yml", ".txt", ".properties", ".class", ".png", ""]
+FILE_NAMES = ["Makefile", "Dockerfile", "pom.xml", "CMakeLists.txt", "README"]
+
+
+def create_paths(nb_paths, seed=42):
+    rng = random.Random(seed)
+    folders = [f"src/main/module{i}/package{j}" for i in range(50) for j in range(20)]
+    paths = []
+    for i in range(nb_paths):
+        if rng.random() < 0.02:
+            file_name = rng.choice(FILE_NAMES)
+        else:
+            file_name = f"File{i}{rng.choice(EXTENSIONS)}"
+        paths.append(rng.choice(folders) + "/" + file_name)
+    return paths
+
+
+def guess_with_scan(file_extension, language_map):
+    """Previous implementation, one scan of the Linguist map per call"""
+    if file_extension == "":
+        return None
+    elif "/" in file_extension:
+        file_extension = os.path.splitext(file_extension)[1]
+    if file_extension == "":
+        return None
+    if file_extension[0] != ".":
+        file_extension = "." + file_extension
+    language_results = list(map(
+            lambda file_args: file_args[0] if file_extension in list(map(
+                lambda i: i, file_args[1].get("extensions", []))) else None, language_map.items()))
+    language_results = list(filter(None, language_results))
+    return language_results[0] if len(language_results) > 0 else None
+
+
+def main(nb_paths, nb_scanned_paths):
+    paths = create_paths(nb_paths)
+    with open(LANGUAGES_FILE) as fd:
+        language_map = json.load(fd)
+
+    start = time.perf_counter()
+    expected = [guess_with_scan(path, language_map) for path in paths[:nb_scanned_paths]]
+    scan_time = (time.perf_counter() - start) * nb_paths / nb_scanned_paths
+
+    guess_programing_language.cache_clear()
+    start = time.perf_counter()
+    actual = [guess_programing_language(path) for path in paths]
+    index_time = time.perf_counter() - start
+
+    guess_programing_language.cache_clear()
+    start = time.perf_counter()
+    for path in paths:
+        guess_programing_language(os.path.splitext(path)[1])
+    extension_time = time.perf_counter() - start
+
+    # Only the file name based languages differ
+    for path, language, expected_language in zip(paths, actual, expected):
+        if os.path.basename(path) not in FILE_NAMES:
+            assert language == expected_language, path
+    print(f"{nb_paths} paths")
+    print(f"scan (extrapolated) : {scan_time:.2f} s")
+    print(f"index, paths        : {index_time:.2f} s ({scan_time / index_time:.0f}x faster)")
+    print(f"index, extensions   : {extension_time:.2f} s ({scan_time / extension_time:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
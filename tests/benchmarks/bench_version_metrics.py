@@ -0,0 +1,115 @@
+"""
+Compare the per-version queries of the former compute_version_metrics with
+the set-based computation of metrics.versions.compute_versions_values
+
+    python -m tests.benchmarks.bench_version_metrics [nb_versions] [nb_authors]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import func
+
+from metrics.versions import compute_versions_values
+from models.database import setup_database
+from models.commit import Commit
+from models.issue import Issue
+from models.project import Project
+from models.version import Version
+
+
+def create_version_metrics_fixture(session, nb_versions=500, nb_authors=2000,
+                                   nb_commits=20000, nb_issues=20000, seed=42):
+    """Populate a project with random versions, commits and issues"""
+    rnd = random.Random(seed)
+    session.add(Project(project_id=1, name="bench"))
+    start = datetime(2010, 1, 1)
+    end = start + timedelta(days=nb_versions * 10)
+    span = (end - start).total_seconds()
+
+    def random_date():
+        return start + timedelta(seconds=rnd.uniform(0, span))
+
+    session.bulk_insert_mappings(Version, [
+        {"project_id": 1, "name": f"v{i}", "tag": f"v{i}",
+         "start_date": start + timedelta(days=i * 10), "end_date": start + timedelta(days=(i + 1) * 10)}
+        for i in range(nb_versions)
+    ])
+    session.bulk_insert_mappings(Commit, [
+        {"project_id": 1, "hash": f"{i:040x}", "committer": f"Author {rnd.randint(1, nb_authors)}",
+         "date": random_date(), "lines": rnd.randint(0, 500)}
+        for i in range(nb_commits)
+    ])
+    session.bulk_insert_mappings(Issue, [
+        {"project_id": 1, "number": str(i), "source": "git", "created_at": random_date()}
+        for i in range(nb_issues)
+    ])
+    session.commit()
+
+
+def compute_with_queries(session, project_id):
+    """Former implementation: a few queries per version and one per team member"""
+    values = []
+    versions = session.query(Version).filter(Version.project_id == project_id) \
+                      .order_by(Version.start_date.asc()).all()
+    for version in versions:
+        bugs_count = session.query(Issue).filter(
+            Issue.created_at.between(version.start_date, version.end_date)).filter(Issue.project_id == project_id).count()
+        days = (version.end_date - version.start_date).days
+        bug_velo_release = bugs_count / days if days > 0 else bugs_count
+        rough_changes = session.query(func.sum(Commit.lines)) \
+            .filter(Commit.date.between(version.start_date, version.end_date)) \
+            .filter(Commit.project_id == project_id).scalar() or 0
+        team_members = session.query(Commit.committer).filter(
+            Commit.date.between(version.start_date, version.end_date)
+        ).filter(Commit.project_id == project_id).group_by(Commit.committer).all()
+        seniority_total = 0
+        for member in team_members:
+            first_commit = session.query(func.min(Commit.date)).filter(Commit.committer == member[0]).scalar()
+            seniority_total += (version.end_date - first_commit).days
+        values.append((version.version_id, bugs_count, bug_velo_release, rough_changes,
+                       seniority_total / max(len(team_members), 1)))
+    return values
+
+
+def compute_set_based(session, project_id):
+    bind = session.get_bind()
+    df_versions = pd.read_sql(session.query(Version.version_id, Version.start_date, Version.end_date)
+                              .filter(Version.project_id == project_id)
+                              .order_by(Version.start_date.asc()).statement, bind)
+    df_commits = pd.read_sql(session.query(Commit.date, Commit.committer, Commit.lines)
+                             .filter(Commit.project_id == project_id).statement, bind)
+    df_issues = pd.read_sql(session.query(Issue.created_at)
+                            .filter(Issue.project_id == project_id).statement, bind)
+    df = compute_versions_values(df_versions, df_commits, df_issues)
+    return list(df.itertuples(index=False, name=None))
+
+
+def main(nb_versions, nb_authors):
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    create_version_metrics_fixture(session, nb_versions, nb_authors)
+
+    start = time.perf_counter()
+    expected = compute_with_queries(session, 1)
+    queries_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = compute_set_based(session, 1)
+    set_based_time = time.perf_counter() - start
+
+    np.testing.assert_allclose(np.array(actual, dtype=float), np.array(expected, dtype=float))
+    print(f"{nb_versions} versions / {nb_authors} authors")
+    print(f"queries   : {queries_time:.2f} s")
+    print(f"set-based : {set_based_time:.2f} s ({queries_time / set_based_time:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
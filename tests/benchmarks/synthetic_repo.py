@@ -0,0 +1,47 @@
+import os
+import random
+import subprocess
+from datetime import datetime, timedelta
+
+
+def create_synthetic_repo(directory: str, nb_commits: int, nb_files: int = 200,
+                          nb_authors: int = 20, seed: int = 42) -> str:
+    """
+    Create a git repository with a random history by using git fast-import
+
+    Each commit modifies a few Java files of the repository, a tag is put
+    every 100 commits. Return the path to the repository
+    """
+    rnd = random.Random(seed)
+    subprocess.run(["git", "init", "-q", "-b", "master", directory], check=True)
+
+    files = {f"src/main/java/org/bench/File{i}.java": [] for i in range(nb_files)}
+    date = datetime(2015, 1, 1)
+    stream = []
+    for i in range(1, nb_commits + 1):
+        date += timedelta(hours=rnd.randint(1, 48))
+        author = f"Author {rnd.randint(1, nb_authors)}"
+        timestamp = int(date.timestamp())
+        message = f"Commit {i}\n\nBody of commit {i}\n".encode()
+        stream.append(b"commit refs/heads/master\n")
+        stream.append(f"mark :{i}\n".encode())
+        stream.append(f"committer {author} <author@bench> {timestamp} +0000\n".encode())
+        stream.append(f"data {len(message)}\n".encode() + message)
+        if i > 1:
+            stream.append(f"from :{i - 1}\n".encode())
+        for path in rnd.sample(sorted(files), rnd.randint(1, 5)):
+            lines = files[path]
+            del lines[:rnd.randint(0, len(lines))]
+            lines.extend(f"    int value{i}_{j}(int x) {{ if (x > {j}) return x; return {j}; }}"
+                         for j in range(rnd.randint(1, 20)))
+            content = ("class Bench {\n" + "\n".join(lines) + "\n}\n").encode()
+            stream.append(f"M 100644 inline {path}\n".encode())
+            stream.append(f"data {len(content)}\n".encode() + content)
+        stream.append(b"\n")
+        if i % 100 == 0:
+            stream.append(f"reset refs/tags/v{i // 100}.0\nfrom :{i}\n\n".encode())
+
+    subprocess.run(["git", "fast-import", "--quiet"], input=b"".join(stream),
+                   cwd=directory, check=True)
+    subprocess.run(["git", "checkout", "-q", "master"], cwd=directory, check=True)
+    return os.path.abspath(directory)
@@ -0,0 +1,102 @@
+from tests.__fixtures__ import *
+
+import sys
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from connectors.ck import CLASS_COLUMNS, CkConnector
+from models.ckclass import CkClass
+from models.database import setup_database
+from models.metric import Metric
+from models.project import Project
+from utils.gittree import GitTree
+
+# Stand-in for java -jar ck.jar <src dir> True 0 True <output dir>: a class by
+# Java file valued by its number of lines, a method by line
+FAKE_CK = """#!{python}
+import os, sys
+src_dir, output_dir = sys.argv[3], sys.argv[7]
+with open({calls!r}, "a") as calls:
+    calls.write(" ".join(sorted(f for _, _, files in os.walk(src_dir) for f in files)) + "\\n")
+reports = {{name: open(os.path.join(output_dir, name), "w") for name in ["class.csv", "method.csv", "field.csv", "variable.csv"]}}
+reports["class.csv"].write("file,class,type," + ",".join({columns!r}) + "\\n")
+reports["method.csv"].write("file,class,method,hasJavaDoc,methodsInvokedQty,loc\\n")
+reports["field.csv"].write("file,class,method,variable,usage\\n")
+reports["variable.csv"].write("file,class,method,variable,usage\\n")
+for root, _, files in os.walk(src_dir):
+    for name in files:
+        path = os.path.join(root, name)
+        lines = len(open(path).readlines())
+        reports["class.csv"].write(f"{{path}},{{name[:-5]}},class," + ",".join([str(lines)] * {nb_columns}) + "\\n")
+        for i in range(lines):
+            reports["method.csv"].write(f"{{path}},{{name[:-5]}},m{{i}},{{'true' if i % 2 else 'false'}},{{i}},1\\n")
+        reports["field.csv"].write(f"{{path}},{{name[:-5]}},,f,{{lines}}\\n")
+        reports["variable.csv"].write(f"{{path}},{{name[:-5]}},m0,v,1\\n")
+"""
+
+
+def commit_version(directory, files, tag):
+    for path, content in files.items():
+        (directory / path).write_bytes(content)
+    for args in (["add", "."], ["-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-m", tag],
+                 ["tag", tag]):
+        subprocess.run(["git"] + args, cwd=directory, check=True)
+
+
+def test_compute_metrics_analyzes_the_changed_files_only(tmp_path):
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    calls = tmp_path / "calls"
+    java = tmp_path / "java"
+    java.write_text(FAKE_CK.format(python=sys.executable, calls=str(calls), columns=CLASS_COLUMNS,
+                                   nb_columns=len(CLASS_COLUMNS)))
+    java.chmod(0o755)
+    repo = tmp_path / "repo"
+    directory = create_repo(repo, {"src/A.java": b"a\n", "src/B.java": b"b\nb\nb\n", "README.md": b"r\n"})
+    commit_version(repo, {"src/B.java": b"b\n" * 5}, "v2")
+
+    def compute_metrics(tag, incremental=True):
+        config = SimpleNamespace(java_path=str(java), code_ck_path="ck-0.7.1.jar", ck_incremental=incremental)
+        ck = CkConnector(directory, SimpleNamespace(version_id=1, tag=tag), session, config,
+                         git_tree=GitTree("git", directory, tag))
+        metric = Metric()
+        assert ck.compute_metrics(metric)
+        CkConnector.save_cache_updates(session, ck.get_cache_updates())
+        session.commit()
+        return metric
+
+    v1 = compute_metrics("v1")
+    assert (v1.ck_wmc, v1.ck_fan_in, v1.ck_has_javadoc, v1.ck_usage_fields, v1.ck_usage_vars) == (2, 2, 0.25, 2, 1)
+    v2 = compute_metrics("v2")
+    assert calls.read_text().splitlines() == ["A.java B.java", "B.java"]
+    assert (v2.ck_wmc, v2.ck_method_invok) == (3, 1.67)
+    assert session.query(CkClass).count() == 3
+
+    v2_full = compute_metrics("v2", incremental=False)
+    assert calls.read_text().splitlines()[-1] == "A.java B.java"
+    assert (v2_full.ck_wmc, v2_full.ck_method_invok) == (v2.ck_wmc, v2.ck_method_invok)
+
+
+def test_read_ck_reports_keeps_the_classes_of_the_same_name(tmp_path):
+    src_dir = tmp_path / "src"
+    src_dir.mkdir()
+    path = str(src_dir / "A.java")
+    # Two anonymous classes of A.java reported with the same name
+    values = ",".join(["1"] * len(CLASS_COLUMNS))
+    (tmp_path / "class.csv").write_text(f"file,class,type,{','.join(CLASS_COLUMNS)}\n"
+                                        f"{path},A,class,{values}\n{path},A$Anonymous1,anonymous,{values}\n"
+                                        f"{path},A$Anonymous1,anonymous,{values.replace('1', '3')}\n")
+    (tmp_path / "method.csv").write_text(f"file,class,method,hasJavaDoc,methodsInvokedQty\n"
+                                         f"{path},A$Anonymous1,run,true,2\n{path},A$Anonymous1,run,false,4\n")
+    (tmp_path / "field.csv").write_text("file,class,method,variable,usage\n")
+    (tmp_path / "variable.csv").write_text("file,class,method,variable,usage\n")
+
+    files = CkConnector.read_ck_reports(str(tmp_path), str(src_dir))
+
+    assert [(name, values["wmc"]) for name, values in files["A.java"]] == \
+        [("A", 1), ("A$Anonymous1", 1), ("A$Anonymous1", 3)]
+    # The members are counted once
+    assert sum(values.get("method_methodsInvokedQty_sum", 0) for _, values in files["A.java"]) == 6
@@ -0,0 +1,71 @@
+from tests.__fixtures__ import *
+
+import datetime
+from types import SimpleNamespace
+
+import pandas as pd
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from connectors import codemaat
+from connectors.codemaat import CodeMaatConnector
+from models.author import Author
+from models.database import setup_database
+from models.file import File
+from models.ownership import Ownership
+from models.project import Project
+from models.version import Version
+
+
+def test_save_ownership_patterns_reuses_authors_and_files():
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([Author(name="alice"), File(path="src/A.java", language="Java")])
+    session.commit()
+
+    ownership = pd.DataFrame({"entity": ["src/A.java", "src/A.java", "src/B.py"],
+                              "author": ["alice", "bob", "bob"],
+                              "added": [10, 5, 3], "deleted": [1, 0, 2]})
+    effort = pd.DataFrame({"entity": ["src/A.java", "src/A.java", "src/B.py"],
+                           "author": ["alice", "bob", "bob"],
+                           "author-revs": [3, 1, 2], "total-revs": [4, 4, 2]})
+    connector = CodeMaatConnector("", SimpleNamespace(version_id=7), session, SimpleNamespace(batch_size=1))
+    connector.save_ownership_patterns(ownership, effort)
+
+    assert session.query(Author).count() == 2
+    assert session.query(File.path, File.language).order_by(File.file_id).all() == \
+           [("src/A.java", "Java"), ("src/B.py", "Python")]
+    patterns = session.query(File.path, Author.name, Ownership.version_id, Ownership.added, Ownership.total_revs) \
+                      .join(File, File.file_id == Ownership.file_id) \
+                      .join(Author, Author.author_id == Ownership.author_id) \
+                      .order_by(Ownership.ownership_id).all()
+    assert patterns == [("src/A.java", "alice", 7, 10, 4), ("src/A.java", "bob", 7, 5, 4), ("src/B.py", "bob", 7, 3, 2)]
+
+
+def test_run_analyses_writes_the_log_once_and_caches_the_outputs(tmp_path, monkeypatch):
+    monkeypatch.setattr(codemaat, "CODE_MAAT_CACHE_MAX_FILES", 2)
+    directory = create_repo(tmp_path / "repo", {"src/A.java": b"class A {}\n"})
+    # Stand-in for java -jar code-maat.jar ... -a <analysis> -o <output>
+    java = tmp_path / "java"
+    java.write_text('#!/bin/sh\necho "$8" >> ' + str(tmp_path / "calls") + '\necho "analysis\\n$8" > "${10}"\n')
+    java.chmod(0o755)
+    config = SimpleNamespace(scm_path="git", java_path=str(java), code_maat_path="code-maat.jar", workers=2,
+                             cache_dir=str(tmp_path / "cache"))
+    version = SimpleNamespace(start_date=datetime.datetime(2000, 1, 1), end_date=datetime.datetime(2090, 1, 1))
+    connector = CodeMaatConnector(directory, version, None, config)
+
+    git_log_file = connector.create_git_log_file()
+    with open(git_log_file) as log:
+        assert log.read().splitlines()[1:] == ["1\t0\tsrc/A.java"]
+    output_files = connector.run_analyses(git_log_file, ["entity-ownership", "entity-effort"])
+    assert pd.read_csv(output_files["entity-effort"])["analysis"].tolist() == ["entity-effort"]
+    assert sorted(connector.timings) == ["entity-effort", "entity-ownership"]
+
+    new_output_files = connector.run_analyses(git_log_file, ["entity-effort", "age"])
+    assert new_output_files == dict(age=output_files["entity-effort"].replace("entity-effort.csv", "age.csv"),
+                                    **{"entity-effort": output_files["entity-effort"]})
+    assert sorted((tmp_path / "calls").read_text().split()) == ["age", "entity-effort", "entity-ownership"]
+    # The least recently used output is evicted
+    assert sorted(os.listdir(tmp_path / "cache" / "code-maat")) == \
+           sorted(os.path.basename(output_file) for output_file in new_output_files.values())
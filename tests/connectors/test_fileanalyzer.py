@@ -0,0 +1,106 @@
+from tests.__fixtures__ import *
+import codecs
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from connectors.fileanalyzer import FileAnalyzer, get_blob_hash
+from models.lizardcache import LizardCache
+from models.metric import Metric
+from utils.gittree import GitTree
+
+JAVA_SOURCE = """
+public class Foo {
+    // Comment
+    public int bar(int a) {
+        if (a > 0) {
+            return a + 1;
+        }
+
+        return 0;
+    }
+}
+"""
+
+
+def test_blob_hash_is_git_hash():
+    # echo "hello" | git hash-object --stdin
+    assert get_blob_hash(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_identical_files_are_analyzed_once(tmp_path):
+    engine = db.create_engine("sqlite://")
+    LizardCache.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    (tmp_path / "Foo.java").write_text(JAVA_SOURCE)
+    (tmp_path / "Copy.java").write_text(JAVA_SOURCE)
+    version = SimpleNamespace(version_id=1)
+
+    first = FileAnalyzer(str(tmp_path), version, session)
+    first_metric = first.compute_metric(Metric())
+    FileAnalyzer.save_cache_updates(session, first.get_cache_updates())
+    session.commit()
+    assert (first.cache_hits, first.cache_misses) == (1, 1)
+
+    second = FileAnalyzer(str(tmp_path), version, session)
+    second_metric = second.compute_metric(Metric())
+    FileAnalyzer.save_cache_updates(session, second.get_cache_updates())
+    session.commit()
+    assert (second.cache_hits, second.cache_misses) == (2, 0)
+
+    assert session.query(LizardCache.hits).all() == [(3,)]
+    for column in Metric.__table__.columns:
+        assert getattr(first_metric, column.name) == getattr(second_metric, column.name)
+    assert second_metric.lizard_total_nloc == 16
+    assert second_metric.total_comments == 2
+
+
+def test_parallel_analysis_matches_serial(tmp_path):
+    for i in range(6):
+        (tmp_path / f"Foo{i}.java").write_text(JAVA_SOURCE.replace("a + 1", f"a + {i} * b{i}"))
+    (tmp_path / "foo.py").write_text("def foo(x):\n    return x or None\n")
+    version = SimpleNamespace(version_id=1)
+
+    serial_metric = FileAnalyzer(str(tmp_path), version, None).compute_metric(Metric())
+    parallel = FileAnalyzer(str(tmp_path), version, None, workers=3)
+    parallel_metric = parallel.compute_metric(Metric())
+
+    assert parallel.cache_misses == 7
+    for column in Metric.__table__.columns:
+        assert getattr(serial_metric, column.name) == getattr(parallel_metric, column.name)
+
+
+def test_git_tree_matches_directory(tmp_path):
+    files = {
+        "src/Foo.java": JAVA_SOURCE.encode(),
+        "src/Crlf.java": JAVA_SOURCE.replace("\n", "\r\n").encode(),
+        "src/Bom.java": codecs.BOM_UTF8 + JAVA_SOURCE.encode(),
+        "src/.hidden/Hidden.java": JAVA_SOURCE.encode(),
+        "script.py": b"def foo(x):\n    return x or None\n"
+    }
+    repo_dir = create_repo(tmp_path, files)
+    version = SimpleNamespace(version_id=1)
+
+    directory_metric = FileAnalyzer(repo_dir, version, None).compute_metric(Metric())
+    git_tree = GitTree("git", repo_dir, "v1")
+    git_metric = FileAnalyzer(repo_dir, version, None, git_tree=git_tree).compute_metric(Metric())
+
+    for column in Metric.__table__.columns:
+        assert getattr(directory_metric, column.name) == getattr(git_metric, column.name)
+    assert git_metric.total_lines == 35
+
+
+def test_folders_and_files_without_extension_are_skipped(tmp_path):
+    (tmp_path / "src" / "main" / "java").mkdir(parents=True)
+    (tmp_path / "src" / "main" / "java" / "Foo.java").write_text(JAVA_SOURCE)
+    # Named as a language extension, but not a source file
+    (tmp_path / "java").write_text("not java\n")
+    (tmp_path / "c").write_text("not c\n")
+    version = SimpleNamespace(version_id=1)
+
+    analyzer = FileAnalyzer(str(tmp_path), version, None)
+    metric = analyzer.compute_metric(Metric())
+
+    assert analyzer.cache_misses == 1
+    assert metric.lizard_total_nloc == 8
@@ -0,0 +1,42 @@
+from tests.__fixtures__ import *
+from datetime import datetime
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from connectors.git import GitConnector
+from models.commit import Commit
+from models.database import setup_database
+from models.project import Project
+
+
+def test_dmm_metrics_are_computed_once(tmp_path):
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    subprocess.run(["git", "init", "-q"], cwd=repo_dir, check=True)
+    commit_files(repo_dir, {"a.py": "def f(x):\n    return x\n"}, datetime(2022, 1, 1))
+    # No supported language change, pydriller returns None
+    commit_files(repo_dir, {"README": "readme\n"}, datetime(2022, 1, 2))
+
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo"))
+    session.commit()
+    config = SimpleNamespace(scm_path="git", exclude_authors=[], batch_size=100, compute_dmm=True, workers=1)
+    connector = SimpleNamespace(session=session, project_id=1, directory=str(repo_dir), configuration=config,
+                                compute_commits_dmm=lambda: GitConnector.compute_commits_dmm(connector))
+
+    GitConnector.create_commits_from_repo(connector)
+    commits = session.query(Commit).order_by(Commit.date).all()
+    assert [commit.dmm_computed for commit in commits] == [True, True]
+    assert commits[0].dmm_unit_size == 1.0
+    assert commits[1].dmm_unit_size is None
+
+    # Synced again, the commits are upserted but not computed again
+    session.query(Commit).update({"dmm_unit_complexity": 0.5})
+    session.commit()
+    GitConnector.create_commits_from_repo(connector)
+    session.expire_all()
+    assert [commit.dmm_unit_complexity for commit in session.query(Commit)] == [0.5, 0.5]
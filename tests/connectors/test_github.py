@@ -0,0 +1,61 @@
+from tests.__fixtures__ import *
+
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from connectors import github
+from connectors.github import GitHubConnector
+from models.database import setup_database
+from models.httpcache import HttpCache
+from models.issue import Issue
+from models.project import Project
+
+
+def github_issue(number, updated_at, login="dev"):
+    return {"number": number, "title": f"Issue {number}", "user": {"login": login},
+            "created_at": f"2022-01-0{number}T10:00:00Z", "updated_at": updated_at}
+
+
+def github_connector(session, directory):
+    config = SimpleNamespace(issue_tags=[], exclude_issuers=["bot"], workers=2, retry_delay=5, batch_size=2)
+    return GitHubConnector(1, directory, "token", "owner/project", "main", session, config)
+
+
+def test_create_issues(tmp_path, monkeypatch):
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    directory = create_repo(tmp_path, {"README.md": b"readme\n"})
+    issues = [github_issue(i, f"2022-01-0{i}T10:00:00Z", "bot" if i == 3 else "dev") for i in range(1, 6)]
+    # The releases are read with PyGithub, not requested here
+    monkeypatch.setattr(github, "Github", lambda token: SimpleNamespace(get_repo=lambda repo: None))
+
+    with RecordedHttpServer(github_api(issues), rate_limit=3, reset_delay=2) as server:
+        monkeypatch.setattr(github, "GITHUB_API_URL", server.url)
+        monkeypatch.setattr(github, "ISSUES_PER_PAGE", 2)
+
+        # The pages 2 and 3 given by the Link header of the first one are fetched concurrently
+        github_connector(session, directory).create_issues()
+        assert session.query(Issue.number).order_by(Issue.number).all() == [("1",), ("2",), ("4",), ("5",)]
+        assert sorted(status for _, status in server.requests) == [200] * 3
+        assert session.query(HttpCache).count() == 3
+
+        # The budget of the rate limit is spent, the request is sent again after its reset
+        issues[0]["updated_at"] = "2022-01-06T10:00:00Z"
+        issues[0]["title"] = "Issue 1 updated"
+        connector = github_connector(session, directory)
+        connector.create_issues()
+        assert [status for _, status in server.requests[3:]] == [403, 200]
+        assert "since=2022-01-05T10%3A00%3A01Z" in server.requests[-1][0]
+        assert session.query(Issue.title).filter(Issue.number == "1").scalar() == "Issue 1 updated"
+        # The pages of the previous since aren't requested anymore, they are removed from the cache
+        assert [url for url, in session.query(HttpCache.url)] == [server.url + server.requests[-1][0]]
+
+        # Nothing changed since the last sync, the same page is answered by 304 Not Modified
+        connector.create_issues()
+        connector.create_issues()
+        assert server.requests[-1] == (server.requests[-2][0], 304)
+        assert connector.client.nb_not_modified == 1
+        assert session.query(Issue).count() == 4
@@ -0,0 +1,49 @@
+from tests.__fixtures__ import *
+
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from connectors.gitlab import GitLabConnector
+from models.database import setup_database
+from models.issue import Issue
+from models.project import Project
+from models.version import Version
+
+
+def gitlab_issue(iid, updated_at, author="dev"):
+    return {"iid": iid, "title": f"Issue {iid}", "author": {"username": author},
+            "created_at": "2022-01-01T10:00:00.000Z", "updated_at": updated_at}
+
+
+def gitlab_config():
+    return SimpleNamespace(issue_tags=[], exclude_issuers=["bot"], workers=2, retry_delay=5, batch_size=2,
+                           next_version_name="Next Release")
+
+
+def test_create_issues_and_versions(tmp_path):
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    directory = create_repo(tmp_path, {"README.md": b"readme\n"})
+    issues = [gitlab_issue(i, f"2022-01-0{i}T10:00:00.000Z", "bot" if i == 3 else "dev") for i in range(1, 6)]
+    releases = [{"name": "1.0", "tag_name": "v1", "released_at": "2022-02-01T10:00:00.000Z"}]
+
+    with RecordedHttpServer(gitlab_api(issues, releases), rate_limit=100, rate_limit_prefix="RateLimit-") as server:
+        connector = GitLabConnector(1, directory, server.url, "token", "group/project", "main", session,
+                                    gitlab_config())
+        connector.create_issues()
+        assert session.query(Issue.number).order_by(Issue.number).all() == [("1",), ("2",), ("4",), ("5",)]
+        assert len(server.requests) == 3
+        assert connector.client.rate_limit_remaining == 97
+
+        # Only the issues updated since the last sync are fetched
+        issues.append(gitlab_issue(6, "2022-01-07T10:00:00.000Z"))
+        connector.create_issues()
+        assert session.query(Issue).count() == 5
+        assert "updated_after=2022-01-05T10%3A00%3A01Z" in server.requests[-1][0]
+
+        connector.create_versions()
+    assert [(v.name, v.tag) for v in session.query(Version).order_by(Version.version_id)] == \
+           [("1.0", "v1"), ("Next Release", "main")]
@@ -0,0 +1,60 @@
+from tests.__fixtures__ import *
+
+import urllib.parse
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from connectors.jira import JiraConnector
+from models.database import setup_database
+from models.issue import Issue
+from models.project import Project
+
+
+def jira_config(base_url):
+    return SimpleNamespace(jira_base_url=base_url, jira_project="PRJ", jira_email="dev@test", jira_token="token",
+                           jira_issue_type=[], issue_tags=[], exclude_issuers=["bot"],
+                           workers=3, retry_delay=5, batch_size=40)
+
+
+def test_create_issues_reads_all_the_pages():
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+
+    with RecordedHttpServer(fake_jira_search(250, max_results=30)) as server:
+        JiraConnector(1, session, jira_config(server.url)).create_issues()
+        numbers = [number for number, in session.query(Issue.number).filter(Issue.source == "jira")]
+        assert sorted(numbers) == sorted(f"PRJ-{i}" for i in range(250) if i % 10)
+        # 9 pages of 30 issues (the server caps maxResults), a few fields only
+        assert len(server.requests) == 9
+        assert all("fields=summary%2Ccreated%2Cupdated%2Creporter" in path for path, _ in server.requests)
+
+        JiraConnector(1, session, jira_config(server.url)).create_issues()
+        assert session.query(Issue).count() == 225
+
+
+def test_create_issues_with_an_issue_updated_during_the_sync():
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    issues = [jira_issue(i) for i in range(1, 100) if i % 10]
+
+    def search(path):
+        """Search sorted as the ORDER BY of the JQL, the first issue is updated once its page is read"""
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(path).query)
+        field = query["jql"][0].split("ORDER BY ")[1].split()[0]
+        ordered = sorted(issues, key=lambda issue: (issue["fields"][field], issue["key"]))
+        start = int(query["startAt"][0])
+        if start == 0:
+            ordered[0]["fields"]["updated"] = "2023-01-01T10:00:00.000+0000"
+        page = ordered[start:start + 30]
+        return {"startAt": start, "maxResults": 30, "total": len(issues), "issues": page}
+
+    with RecordedHttpServer(search) as server:
+        config = jira_config(server.url)
+        config.workers = 1
+        JiraConnector(1, session, config).create_issues()
+
+    assert session.query(Issue).count() == len(issues)
@@ -0,0 +1,162 @@
+from tests.__fixtures__ import *
+import subprocess
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from pydriller import Repository
+from sqlalchemy.orm import sessionmaker
+
+from connectors.legacy import LegacyConnector
+from models.commit import Commit
+from models.database import setup_database
+from models.file import File
+from models.fileage import FileAge
+from models.fileagecheckpoint import FileAgeCheckpoint
+from models.filemodification import FileModification
+from models.legacy import Legacy
+from models.metric import Metric
+from models.project import Project
+from models.version import Version
+from utils.gitlog import iter_commits_numstat
+
+START = datetime(2020, 1, 1)
+LEGACY_PERCENT = 20
+
+
+def day(days):
+    return START + timedelta(days=days)
+
+
+def create_history(repo_dir):
+    """Files created at the start of the project, modified, renamed and deleted long after"""
+    repo_dir.mkdir()
+    subprocess.run(["git", "init", "-q"], cwd=repo_dir, check=True)
+    commit_files(repo_dir, {"a.py": "a\n", "b.py": "b\nb\nb\n", "c.py": "c\n", "e.py": "e\n"}, day(0))
+    commit_files(repo_dir, {"c.py": "c\nc\n"}, day(10), tag="v1")
+    commit_files(repo_dir, {"a.py": "a\na\n", "b.py": None, "d.py": "b\nb\nb\n"}, day(100))
+    commit_files(repo_dir, {"c.py": "c\nc\nc\n", "e.py": None}, day(105))
+    commit_files(repo_dir, {"a.py": "a\na\na\n", "f.py": "f\n"}, day(110), tag="v2")
+
+
+def create_session():
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo"))
+    session.add_all([Version(project_id=1, name="1.0", tag="v1", start_date=day(0), end_date=day(50)),
+                     Version(project_id=1, name="2.0", tag="v2", start_date=day(50), end_date=day(200))])
+    session.commit()
+    return session
+
+
+def save_commits(session, repo_dir):
+    session.query(Commit).delete()
+    session.add_all([Commit(project_id=1, hash=commit["hash"], date=commit["date"].replace(tzinfo=None))
+                     for commit in iter_commits_numstat("git", str(repo_dir))])
+    session.commit()
+
+
+def create_connector(session, repo_dir):
+    config = SimpleNamespace(scm_path="git", current_branch="HEAD", exclude_authors=[],
+                             legacy_percent=LEGACY_PERCENT, batch_size=2)
+    return LegacyConnector(1, str(repo_dir), None, session, config)
+
+
+def checkout_walk_legacy_files(repo_dir, version: Version):
+    """Legacy files of a version found by opening every commit of the history with pydriller"""
+    files_last_modification = {}
+    legacy_files = {}
+    for commit in Repository(str(repo_dir)).traverse_commits():
+        date = commit.committer_date.replace(tzinfo=None)
+        delta_since_first_commit = date - START
+        legacy_time_delta = delta_since_first_commit - \
+            timedelta(days=round(delta_since_first_commit.days / 100 * LEGACY_PERCENT, 1))
+        for modified_file in commit.modified_files:
+            if version.start_date <= date <= version.end_date \
+                    and modified_file.old_path in files_last_modification and modified_file.new_path \
+                    and date - files_last_modification[modified_file.old_path] >= legacy_time_delta:
+                legacy_files.pop(modified_file.old_path, None)
+                legacy_files[modified_file.new_path] = modified_file.filename
+        for modified_file in commit.modified_files:
+            files_last_modification.pop(modified_file.old_path, None)
+            files_last_modification[modified_file.new_path] = date
+    return set(legacy_files)
+
+
+def get_legacy_files(session, connector):
+    return [set(connector.compute_modified_legacy_files(version))
+            for version in session.query(Version).order_by(Version.start_date)]
+
+
+def get_index(session):
+    ages = {(age.path, age.last_modification) for age in session.query(FileAge)}
+    modifications = {(m.commit_hash, m.old_path, m.new_path, m.date, m.previous_date)
+                     for m in session.query(FileModification)}
+    return ages, modifications
+
+
+def test_legacy_files_as_checkout_walk(tmp_path):
+    repo_dir = tmp_path / "repo"
+    create_history(repo_dir)
+    session = create_session()
+    save_commits(session, repo_dir)
+    connector = create_connector(session, repo_dir)
+
+    connector.update_file_age_index()
+
+    versions = session.query(Version).order_by(Version.start_date).all()
+    assert get_legacy_files(session, connector) == [checkout_walk_legacy_files(repo_dir, v) for v in versions]
+    assert get_legacy_files(session, connector) == [{"c.py"}, {"a.py", "c.py", "d.py"}]
+
+    # Saved in bulk, the files are created once
+    connector.get_legacy_files(versions[1])
+    connector.get_legacy_files(versions[1])
+    paths = session.query(File.path).join(Legacy, Legacy.file_id == File.file_id) \
+                   .filter(Legacy.version_id == versions[1].version_id).all()
+    assert sorted(path for path, in paths) == ["a.py", "c.py", "d.py"]
+    assert session.query(File).count() == 3
+    assert session.query(Metric).one().nb_legacy_files == 3
+
+
+def test_file_age_index_is_updated_incrementally(tmp_path):
+    repo_dir = tmp_path / "repo"
+    create_history(repo_dir)
+    session = create_session()
+    save_commits(session, repo_dir)
+    connector = create_connector(session, repo_dir)
+    connector.update_file_age_index()
+    full_index = get_index(session)
+
+    # Indexed up to v1, then the commits added since
+    session.query(FileAge).delete()
+    session.query(FileModification).delete()
+    session.query(FileAgeCheckpoint).delete()
+    subprocess.run(["git", "checkout", "-q", "v1"], cwd=repo_dir, check=True)
+    connector.update_file_age_index()
+    assert {path for path, _ in get_index(session)[0]} == {"a.py", "b.py", "c.py", "e.py"}
+    subprocess.run(["git", "checkout", "-q", "-"], cwd=repo_dir, check=True)
+    connector.update_file_age_index()
+
+    assert get_index(session) == full_index
+    assert {path for path, _ in full_index[0]} == {"a.py", "c.py", "d.py", "f.py"}
+
+
+def test_file_age_index_of_a_rewritten_branch(tmp_path):
+    repo_dir = tmp_path / "repo"
+    create_history(repo_dir)
+    session = create_session()
+    save_commits(session, repo_dir)
+    create_connector(session, repo_dir).update_file_age_index()
+
+    # The commits after v1 are replaced: the checkpoint isn't an ancestor anymore
+    subprocess.run(["git", "reset", "-q", "--hard", "v1"], cwd=repo_dir, check=True)
+    commit_files(repo_dir, {"e.py": "e\ne\n"}, day(120))
+    save_commits(session, repo_dir)
+    connector = create_connector(session, repo_dir)
+    connector.update_file_age_index()
+
+    assert {path for path, _ in get_index(session)[0]} == {"a.py", "b.py", "c.py", "e.py"}
+    versions = session.query(Version).order_by(Version.start_date).all()
+    assert get_legacy_files(session, connector) == [checkout_walk_legacy_files(repo_dir, v) for v in versions]
+    assert get_legacy_files(session, connector) == [{"c.py"}, {"e.py"}]
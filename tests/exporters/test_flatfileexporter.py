@@ -0,0 +1,66 @@
+from tests.__fixtures__ import *
+from datetime import datetime
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow.parquet as pq
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from exporters.flatfile import FlatFileExporter
+from models.commit import Commit
+from models.database import setup_database
+from models.metric import Metric
+from models.project import Project
+from models.version import Version
+from utils import featurestore
+
+
+def create_session():
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo", language="Java"))
+    for i in range(5):
+        session.add(Version(version_id=i + 1, project_id=1, name=f"{i}.0", tag=f"v{i}", bugs=i,
+                            start_date=datetime(2020, 1, i + 1), end_date=datetime(2020, 1, i + 2)))
+        session.add(Metric(version_id=i + 1, lizard_total_nloc=i * 10))
+    session.add(Version(version_id=6, project_id=1, name="Next Release", tag="main"))
+    # The message of the first commits is NULL, pandas can't type their chunk
+    session.add_all([Commit(project_id=1, hash=f"c{i}", date=datetime(2020, 1, 1),
+                            message=f"fix #{i}" if i > 2 else None) for i in range(7)])
+    session.commit()
+    return session
+
+
+def test_export_parquet_by_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(featurestore, "FEATURE_STORE_DIR", str(tmp_path / "store"))
+    session = create_session()
+    config = SimpleNamespace(target_database="sqlite://", batch_size=2, include_versions=[],
+                             exclude_versions=["v0"], next_version_name="Next Release")
+    exporter = FlatFileExporter(1, str(tmp_path), session, config)
+
+    exporter.export_to_parquet("metrics.parquet", ["tag", "bugs", "lizard_total_nloc"], ["commit", "issue"])
+
+    metrics = pq.ParquetFile(tmp_path / "metrics.parquet")
+    assert metrics.metadata.num_row_groups > 1
+    assert metrics.read().to_pydict() == {"tag": ["v1", "v2", "v3", "v4"], "bugs": [1, 2, 3, 4],
+                                          "lizard_total_nloc": [10, 20, 30, 40]}
+    commits = pq.read_table(tmp_path / "commit.parquet")
+    assert commits.num_rows == 7
+    assert commits.column("message").to_pylist()[-1] == "fix #6"
+    assert pq.read_table(tmp_path / "issue.parquet").num_rows == 0
+
+
+def test_export_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(featurestore, "FEATURE_STORE_DIR", str(tmp_path / "store"))
+    session = create_session()
+    config = SimpleNamespace(target_database="sqlite://", batch_size=2, include_versions=[],
+                             exclude_versions=[], next_version_name="Next Release")
+
+    FlatFileExporter(1, str(tmp_path), session, config).export_to_csv("metrics.csv", tables=["commit"])
+
+    metrics = pd.read_csv(tmp_path / "metrics.csv", index_col=0)
+    assert metrics.index.tolist() == [0, 1, 2, 3, 4]
+    assert metrics["tag"].tolist() == ["v0", "v1", "v2", "v3", "v4"]
+    assert len(pd.read_csv(tmp_path / "commit.csv")) == 7
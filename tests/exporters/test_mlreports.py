@@ -0,0 +1,38 @@
+from tests.__fixtures__ import *
+import stat
+from types import SimpleNamespace
+
+import numpy as np
+
+from exporters import ml_reports
+from exporters.ml_reports import MlHtmlExporter
+
+
+def test_find_clusters_is_cached(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    features = np.concatenate([rng.normal(center, 0.1, (10, 2)) for center in (0, 5, 10)])
+    exporter = MlHtmlExporter(str(tmp_path), None, SimpleNamespace(kmeans_mini_batch=False, workers=2,
+                                                                   cache_dir=str(tmp_path / "cache")))
+
+    model, sse = exporter._MlHtmlExporter__find_clusters(features)
+    assert len(sse) == 10
+    assert model.n_clusters == 3
+    assert model.inertia_ == sse[2]
+
+    def fail(*args):
+        raise AssertionError("fitted again")
+    monkeypatch.setattr(ml_reports, "_fit_kmeans", fail)
+    cached_model, cached_sse = exporter._MlHtmlExporter__find_clusters(features)
+    assert cached_sse == sse
+    assert (cached_model.labels_ == model.labels_).all()
+    assert stat.S_IMODE(os.stat(tmp_path / "cache" / "kmeans").st_mode) == 0o700
+
+
+def test_find_clusters_with_few_versions(tmp_path, monkeypatch):
+    features = np.array([[0.0, 1.0], [1.0, 0.0], [5.0, 5.0]])
+    exporter = MlHtmlExporter(str(tmp_path), None, SimpleNamespace(kmeans_mini_batch=True, workers=1,
+                                                                   cache_dir=str(tmp_path / "cache")))
+
+    model, sse = exporter._MlHtmlExporter__find_clusters(features)
+    assert len(sse) == 3
+    assert len(model.labels_) == 3
@@ -0,0 +1,85 @@
+from tests.__fixtures__ import *
+from datetime import datetime
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from importers.flatfile import FlatFileImporter
+from models.database import setup_database
+from models.issue import Issue
+from models.project import Project
+from models.version import Version
+
+ISSUES_CSV = """project_id,number,title,created_at,updated_at
+1,1,Crash,2020-02-02 10:00:00.000000,2020-02-03 10:00:00.000000
+1,2,,2020-02-05 10:00:00.000000,2020-02-05 10:00:00.000000
+1,3,Leak,2020-02-10 10:00:00.000000,2020-02-11 10:00:00.000000
+"""
+VERSIONS_CSV = """project_id,name,tag,start_date,end_date
+1,3.0,v3,2020-03-01 00:00:00.000000,2020-04-01 00:00:00.000000
+1,4.0,v4,2020-04-01 00:00:00.000000,2020-05-01 00:00:00.000000
+"""
+
+
+def create_session():
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo"))
+    session.add_all([Version(project_id=1, name="1.0", tag="v1", bugs=99,
+                             start_date=datetime(2020, 1, 1), end_date=datetime(2020, 2, 1)),
+                     Version(project_id=1, name="2.0", tag="v2",
+                             start_date=datetime(2020, 2, 1, 1), end_date=datetime(2020, 3, 1))])
+    session.commit()
+    return session
+
+
+def test_import_issues(tmp_path):
+    session = create_session()
+    csv_file = tmp_path / "issues.csv"
+    csv_file.write_text(ISSUES_CSV)
+    config = SimpleNamespace(batch_size=2)
+
+    FlatFileImporter(str(csv_file), "issue", False, session, config).import_from_csv()
+    FlatFileImporter(str(csv_file), "issue", False, session, config).import_from_csv()
+
+    assert session.query(Issue).count() == 3
+    assert session.query(Issue).filter(Issue.number == "3").one().title == "Leak"
+    # Only the version during which the issues were created is computed again
+    assert [(version.tag, version.bugs) for version in session.query(Version).order_by(Version.tag)] == \
+           [("v1", 99), ("v2", 3)]
+
+
+
+def test_import_issues_recomputes_the_versions_that_lose_issues(tmp_path):
+    session = create_session()
+    csv_file = tmp_path / "issues.csv"
+    csv_file.write_text(ISSUES_CSV)
+    config = SimpleNamespace(batch_size=2)
+    FlatFileImporter(str(csv_file), "issue", False, session, config).import_from_csv()
+
+    # The first issue was created during v1 in fact
+    csv_file.write_text(ISSUES_CSV.replace("1,1,Crash,2020-02-02", "1,1,Crash,2020-01-15"))
+    FlatFileImporter(str(csv_file), "issue", False, session, config).import_from_csv()
+    assert [(version.tag, version.bugs) for version in session.query(Version).order_by(Version.tag)] == \
+           [("v1", 1), ("v2", 2)]
+
+    # Overwritten by issues created after the versions
+    csv_file.write_text(ISSUES_CSV.replace("2020-0", "2021-0"))
+    FlatFileImporter(str(csv_file), "issue", True, session, config).import_from_csv()
+    assert session.query(Issue).count() == 3
+    assert [(version.tag, version.bugs) for version in session.query(Version).order_by(Version.tag)] == \
+           [("v1", 0), ("v2", 0)]
+
+def test_import_versions(tmp_path):
+    session = create_session()
+    csv_file = tmp_path / "versions.csv"
+    csv_file.write_text(VERSIONS_CSV)
+
+    FlatFileImporter(str(csv_file), "version", False, session, SimpleNamespace(batch_size=1)).import_from_csv()
+
+    versions = session.query(Version).order_by(Version.tag).all()
+    assert [(version.tag, version.end_date, version.bugs) for version in versions[2:]] == \
+           [("v3", datetime(2020, 4, 1), 0), ("v4", datetime(2020, 5, 1), 0)]
+    assert versions[0].bugs == 99
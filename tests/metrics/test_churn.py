@@ -0,0 +1,118 @@
+from tests.__fixtures__ import *
+from datetime import datetime
+
+import sqlalchemy as db
+from pydriller.metrics.process.code_churn import CodeChurn
+from sqlalchemy.orm import sessionmaker
+
+import utils.math as mt
+from metrics.churn import _add_commit_to_entry, _get_churn_values, compute_versions_churn
+from models.churncheckpoint import ChurnCheckpoint
+from models.database import setup_database
+from models.project import Project
+from models.version import Version
+
+
+def test_churn_values_follow_renames():
+    entry = {"files": {}, "renamed": {}}
+    _add_commit_to_entry(entry, [("a.py", "a.py", 10, 0), ("b.py", "b.py", 3, 1)])
+    _add_commit_to_entry(entry, [("a.py", "c.py", 1, 4)])
+    _add_commit_to_entry(entry, [("b.py", "b.py", 0, 5)])
+
+    assert entry["files"] == {"a.py": [10, 1, 10], "b.py": [-3, 2, 2], "c.py": [-3, 1, -3]}
+    # count: 10 + 3 + 3 / avg: mean(10, round(-1.5), -3) / max: 10
+    assert _get_churn_values(entry["files"]) == (16, 1.67, 10)
+
+
+def test_churn_values_without_commit():
+    assert _get_churn_values({}) == (0, 0, 0)
+
+
+def pydriller_churn(repo_dir, from_commit, to_commit):
+    """Churn values of a version as computed before the history walk"""
+    metric = CodeChurn(path_to_repo=str(repo_dir), from_commit=from_commit, to_commit=to_commit)
+    files_avg = list(metric.avg().values())
+    return (sum(abs(count) for count in metric.count().values()),
+            abs(mt.Math.get_rounded_mean(files_avg)) if files_avg else 0,
+            max(metric.max().values(), default=0))
+
+
+def test_compute_versions_churn_as_pydriller(tmp_path):
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    subprocess.run(["git", "init", "-q"], cwd=repo_dir, check=True)
+    dates = [datetime(2022, 1, day, 10) for day in range(1, 8)]
+    first = commit_files(repo_dir, {"a.py": "1\n2\n3\n", "b.py": "1\n"}, dates[0])
+    commit_files(repo_dir, {"a.py": "1\n", "c.py": "1\n2\n"}, dates[1])
+    commit_files(repo_dir, {"b.py": "1\n2\n3\n4\n"}, dates[2], tag="v1")
+    commit_files(repo_dir, {"a.py": "", "d.py": "1\n2\n3\n"}, dates[3])
+    commit_files(repo_dir, {"c.py": "1\n"}, dates[4], tag="v2")
+
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo"))
+    session.add_all([Version(project_id=1, name="1.0", tag="v1", start_date=dates[0], end_date=dates[2]),
+                     Version(project_id=1, name="2.0", tag="v2", start_date=dates[2], end_date=dates[4])])
+    session.commit()
+
+    def compute():
+        versions = session.query(Version).order_by(Version.start_date).all()
+        compute_versions_churn(session, str(repo_dir), 1, versions)
+        return [(v.code_churn_count, v.code_churn_avg, v.code_churn_max) for v in versions]
+
+    assert compute() == [pydriller_churn(repo_dir, first, "v1"), pydriller_churn(repo_dir, "v1", "v2")]
+
+    # Resumed from the checkpoint: only the new commits are walked
+    commit_files(repo_dir, {"b.py": "1\n", "e.py": "1\n2\n"}, dates[5])
+    commit_files(repo_dir, {"d.py": "1\n2\n3\n4\n5\n"}, dates[6], tag="v3")
+    session.add(Version(project_id=1, name="3.0", tag="v3", start_date=dates[4], end_date=dates[6]))
+    session.commit()
+    assert compute() == [pydriller_churn(repo_dir, first, "v1"), pydriller_churn(repo_dir, "v1", "v2"),
+                         pydriller_churn(repo_dir, "v2", "v3")]
+    checkpoint = session.query(ChurnCheckpoint).one()
+    assert checkpoint.commit_date == dates[6]
+
+    # The history is walked again from the start of a version whose dates changed
+    session.query(Version).filter(Version.tag == "v2").update({"start_date": dates[0]})
+    session.commit()
+    assert compute() == [pydriller_churn(repo_dir, first, "v1"), pydriller_churn(repo_dir, first, "v2"),
+                         pydriller_churn(repo_dir, "v2", "v3")]
+
+
+def test_compute_versions_churn_checks_the_repository(tmp_path):
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+
+    with pytest.raises(subprocess.CalledProcessError):
+        compute_versions_churn(session, str(tmp_path), 1, [])
+
+
+def test_compute_versions_churn_of_a_rewritten_branch(tmp_path):
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+    subprocess.run(["git", "init", "-q"], cwd=repo_dir, check=True)
+    dates = [datetime(2022, 1, day, 10) for day in range(1, 6)]
+    first = commit_files(repo_dir, {"a.py": "1\n2\n3\n", "b.py": "1\n"}, dates[0])
+    commit_files(repo_dir, {"b.py": "1\n2\n3\n4\n"}, dates[1], tag="v1")
+    commit_files(repo_dir, {"a.py": "1\n", "c.py": "1\n2\n"}, dates[2])
+    commit_files(repo_dir, {"c.py": "1\n"}, dates[4])
+
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo"))
+    session.add_all([Version(project_id=1, name="1.0", tag="v1", start_date=dates[0], end_date=dates[1]),
+                     Version(project_id=1, name="2.0", tag="v2", start_date=dates[1], end_date=dates[4])])
+    session.commit()
+    versions = session.query(Version).order_by(Version.start_date).all()
+    compute_versions_churn(session, str(repo_dir), 1, versions)
+
+    # The commits after v1 are replaced: the checkpoint isn't an ancestor anymore
+    subprocess.run(["git", "reset", "-q", "--hard", "v1"], cwd=repo_dir, check=True)
+    commit_files(repo_dir, {"d.py": "1\n2\n3\n"}, dates[3])
+    compute_versions_churn(session, str(repo_dir), 1, versions)
+
+    assert [(v.code_churn_count, v.code_churn_avg, v.code_churn_max) for v in versions] == \
+        [pydriller_churn(repo_dir, first, "v1"), pydriller_churn(repo_dir, "v1", "HEAD")]
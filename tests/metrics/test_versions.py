@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from tests.__fixtures__ import *
+from metrics.versions import compute_versions_values
+
+
+def test_compute_versions_values():
+    df_versions = pd.DataFrame({
+        "version_id": [1, 2],
+        "start_date": [datetime(2022, 1, 1), datetime(2022, 1, 11)],
+        # Dates of newly created versions might hold a timezone
+        "end_date": [datetime(2022, 1, 11), datetime(2022, 1, 21, tzinfo=timezone.utc)],
+    })
+    df_commits = pd.DataFrame({
+        "date": [datetime(2022, 1, 1), datetime(2022, 1, 5), datetime(2022, 1, 15), datetime(2022, 1, 25)],
+        "committer": ["alice", "bob", "alice", "carol"],
+        "lines": [10, 20, 5, 100],
+    })
+    df_issues = pd.DataFrame({
+        "created_at": [datetime(2022, 1, 2), datetime(2022, 1, 11), datetime(2022, 1, 12), None],
+    })
+
+    df = compute_versions_values(df_versions, df_commits, df_issues)
+
+    assert df["version_id"].tolist() == [1, 2]
+    # Both bounds are included
+    assert df["bugs"].tolist() == [2, 2]
+    assert df["bug_velocity"].tolist() == [0.2, 0.2]
+    assert df["changes"].tolist() == [30, 5]
+    # alice: 10 days, bob: 6 days / alice: 20 days
+    assert df["avg_team_xp"].tolist() == [8.0, 20.0]
@@ -0,0 +1,88 @@
+from tests.__fixtures__ import *
+import os
+import pickle
+from types import SimpleNamespace
+
+import pandas as pd
+import sqlalchemy as db
+from sklearn.ensemble import RandomForestRegressor
+from sqlalchemy.orm import sessionmaker
+
+from ml import registry
+from ml.registry import ModelRegistry
+from models.database import setup_database
+from models.model import Model
+from models.project import Project
+
+
+def create_registry(tmp_path):
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo"))
+    session.commit()
+    return ModelRegistry(session, SimpleNamespace(model_dir=str(tmp_path / "models"))), session
+
+
+def train(n_estimators):
+    return RandomForestRegressor(n_estimators=n_estimators, random_state=1).fit([[0], [1], [2], [3]], [0, 1, 2, 3])
+
+
+def test_save_and_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "_loaded_models", {})
+    model_registry, session = create_registry(tmp_path)
+    model_registry.save(1, "bugvelocity", train(5), 0.5)
+    row = session.query(Model).one()
+    assert row.data is None and os.path.exists(tmp_path / "models" / row.artifact_path)
+
+    # Served by the cache of the process
+    assert model_registry.load(1, "bugvelocity") is model_registry.load(1, "bugvelocity")
+    # Read from the artifact by another process
+    registry._loaded_models.clear()
+    assert model_registry.load(1, "bugvelocity").predict([[3]])[0] == train(5).predict([[3]])[0]
+
+    # Trained again: the previous artifact is replaced
+    previous_path = tmp_path / "models" / row.artifact_path
+    model_registry.save(1, "bugvelocity", train(10), 0.2)
+    assert not os.path.exists(previous_path)
+    assert len(model_registry.load(1, "bugvelocity").estimators_) == 10
+    assert len(registry._loaded_models) == 1
+    assert model_registry.load(1, "codemetrics") is None
+
+
+def test_load_pickled_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "_loaded_models", {})
+    model_registry, session = create_registry(tmp_path)
+    # Stored before the registry
+    session.add(Model(project_id=1, name="bugvelocity", data=pickle.dumps(train(5))))
+    session.commit()
+
+    assert len(model_registry.load(1, "bugvelocity").estimators_) == 5
+
+
+def test_save_and_load_xgboost(tmp_path, monkeypatch):
+    xgboost = pytest.importorskip("xgboost")
+    monkeypatch.setattr(registry, "_loaded_models", {})
+    model_registry, session = create_registry(tmp_path)
+    X = pd.DataFrame({"lizard_avg_nloc": [0.0, 1.0, 2.0, 3.0], "ck_wmc": [1.0, 0.0, 1.0, 0.0]})
+    estimator = xgboost.XGBRegressor(objective="reg:squarederror", n_estimators=5).fit(X, [0, 1, 2, 3])
+    model_registry.save(1, "codemetrics", estimator, 0.5)
+    assert session.query(Model.artifact_format).scalar() == "xgboost"
+
+    registry._loaded_models.clear()
+    loaded = model_registry.load(1, "codemetrics")
+    assert list(loaded.predict(X)) == list(estimator.predict(X))
+    assert loaded.get_booster().feature_names == ["lizard_avg_nloc", "ck_wmc"]
+
+
+def test_load_from_the_configured_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "_loaded_models", {})
+    model_registry, session = create_registry(tmp_path)
+    model_registry.save(1, "bugvelocity", train(5), 0.5)
+
+    # The folder of the artifacts is moved
+    os.rename(tmp_path / "models", tmp_path / "moved")
+    registry._loaded_models.clear()
+    assert model_registry.load(1, "bugvelocity") is None
+    moved_registry = ModelRegistry(session, SimpleNamespace(model_dir=str(tmp_path / "moved")))
+    assert len(moved_registry.load(1, "bugvelocity").estimators_) == 5
@@ -0,0 +1,70 @@
+from tests.__fixtures__ import *
+import shutil
+from datetime import datetime
+
+import sqlalchemy as db
+from sqlalchemy import desc
+from sqlalchemy.orm import sessionmaker
+
+from models.author import Author
+from models.commit import Commit
+from models.database import setup_database
+from models.file import File
+from models.issue import Issue
+from models.version import Version
+# All the tables are created by setup_database
+from models import alias, churncheckpoint, ckclass, cloc, fileage, fileagecheckpoint, filemodification, httpcache, \
+    legacy, lizardcache, metric, model, ownership, pipelineprogress, project
+
+DATE = datetime(2022, 1, 1)
+
+# Index expected to be used by each hot query of the connectors and metrics
+HOT_QUERIES = {
+    "ix_commit_project_id_date": lambda session: session.query(Commit).filter(Commit.project_id == 1)
+                                                        .order_by(Commit.date.desc()).limit(1),
+    "ix_commit_committer": lambda session: session.query(Commit).filter(Commit.committer == "dev"),
+    "ix_issue_project_id_created_at": lambda session: session.query(Issue).filter(Issue.project_id == 1)
+                                                             .filter(Issue.created_at >= DATE)
+                                                             .filter(Issue.created_at <= DATE),
+    "ix_issue_project_id_source_updated_at": lambda session: session.query(Issue).filter(Issue.project_id == 1)
+                                                                    .filter(Issue.source == "git")
+                                                                    .order_by(desc(Issue.updated_at)).limit(1),
+    "ix_version_project_id_name": lambda session: session.query(Version).filter(Version.project_id == 1)
+                                                         .filter(Version.name == "Next Release"),
+    "ix_file_path": lambda session: session.query(File).filter(File.path == "src/a.py"),
+    "ix_author_name": lambda session: session.query(Author).filter(Author.name == "dev"),
+}
+
+
+def get_query_plan(session, query) -> str:
+    compiled = query.statement.compile(session.get_bind())
+    # The plan doesn't depend on the values of the parameters
+    params = [None] * len(compiled.positiontup)
+    rows = session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), tuple(params)).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize("database", ["new", "data/RxJava.sqlite3"])
+def test_hot_queries_use_indexes(tmp_path, database):
+    database_file = tmp_path / "test.sqlite3"
+    if database != "new":
+        # Database created before the indexes were declared
+        shutil.copy(database, database_file)
+    engine = db.create_engine(f"sqlite:///{database_file}")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+
+    for index_name, query in HOT_QUERIES.items():
+        plan = get_query_plan(session, query(session))
+        assert "USING INDEX " + index_name in plan or "USING COVERING INDEX " + index_name in plan, plan
+
+
+def test_missing_columns_are_added(tmp_path):
+    database_file = tmp_path / "test.sqlite3"
+    # Database created before the model artifacts were stored into files
+    shutil.copy("data/RxJava.sqlite3", database_file)
+    engine = db.create_engine(f"sqlite:///{database_file}")
+    setup_database(engine)
+
+    columns = {column["name"] for column in db.inspect(engine).get_columns("model")}
+    assert {"artifact_path", "artifact_format"} <= columns
@@ -0,0 +1,45 @@
+from tests.__fixtures__ import *
+
+import datetime
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from models.commit import Commit
+from models.issue import Issue
+from models.project import Project
+from models.database import setup_database
+from utils.database import save_issues, upsert_rows
+
+
+def test_upsert_commits_is_idempotent():
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    rows = [{"project_id": 1, "hash": h, "committer": "dev", "message": "first"} for h in ["a", "b"]]
+
+    upsert_rows(session, Commit.__table__, rows, ["project_id", "hash"], ["committer", "message"])
+    rows[1]["message"] = "second"
+    upsert_rows(session, Commit.__table__, rows + [dict(rows[0], project_id=2)],
+                ["project_id", "hash"], ["committer", "message"])
+    session.commit()
+
+    commits = session.query(Commit.project_id, Commit.hash, Commit.message).order_by(Commit.commit_id).all()
+    assert commits == [(1, "a", "first"), (1, "b", "second"), (2, "a", "first")]
+
+
+def test_save_issues_inserts_and_updates():
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    date = datetime.datetime(2022, 1, 1)
+    issues = [{"number": n, "title": "first", "created_at": date, "updated_at": date} for n in [1, 2]]
+
+    assert save_issues(session, 1, "git", issues, batch_size=1) == (2, 0)
+    issues.append(dict(issues[0], number=3))
+    issues[1] = dict(issues[1], title="second")
+    assert save_issues(session, 1, "git", issues + [issues[2]], batch_size=1) == (1, 2)
+    session.commit()
+
+    saved = session.query(Issue.number, Issue.title).order_by(Issue.issue_id).all()
+    assert saved == [("1", "first"), ("2", "second"), ("3", "first")]
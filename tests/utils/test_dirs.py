@@ -0,0 +1,71 @@
+from tests.__fixtures__ import *
+import os
+
+from utils.dirs import PathFilter, TmpDirCopyFilteredWithEnv, evict_old_files, make_private_dir
+
+
+def test_path_filter_matches_folders_and_patterns():
+    path_filter = PathFilter(["src/main/"], ["*/generated", "src/main/Old*.java"])
+    assert path_filter.match("src/main/Foo.java")
+    assert not path_filter.match("src/test/FooTest.java")
+    assert not path_filter.match("src/main/generated/Foo.java")
+    assert not path_filter.match("src/main/OldFoo.java")
+    assert PathFilter([], []).match("Foo.java")
+
+
+def test_filtered_dir_links_kept_files(tmp_path):
+    src_dir = tmp_path / "repo"
+    for path in ["src/main/Foo.java", "src/main/generated/Gen.java", "src/test/FooTest.java",
+                 ".git/HEAD", "README.md"]:
+        (src_dir / path).parent.mkdir(parents=True, exist_ok=True)
+        (src_dir / path).write_text(path)
+
+    with TmpDirCopyFilteredWithEnv(str(src_dir), ["src"], ["*/generated", "src/test"]) as tmp_work_dir:
+        files = [os.path.relpath(os.path.join(root, f), tmp_work_dir)
+                 for root, _, filenames in os.walk(tmp_work_dir) for f in filenames]
+        assert files == [os.path.join("src", "main", "Foo.java")]
+        assert os.path.samefile(os.path.join(tmp_work_dir, files[0]), src_dir / "src/main/Foo.java")
+    assert not os.path.exists(tmp_work_dir)
+    assert (src_dir / "src/main/Foo.java").read_text() == "src/main/Foo.java"
+
+
+def test_filtered_dir_keeps_the_sources_and_follows_linked_folders(tmp_path):
+    src_dir = tmp_path / "repo"
+    (src_dir / "src" / "main").mkdir(parents=True)
+    (src_dir / "src" / "main" / "Foo.java").write_text("class Foo {}")
+    (tmp_path / "shared").mkdir()
+    (tmp_path / "shared" / "Bar.java").write_text("class Bar {}")
+    os.symlink(tmp_path / "shared", src_dir / "src" / "shared")
+    # A link to a parent folder must not be walked forever
+    os.symlink(src_dir / "src", src_dir / "src" / "main" / "loop")
+    mode = os.stat(src_dir / "src" / "main" / "Foo.java").st_mode
+
+    with TmpDirCopyFilteredWithEnv(str(src_dir), ["src"], []) as tmp_work_dir:
+        linked_file = os.path.join(tmp_work_dir, "src", "main", "Foo.java")
+        assert os.path.samefile(linked_file, src_dir / "src" / "main" / "Foo.java")
+        # The sources of the working tree are left as they are
+        assert os.stat(linked_file).st_mode == mode
+        assert open(os.path.join(tmp_work_dir, "src", "shared", "Bar.java")).read() == "class Bar {}"
+    assert os.stat(src_dir / "src" / "main" / "Foo.java").st_mode == mode
+
+
+def test_private_dir_refuses_a_shared_folder(tmp_path):
+    assert make_private_dir(str(tmp_path / "cache")) == str(tmp_path / "cache")
+    assert os.stat(tmp_path / "cache").st_mode & 0o777 == 0o700
+
+    (tmp_path / "shared").mkdir()
+    (tmp_path / "shared").chmod(0o777)
+    with pytest.raises(PermissionError):
+        make_private_dir(str(tmp_path / "shared"))
+
+
+def test_evict_old_files_keeps_the_most_recent(tmp_path):
+    for i in range(5):
+        (tmp_path / f"{i}.csv").write_text(str(i))
+        os.utime(tmp_path / f"{i}.csv", (1000 + i, 1000 + i))
+    # Used again
+    os.utime(tmp_path / "0.csv")
+
+    evict_old_files(str(tmp_path), 3)
+
+    assert sorted(os.listdir(tmp_path)) == ["0.csv", "3.csv", "4.csv"]
@@ -0,0 +1,56 @@
+from tests.__fixtures__ import *
+from datetime import datetime
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from models.database import setup_database
+from models.metric import Metric
+from models.project import Project
+from models.version import Version
+from utils import featurestore
+from utils.featurestore import FeatureStore
+
+
+def test_feature_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(featurestore, "FEATURE_STORE_DIR", str(tmp_path))
+    engine = db.create_engine("sqlite://")
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo", language="Java"))
+    for i, tag in enumerate(["v1", "v2", "next"]):
+        session.add(Version(version_id=i + 1, project_id=1, name=tag, tag=tag, bugs=i,
+                            start_date=datetime(2020 + i, 1, 1), end_date=datetime(2021 + i, 1, 1)))
+    session.add_all([Metric(version_id=1, ck_wmc=1.5), Metric(version_id=3, ck_wmc=0.0)])
+    session.commit()
+    store = FeatureStore(1, session, SimpleNamespace(target_database="sqlite://"))
+
+    assert store.refresh()
+    assert not store.refresh()
+    df = store.get_versions(["tag", "bugs", "ck_wmc"], excluded_versions=["v1"])
+    assert df["tag"].tolist() == ["v2", "next"]
+    assert df["ck_wmc"].isna().tolist() == [True, False]
+    df = store.get_versions(["tag"], included_versions=["v1", "v2"], with_metrics=True)
+    assert df["tag"].tolist() == ["v1"]
+
+    # The matrix is built again when a row changes
+    session.query(Metric).filter(Metric.version_id == 1).update({"ck_wmc": 2.0})
+    session.commit()
+    assert store.get_versions(["ck_wmc"])["ck_wmc"].tolist()[0] == 2.0
+    assert not store.refresh()
+
+    # Values swapped between versions, the sums don't change
+    session.query(Version).filter(Version.version_id == 1).update({"bugs": 1})
+    session.query(Version).filter(Version.version_id == 2).update({"bugs": 0})
+    session.commit()
+    assert store.get_versions(["bugs"])["bugs"].tolist() == [1, 0, 2]
+
+    # Bulk updates and deletions change the signature too
+    session.bulk_update_mappings(Version, [{"version_id": 3, "bugs": 5}])
+    session.commit()
+    assert store.get_versions(["bugs"])["bugs"].tolist() == [1, 0, 5]
+    session.query(Metric).filter(Metric.version_id == 3).delete()
+    session.commit()
+    assert store.get_versions(["tag"], with_metrics=True)["tag"].tolist() == ["v1"]
+    assert os.listdir(tmp_path) == [os.path.basename(store.path)]
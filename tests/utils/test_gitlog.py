@@ -0,0 +1,78 @@
+from tests.__fixtures__ import *
+from utils.gitlog import iter_commits_name_status, iter_commits_numstat, parse_commits_name_status, parse_commits_numstat, RECORD_SEPARATOR as RS, FIELD_SEPARATOR as FS
+
+
+def test_parse_commits_numstat():
+    output = (
+        f"{RS}aaa{FS}John{FS}2022-01-01T10:00:00+02:00{FS}First\n\nwith body\n{FS}\n"
+        "10\t2\tsrc/a.py\n-\t-\timg.png\n"
+        f"{RS}bbb{FS}Jane{FS}2022-01-02T10:00:00+00:00{FS}Empty commit\n{FS}"
+    ).encode()
+    # Split the stream anywhere as it would be read from the process
+    chunks = [output[i:i + 7] for i in range(0, len(output), 7)]
+
+    commits = list(parse_commits_numstat(chunks))
+
+    assert [c["hash"] for c in commits] == ["aaa", "bbb"]
+    assert commits[0]["message"] == "First\n\nwith body"
+    assert commits[0]["date"].utcoffset().total_seconds() == 7200
+    assert (commits[0]["insertions"], commits[0]["deletions"]) == (10, 2)
+    assert (commits[0]["lines"], commits[0]["files"]) == (12, 2)
+    assert (commits[1]["lines"], commits[1]["files"]) == (0, 0)
+
+
+def test_parse_commits_numstat_renamed_files():
+    output = (
+        f"{RS}aaa{FS}John{FS}2022-01-01T10:00:00+00:00{FS}Rename{FS}\n"
+        "1\t0\tsrc/{old => new}/a.py\n0\t0\told.py => new.py\n2\t2\tdir/{ => sub}/b.py\n"
+    ).encode()
+
+    commit = next(parse_commits_numstat([output], with_files=True))
+
+    assert commit["modified_files"] == [
+        ("src/old/a.py", "src/new/a.py", 1, 0),
+        ("old.py", "new.py", 0, 0),
+        ("dir/b.py", "dir/sub/b.py", 2, 2),
+    ]
+
+
+def test_parse_commits_name_status():
+    output = (
+        f"{RS}aaa{FS}John{FS}2022-01-01T10:00:00+00:00{FS}\n"
+        "A\tsrc/a.py\nM\tsrc/b.py\nR087\tsrc/c.py\tsrc/d.py\nD\tsrc/e.py\n"
+        f"{RS}bbb{FS}Jane{FS}2022-01-02T10:00:00+00:00{FS}"
+    ).encode()
+
+    commits = list(parse_commits_name_status([output[:30], output[30:]]))
+
+    assert [c["hash"] for c in commits] == ["aaa", "bbb"]
+    assert commits[0]["modified_files"] == [(None, "src/a.py"), ("src/b.py", "src/b.py"),
+                                            ("src/c.py", "src/d.py"), ("src/e.py", None)]
+    assert commits[1]["modified_files"] == []
+
+
+def test_parse_commits_numstat_non_ascii():
+    output = (
+        f"{RS}aaa{FS}José Müller{FS}2022-01-01T10:00:00+00:00{FS}Corrigé l'accès{FS}\n"
+        "1\t0\tsrc/café.py\n"
+    ).encode()
+    # Chunks of 1 byte split every multi-byte character
+    chunks = [output[i:i + 1] for i in range(len(output))]
+
+    commit = next(parse_commits_numstat(chunks, with_files=True))
+
+    assert commit["committer"] == "José Müller"
+    assert commit["message"] == "Corrigé l'accès"
+    assert commit["modified_files"] == [("src/café.py", "src/café.py", 1, 0)]
+
+
+def test_iter_commits_raise_on_git_error(tmp_path):
+    repo_dir = create_repo(tmp_path / "repo", {"a.py": b"a\n"})
+    assert len(list(iter_commits_numstat("git", repo_dir))) == 1
+
+    # Not an empty history
+    with pytest.raises(subprocess.CalledProcessError, match="returned non-zero exit status"):
+        list(iter_commits_numstat("git", repo_dir, rev="unknown"))
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        list(iter_commits_name_status("git", repo_dir, rev="unknown..HEAD"))
+    assert "unknown" in error.value.stderr
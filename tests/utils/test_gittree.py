@@ -0,0 +1,18 @@
+from tests.__fixtures__ import *
+
+from utils.dirs import PathFilter
+from utils.gittree import GitTree
+
+
+def test_list_and_read_files(tmp_path):
+    repo_dir = create_repo(tmp_path, {
+        "src/Foo.java": b"class Foo {}\n",
+        "src/gen/Bar.java": b"class Bar {}\r\n",
+        "docs/README.md": b"# Doc\n"
+    })
+    git_tree = GitTree("git", repo_dir, "v1", PathFilter(["src"], ["src/gen"]))
+
+    files = list(git_tree.list_files())
+    assert [path for path, _ in files] == ["src/Foo.java"]
+    assert list(git_tree.read_blobs([blob_hash for _, blob_hash in files])) == [b"class Foo {}\n"]
+
@@ -1,4 +1,5 @@
 from tests.__fixtures__ import *
+from utils.proglang import build_language_index, guess_file_language, guess_programing_language
 
 def test_guess_programing_language():
     """
@@ -24,4 +25,34 @@ def test_guess_programing_language():
     >>>guess_programing_language("cpp")
     C++
     """
-    pass
\ No newline at end of file
+    pass
+
+def test_guess_programing_language_from_index():
+    assert guess_programing_language("php") == "PHP"
+    assert guess_programing_language(".php") == "PHP"
+    assert guess_programing_language(".hidden/test.h") == "C"
+    assert guess_programing_language("") is None
+    assert guess_programing_language("class") is None
+    assert guess_programing_language("cpp") == "C++"
+    # Files at the root folder and languages known by file name
+    assert guess_programing_language("test.h") == "C"
+    assert guess_programing_language("Makefile") == "Makefile"
+    assert guess_programing_language("src/Makefile") == "Makefile"
+    assert guess_programing_language("src/README") is None
+
+
+def test_guess_file_language_of_names_without_extension():
+    assert guess_file_language("src/main/java/Foo.java") == "Java"
+    assert guess_file_language("Makefile") == "Makefile"
+    assert guess_file_language("java") is None
+    assert guess_file_language("src/main/java") is None
+
+
+def test_build_language_index_keeps_first_language():
+    extensions, filenames = build_language_index({
+        "C": {"extensions": [".c", ".h"]},
+        "C++": {"extensions": [".cpp", ".h"]},
+        "Makefile": {"filenames": ["Makefile"]}
+    })
+    assert extensions == {".c": "C", ".h": "C", ".cpp": "C++"}
+    assert filenames == {"Makefile": "Makefile"}
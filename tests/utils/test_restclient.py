@@ -0,0 +1,49 @@
+from tests.__fixtures__ import *
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from models.httpcache import HttpCache
+from utils.restclient import RestClient
+
+
+def issue_pages(nb_pages, per_page=2):
+    pages = {}
+    for page in range(1, nb_pages + 1):
+        link = f'<{{url}}/issues?per_page={per_page}&page={nb_pages}>; rel="last"'
+        if page < nb_pages:
+            link = f'<{{url}}/issues?per_page={per_page}&page={page + 1}>; rel="next", ' + link
+        path = f"/issues?per_page={per_page}" + (f"&page={page}" if page > 1 else "")
+        numbers = range((page - 1) * per_page + 1, page * per_page + 1)
+        pages[path] = ([{"number": number} for number in numbers], {"Link": link})
+    return pages
+
+
+def test_get_pages_concurrently_then_from_the_cache():
+    engine = db.create_engine("sqlite://")
+    HttpCache.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+
+    with RecordedHttpServer(issue_pages(5)) as server:
+        client = RestClient(server.url, workers=3)
+        issues = list(client.get_pages("/issues", {"per_page": 2}))
+        client.save_cache(session)
+        session.commit()
+        assert [issue["number"] for issue in issues] == list(range(1, 11))
+        assert client.nb_requests == 5
+
+        client = RestClient(server.url, workers=3)
+        client.load_cache(session, "/issues")
+        assert list(client.get_pages("/issues", {"per_page": 2})) == issues
+        assert client.nb_requests == 0
+        assert client.nb_not_modified == 5
+        assert [status for _, status in server.requests[5:]] == [304] * 5
+
+
+def test_get_pages_waits_for_the_reset_of_the_rate_limit():
+    with RecordedHttpServer(issue_pages(4), rate_limit=2, reset_delay=1) as server:
+        client = RestClient(server.url, workers=2, retry_delay=5)
+        issues = list(client.get_pages("/issues", {"per_page": 2}))
+
+    assert [issue["number"] for issue in issues] == list(range(1, 9))
+    assert sorted(path for path, status in server.requests if status == 200) == sorted(issue_pages(4))
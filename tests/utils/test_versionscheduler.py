@@ -0,0 +1,116 @@
+from tests.__fixtures__ import *
+from datetime import datetime
+from types import SimpleNamespace
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from connectors.git import GitConnector
+from models.commit import Commit
+from models.database import setup_database
+from models.metric import Metric
+from models.pipelineprogress import PipelineProgress
+from models.project import Project
+from models.version import Version
+from utils.versionscheduler import PipelineMetrics, VersionAnalysisScheduler
+
+
+def test_pipeline_metrics_summary():
+    metrics = PipelineMetrics()
+    metrics.add_duration("prepare", 1.0)
+    metrics.add_duration("prepare", 3.0)
+    metrics.add_depth("prepared", 0)
+    metrics.add_depth("prepared", 2)
+
+    assert metrics.get_summary() == [
+        "Step prepare: 4.00 s for 2 version(s), max 3.00 s",
+        "Queue prepared: mean depth 1.0, max 2"
+    ]
+
+
+def test_analyze_versions_resumes_from_progress(tmp_path):
+    repo_dir = create_repo(tmp_path / "repo", {"a.py": b"def f(x):\n    if x:\n        return 1\n    return 2\n"})
+    target_database = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    engine = db.create_engine(target_database)
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo", language="Python"))
+    session.add(Commit(project_id=1, hash="init", date=datetime(2020, 1, 1)))
+    session.add_all([Version(project_id=1, name=name, tag="v1", start_date=datetime(2020, 1, 1),
+                             end_date=datetime(2030, 1, 1)) for name in ["1.0", "2.0"]])
+    session.commit()
+    config = SimpleNamespace(target_database=target_database, scm_path="git", source_backend="git",
+                             language="Python", current_branch="HEAD", include_folders=[], exclude_folders=[],
+                             exclude_authors=[], legacy_percent=20, workers=1, lizard_workers=1, batch_size=100)
+
+    VersionAnalysisScheduler(1, repo_dir, session, config).analyze_versions(session.query(Version).all())
+
+    progress = session.query(PipelineProgress).all()
+    assert {(row.stage, row.status) for row in progress} == {("legacy", "done"), ("lizard", "done")}
+    assert len(progress) == 4
+    # No legacy file is a result too
+    assert [metric.nb_legacy_files for metric in session.query(Metric)] == [0, 0]
+    assert [metric.lizard_total_nloc for metric in session.query(Metric)] == [4, 4]
+
+    # A failed stage is done again on the next run, the completed ones are skipped
+    session.query(PipelineProgress).filter(PipelineProgress.stage == "lizard") \
+           .filter(PipelineProgress.version_id == 2).update({"status": "failed"})
+    session.commit()
+    scheduler = VersionAnalysisScheduler(1, repo_dir, session, config)
+    scheduler.analyze_versions(session.query(Version).all())
+
+    assert list(scheduler.metrics.durations) == ["prepare", "lizard", "write"]
+    assert len(scheduler.metrics.durations["lizard"]) == 1
+    assert {row.status for row in session.query(PipelineProgress)} == {"done"}
+
+
+def test_analyze_versions_fails_the_version_without_worktree(tmp_path):
+    repo_dir = create_repo(tmp_path / "repo", {"a.py": b"def f(x):\n    return x\n"})
+    target_database = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    engine = db.create_engine(target_database)
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo", language="Python"))
+    session.add(Commit(project_id=1, hash="init", date=datetime(2020, 1, 1)))
+    session.add_all([Version(project_id=1, name=tag, tag=tag, start_date=datetime(2020, 1, 1),
+                             end_date=datetime(2030, 1, 1)) for tag in ["v1", "missing"]])
+    session.commit()
+    config = SimpleNamespace(target_database=target_database, scm_path="git", source_backend="checkout",
+                             language="Python", current_branch="HEAD", include_folders=[], exclude_folders=[],
+                             exclude_authors=[], legacy_percent=20, workers=2, lizard_workers=1, batch_size=100)
+
+    VersionAnalysisScheduler(1, repo_dir, session, config).analyze_versions(session.query(Version).all())
+
+    progress = {(row.version_id, row.stage): row for row in session.query(PipelineProgress)}
+    assert {key: row.status for key, row in progress.items()} == {
+        (1, "legacy"): "done", (1, "lizard"): "done", (2, "legacy"): "done", (2, "lizard"): "failed"}
+    assert "Cannot check out version missing" in progress[(2, "lizard")].error
+    assert [metric.lizard_total_nloc for metric in session.query(Metric).order_by(Metric.version_id)] == [2, None]
+
+
+def test_analyze_versions_after_cleaning_the_next_release(tmp_path):
+    repo_dir = create_repo(tmp_path / "repo", {"a.py": b"def f(x):\n    return x\n"})
+    target_database = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    engine = db.create_engine(target_database)
+    setup_database(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Project(project_id=1, name="project", repo="repo", language="Python"))
+    session.add(Commit(project_id=1, hash="init", date=datetime(2020, 1, 1)))
+    session.add_all([Version(project_id=1, name=name, tag="v1", start_date=datetime(2020, 1, 1),
+                             end_date=datetime(2030, 1, 1)) for name in ["1.0", "Next Release"]])
+    session.commit()
+    config = SimpleNamespace(target_database=target_database, scm_path="git", source_backend="git",
+                             language="Python", current_branch="HEAD", include_folders=[], exclude_folders=[],
+                             exclude_authors=[], legacy_percent=20, workers=1, lizard_workers=1, batch_size=100,
+                             next_version_name="Next Release")
+    VersionAnalysisScheduler(1, repo_dir, session, config).analyze_versions(session.query(Version).all())
+
+    # The metrics of the next release are computed again at each populate
+    connector = SimpleNamespace(session=session, project_id=1, configuration=config)
+    GitConnector.clean_next_release_metrics(connector)
+    assert session.query(PipelineProgress).filter(PipelineProgress.version_id == 2).count() == 0
+    scheduler = VersionAnalysisScheduler(1, repo_dir, session, config)
+    scheduler.analyze_versions(session.query(Version).all())
+
+    assert len(scheduler.metrics.durations["lizard"]) == 1
+    assert [metric.lizard_total_nloc for metric in session.query(Metric).order_by(Metric.version_id)] == [2, 2]
@@ -15,6 +15,8 @@ from connectors.jira import JiraConnector
 from importers.flatfile import FlatFileImporter
 from exporters.html import HtmlExporter
 from exporters.flatfile import FlatFileExporter
+from utils.versionscheduler import VersionAnalysisScheduler
+from utils.featurestore import FeatureStore
 
 class Container(containers.DeclarativeContainer):
     load_dotenv()
@@ -50,7 +52,20 @@ class Container(containers.DeclarativeContainer):
 
     file_analyzer_provider = providers.Factory(
         FileAnalyzer,
-        session = session
+        session = session,
+        workers = configuration.provided.lizard_workers
+    )
+
+    version_scheduler_provider = providers.Factory(
+        VersionAnalysisScheduler,
+        session = session,
+        config = configuration
+    )
+
+    feature_store_provider = providers.Factory(
+        FeatureStore,
+        session = session,
+        config = configuration
     )
 
     flat_file_importer_provider = providers.Singleton(
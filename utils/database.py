@@ -1,22 +1,63 @@
-import os
-from typing import List
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import Table, func, tuple_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from configuration import Configuration
 
+from models.author import Author
 from models.file import File
+from models.issue import Issue
+from models.pipelineprogress import PipelineProgress
 from models.version import Version
-from utils.proglang import guess_programing_language
+from utils.proglang import guess_file_language
 
 def save_file_if_not_found(session, file_path):
     file = session.query(File).filter(File.path == file_path).first()
     if not file:
         # Guess the programming language
-        extension = os.path.splitext(file_path)[-1]
-        lang = guess_programing_language(extension)
+        lang = guess_file_language(file_path)
         file = File(path=file_path, language=lang)
         session.add(file)
         session.commit()
     return file
 
+def save_files_if_not_found(session, file_paths: Iterable[str], batch_size: int) -> Dict[str, int]:
+    """
+    Find or create the files of the paths in batches, the caller commits
+    Return the identifier of each path
+    """
+    file_ids = _get_ids(session, File.path, File.file_id, file_paths, batch_size)
+    new_files = [{"path": path, "language": guess_file_language(path)}
+                 for path, file_id in file_ids.items() if file_id is None]
+    if new_files:
+        session.bulk_insert_mappings(File, new_files)
+        file_ids.update(_get_ids(session, File.path, File.file_id, [f["path"] for f in new_files], batch_size))
+    return file_ids
+
+def save_authors_if_not_found(session, names: Iterable[str], batch_size: int) -> Dict[str, int]:
+    """
+    Find or create the authors of the names in batches, the caller commits
+    Return the identifier of each name
+    """
+    author_ids = _get_ids(session, Author.name, Author.author_id, names, batch_size)
+    new_authors = [{"name": name} for name, author_id in author_ids.items() if author_id is None]
+    if new_authors:
+        session.bulk_insert_mappings(Author, new_authors)
+        author_ids.update(_get_ids(session, Author.name, Author.author_id,
+                                   [a["name"] for a in new_authors], batch_size))
+    return author_ids
+
+def _get_ids(session, key_column, id_column, keys: Iterable[str], batch_size: int) -> Dict[str, int]:
+    """Identifier of each key, None if not found, the first row if several rows have the same key"""
+    ids = dict.fromkeys(keys)
+    keys = list(ids)
+    for i in range(0, len(keys), batch_size):
+        rows = session.query(key_column, func.min(id_column)) \
+                      .filter(key_column.in_(keys[i:i + batch_size])) \
+                      .group_by(key_column)
+        ids.update(rows)
+    return ids
+
 def get_included_and_current_versions_filter(session, configuration: Configuration) -> List[str]:
     
     if not configuration.include_versions:
@@ -26,4 +67,131 @@ def get_included_and_current_versions_filter(session, configuration: Configurati
                                       .filter(Version.name == configuration.next_version_name) \
                                       .first()
 
-    return configuration.include_versions + [current_version.tag]
\ No newline at end of file
+    return configuration.include_versions + [current_version.tag]
+
+def upsert_rows(session, table: Table, rows: List[Dict], index_elements: List[str], update_columns: List[str]):
+    """
+    Insert the rows with a single Core INSERT, the rows already present
+    (same values of the unique index_elements) are updated instead
+
+    Parameters:
+    -----------
+    - session : Session
+        SQLAlchemy session, the caller commits
+    - table : Table
+        Table of the rows, e.g. Commit.__table__
+    - rows : List[Dict]
+        Values of the rows, all with the same keys
+    - index_elements : List[str]
+        Columns of the unique index identifying a row
+    - update_columns : List[str]
+        Columns updated when the row already exists
+    """
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect in ["sqlite", "postgresql"]:
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: statement.excluded[column] for column in update_columns}
+        )
+    elif dialect == "mysql":
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(
+            {column: statement.inserted[column] for column in update_columns}
+        )
+    else:
+        # No upsert statement, the rows already present are skipped
+        keys = [tuple(row[column] for column in index_elements) for row in rows]
+        key_columns = tuple_(*[table.c[column] for column in index_elements])
+        existing = set(session.execute(table.select().with_only_columns(*[table.c[column] for column in index_elements])
+                                       .where(key_columns.in_(keys))).all())
+        rows = [row for row, key in zip(rows, keys) if key not in existing]
+        if not rows:
+            return
+        statement = table.insert()
+    session.execute(statement, rows)
+
+def save_issues(session, project_id: int, source: str, issues: Iterable[Dict], batch_size: int) -> Tuple[int, int]:
+    """
+    Insert or update issues in bulk, the existing issues are found in a single
+    preloaded map of their numbers to their identifiers
+
+    Parameters:
+    -----------
+    - session : Session
+        SQLAlchemy session, the caller commits
+    - project_id : int
+        Identifier of the project
+    - source : str
+        Source of the issues, e.g. git or jira
+    - issues : Iterable[Dict]
+        Issues with number, title, created_at and updated_at
+    - batch_size : int
+        Number of rows by statement
+
+    Returns:
+    --------
+    Number of inserted issues, number of updated issues
+    """
+    issue_ids = {str(number): issue_id for number, issue_id in
+                 session.query(Issue.number, Issue.issue_id)
+                        .filter(Issue.project_id == project_id)
+                        .filter(Issue.source == source)}
+    new_issues = {}
+    inserted_numbers = set()
+    updated_issues = []
+    nb_updated = 0
+    for issue in issues:
+        number = str(issue["number"])
+        issue_id = issue_ids.get(number)
+        if issue_id:
+            updated_issues.append({"issue_id": issue_id, "title": issue["title"], "created_at": issue["created_at"],
+                                   "updated_at": issue["updated_at"]})
+            if len(updated_issues) >= batch_size:
+                session.bulk_update_mappings(Issue, updated_issues)
+                nb_updated += len(updated_issues)
+                updated_issues = []
+        else:
+            # An issue may be listed twice when it is updated during the sync,
+            # the last one is kept (the rows already inserted are upserted)
+            new_issues[number] = {
+                "project_id": project_id,
+                "number": number,
+                "title": issue["title"],
+                "source": source,
+                "created_at": issue["created_at"],
+                "updated_at": issue["updated_at"]
+            }
+            if len(new_issues) >= batch_size:
+                upsert_rows(session, Issue.__table__, list(new_issues.values()),
+                            ["project_id", "number", "source"], ["title", "updated_at"])
+                inserted_numbers.update(new_issues)
+                new_issues = {}
+    session.bulk_update_mappings(Issue, updated_issues)
+    nb_updated += len(updated_issues)
+    upsert_rows(session, Issue.__table__, list(new_issues.values()),
+                ["project_id", "number", "source"], ["title", "updated_at"])
+    inserted_numbers.update(new_issues)
+    return len(inserted_numbers), nb_updated
+
+def get_pipeline_progress(session, version_ids: List[int],
+                          batch_size: int) -> Dict[Tuple[int, str], PipelineProgress]:
+    """Return the progress of the stages of the versions by (version_id, stage)"""
+    progress = {}
+    for i in range(0, len(version_ids), batch_size):
+        for row in session.query(PipelineProgress) \
+                          .filter(PipelineProgress.version_id.in_(version_ids[i:i + batch_size])):
+            progress[(row.version_id, row.stage)] = row
+    return progress
+
+def save_pipeline_progress(session, version_id: int, stage: str, status: str, duration: float = None,
+                           fingerprint: str = None, tool_version: str = None, error: str = None):
+    """Record the status of a stage of a version, the caller commits"""
+    row = {"version_id": version_id, "stage": stage, "status": status, "duration": duration,
+           "fingerprint": fingerprint, "tool_version": tool_version, "error": error,
+           "updated_at": datetime.now()}
+    upsert_rows(session, PipelineProgress.__table__, [row], ["version_id", "stage"],
+                ["status", "duration", "fingerprint", "tool_version", "error", "updated_at"])
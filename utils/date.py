@@ -4,4 +4,8 @@ def date_iso_8601_to_datetime(date_str: str):
     return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%f%z')
 
 def datetime_to_date_hours_minuts(date_datetime: datetime):
-    return date_datetime.strftime("%Y-%m-%d %H:%M")
\ No newline at end of file
+    return date_datetime.strftime("%Y-%m-%d %H:%M")
+
+def date_iso_8601_utc_to_datetime(date_str: str):
+    """Naive UTC datetime of a date such as 2011-04-22T13:33:48Z (GitHub API)"""
+    return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%SZ')
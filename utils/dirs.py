@@ -1,47 +1,145 @@
+import errno
+import logging
 import os
+import re
 import shutil
 import fnmatch
+import stat
 import tempfile
 
+class PathFilter:
+    """
+    Filter the paths relative to the repository with OTTM_INCLUDE_FOLDERS and
+    OTTM_EXCLUDE_FOLDERS, e.g. to build the filtered view of TmpDirCopyFilteredWithEnv
+
+    A path is kept when it is inside an included folder (or no folder is
+    included) and when neither it nor one of its folders matches an excluded
+    pattern (fnmatch syntax)
+    """
+
+    def __init__(self, include_folders, exclude_folders):
+        self.__include_folders = [d.strip("/") for d in include_folders if d.strip("/")]
+        exclude_patterns = [fnmatch.translate(d.rstrip("/")) for d in exclude_folders if d.rstrip("/")]
+        self.__exclude_regex = re.compile("|".join(exclude_patterns)) if exclude_patterns else None
+
+    def match(self, path: str) -> bool:
+        if self.__include_folders and not any(path == d or path.startswith(d + "/")
+                                              for d in self.__include_folders):
+            return False
+        return not self.__is_excluded(path)
+
+    def match_folder(self, path: str) -> bool:
+        """Return False when no path inside the folder can be kept"""
+        if self.__include_folders and not any(path == d or path.startswith(d + "/") or d.startswith(path + "/")
+                                              for d in self.__include_folders):
+            return False
+        return not self.__is_excluded(path)
+
+    def __is_excluded(self, path: str) -> bool:
+        if self.__exclude_regex is None:
+            return False
+        end = path.find("/")
+        while end != -1:
+            if self.__exclude_regex.match(path[:end]):
+                return True
+            end = path.find("/", end + 1)
+        return self.__exclude_regex.match(path) is not None
+
 class TmpDirCopyFilteredWithEnv(tempfile.TemporaryDirectory):
+    """
+    Temporary view of a directory filtered with OTTM_INCLUDE_FOLDERS and
+    OTTM_EXCLUDE_FOLDERS
+
+    The files are hard linked into a real directory tree, so the tools
+    like CK see regular files without copying them. The files are copied
+    when hard links are not possible (e.g. another file system).
+    The .git folder of the source directory is skipped, the symbolic links
+    to folders are followed as shutil.copytree does.
+
+    A hard link is the file of the source directory itself, its permissions
+    aren't changed (a process killed before the cleanup would leave them so):
+    the tools run on the view (CK, Lizard) only read the files.
+    """
 
     def __init__(self, dirname, include_folders, exclude_folders):
-        self.__include_folders = include_folders
-        self.__exclude_folders = exclude_folders
+        self.__path_filter = PathFilter(include_folders, exclude_folders)
         self.__src_dir = dirname
         # This is bad for single responsability principle, but save
         # some processing time if no dirs are included nor excluded
-        if not self.__include_folders and not self.__exclude_folders:
+        if not include_folders and not exclude_folders:
             self.__tmp_file_created = False
             self.name = dirname
         else:
             self.__tmp_file_created = True
             super().__init__()
-            self.__copy_dirs_filtered()
+            try:
+                self.__link_files_filtered()
+            except BaseException:
+                self.cleanup()
+                raise
+
+    def __link_files_filtered(self):
+        use_links = True
+        # Real paths of the folders walked, a symbolic link can't make a cycle
+        walked_dirs = set()
+        for src_path, dirnames, filenames in os.walk(self.__src_dir, followlinks=True):
+            walked_dirs.add(os.path.realpath(src_path))
+            relative_dir = os.path.relpath(src_path, self.__src_dir)
+            relative_dir = "" if relative_dir == "." else relative_dir.replace(os.sep, "/") + "/"
+            # Prune the folders that can't contain kept files
+            dirnames[:] = [d for d in dirnames
+                           if not (relative_dir == "" and d == ".git")
+                           and self.__path_filter.match_folder(relative_dir + d)
+                           and os.path.realpath(os.path.join(src_path, d)) not in walked_dirs]
+            for d in dirnames:
+                os.mkdir(os.path.join(self.name, relative_dir, d))
+
+            for filename in filenames:
+                if not self.__path_filter.match(relative_dir + filename):
+                    continue
+                src = os.path.join(src_path, filename)
+                dst = os.path.join(self.name, relative_dir, filename)
+                try:
+                    if use_links:
+                        try:
+                            os.link(src, dst)
+                            continue
+                        except OSError as e:
+                            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                                raise
+                            logging.info("Can't create hard links (" + str(e) + "), the files are copied")
+                            use_links = False
+                    shutil.copy2(src, dst)
+                except OSError as e:
+                    logging.warning("Can't add " + src + " to the filtered directory: " + str(e))
 
-    def __copy_dirs_filtered(self):
-        if self.__include_folders:
-            self.__copy_included_dirs_only()
-        else:
-            self.__copy_all_tree()
-
-    def __copy_included_dirs_only(self):
-        for d in self.__include_folders:
-            src = os.path.join(self.__src_dir, d)
-            dst = os.path.join(self.name, d)
-            shutil.copytree(src, dst, ignore=self.__ignore_function)
-
-    def __copy_all_tree(self):
-        shutil.copytree(self.__src_dir, self.name, ignore=self.__ignore_function,dirs_exist_ok=True)
-
-    def __ignore_function(self, path, names):
-        full_names = [os.path.join(path, n) for n in names]
-        ignored_full_names = []
-        for excluded_dir in self.__exclude_folders:
-            full_excluded_dir = os.path.join(self.__src_dir, excluded_dir)
-            ignored_full_names.extend(fnmatch.filter(full_names, full_excluded_dir))
-        return [os.path.basename(i) for i in ignored_full_names]
-        
     def __exit__(self, exc, value, tb):
         if self.__tmp_file_created:
-            super().__exit__(exc, value, tb)
\ No newline at end of file
+            super().__exit__(exc, value, tb)
+
+def make_private_dir(directory: str) -> str:
+    """
+    Create a folder that only the user can read and write, e.g. for the caches
+    whose files are unpickled. An existing folder must belong to the user and
+    must not be writable by the others, PermissionError is raised otherwise
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    dir_stat = os.stat(directory)
+    if hasattr(os, "getuid") and dir_stat.st_uid != os.getuid():
+        raise PermissionError(directory + " doesn't belong to the user")
+    if dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(directory + " is writable by other users")
+    return directory
+
+def evict_old_files(directory: str, max_files: int):
+    """Keep the max_files files of a cache folder most recently used (modification date)"""
+    entries = [entry for entry in os.scandir(directory) if entry.is_file()]
+    if len(entries) <= max_files:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[max_files:]:
+        try:
+            os.remove(entry.path)
+        except OSError as e:
+            # Removed by another process
+            logging.debug("Can't evict " + entry.path + ": " + str(e))
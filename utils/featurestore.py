@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Iterator, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlalchemy import func, select
+
+from models.metric import Metric
+from models.version import Version
+from utils.timeit import timeit
+
+# Feature matrices of the projects, by hash of the database and project
+FEATURE_STORE_DIR = os.path.join(tempfile.gettempdir(), "ottm-feature-store")
+# Schema metadata key of the signature of the rows the matrix was built from
+SIGNATURE_KEY = b"ottm_signature"
+
+# Version columns, then metric columns (its version_id is the one of the version)
+FEATURE_COLUMNS = [column for column in Version.__table__.columns if column.name != "revision"] + \
+                  [column for column in Metric.__table__.columns if column.name not in ["version_id", "revision"]]
+
+class FeatureStore:
+    """
+    Feature matrix of the versions of a project (the version columns joined
+    with the metric ones), read by the ML models, the reports and the exports
+
+    The matrix is materialized into an Arrow IPC file that is memory-mapped
+    when read, only the requested columns are converted to pandas. It is built
+    again when the version or metric rows change: the file keeps a signature
+    of the rows, their number and their last revision (set at each write), read
+    with a single aggregate query.
+
+    Attributes:
+    -----------
+     - project_id   Identifier of the project
+     - session      Database connection managed by sqlachemy
+     - path         Arrow IPC file of the matrix
+    """
+
+    def __init__(self, project_id, session, config):
+        self.project_id = project_id
+        self.session = session
+        self.configuration = config
+        database_hash = hashlib.sha1(str(config.target_database).encode()).hexdigest()
+        self.path = os.path.join(FEATURE_STORE_DIR, f"{database_hash}-{project_id}.arrow")
+
+    @timeit
+    def refresh(self) -> bool:
+        """
+        Materialize the matrix if the rows changed since it was built
+        Return True if it was built again
+        """
+        signature = self.__get_signature()
+        if self.__read_signature() == signature:
+            logging.info("Feature store up to date: " + self.path)
+            return False
+
+        statement = select(*FEATURE_COLUMNS) \
+            .outerjoin(Metric, Metric.version_id == Version.version_id) \
+            .filter(Version.project_id == self.project_id) \
+            .order_by(Version.start_date.asc(), Version.version_id.asc())
+        df = pd.read_sql(statement, self.session.get_bind())
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), SIGNATURE_KEY: signature.encode()})
+
+        os.makedirs(FEATURE_STORE_DIR, exist_ok=True)
+        # A file per writer, concurrent commands (report, predict) may build the matrix at the same time
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=FEATURE_STORE_DIR)
+        os.close(fd)
+        try:
+            with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        logging.info(f"Feature store built with {len(df)} version(s): " + self.path)
+        return True
+
+    def get_versions(self, columns: List[str] = None, included_versions: List[str] = None,
+                     excluded_versions: List[str] = None, with_metrics: bool = False) -> pd.DataFrame:
+        """
+        Return the versions ordered by start date, only the columns asked
+        The versions are filtered as by Version.include_filter and Version.exclude_filter,
+        with_metrics keeps the versions having metrics (inner join)
+        """
+        batches = list(self.iter_batches(columns, included_versions, excluded_versions, with_metrics))
+        return pa.Table.from_batches(batches).to_pandas()
+
+    def iter_batches(self, columns: List[str] = None, included_versions: List[str] = None,
+                     excluded_versions: List[str] = None, with_metrics: bool = False,
+                     batch_size: int = None) -> Iterator[pa.RecordBatch]:
+        """
+        Stream the versions as get_versions does, by batches of at most batch_size
+        rows read from the memory-mapped file
+        """
+        self.refresh()
+        with pa.memory_map(self.path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            columns = columns or table.column_names
+            needed = set(columns) | {"tag", "metrics_id"}
+            table = table.select([name for name in table.column_names if name in needed])
+            batches = table.to_batches(max_chunksize=batch_size)
+            if not batches:
+                # Keep the schema of the empty matrix
+                batches = [pa.RecordBatch.from_pylist([], schema=table.schema)]
+            for batch in batches:
+                mask = pa.array([True] * batch.num_rows, pa.bool_())
+                if included_versions:
+                    mask = pc.and_(mask, pc.is_in(batch["tag"], pa.array(included_versions)))
+                if excluded_versions:
+                    mask = pc.and_(mask, pc.invert(pc.is_in(batch["tag"], pa.array(excluded_versions))))
+                if with_metrics:
+                    mask = pc.and_(mask, pc.is_valid(batch["metrics_id"]))
+                yield batch.filter(mask).select(columns)
+
+    def __read_signature(self) -> str:
+        if not os.path.exists(self.path):
+            return None
+        with pa.memory_map(self.path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        signature = metadata.get(SIGNATURE_KEY)
+        return signature.decode() if signature else None
+
+    def __get_signature(self) -> str:
+        """
+        Number of version and metric rows and their last revision, a row
+        written, added or deleted changes it
+        """
+        statement = select(func.count(Version.version_id), func.max(Version.revision),
+                           func.count(Metric.metrics_id), func.max(Metric.revision)) \
+            .outerjoin(Metric, Metric.version_id == Version.version_id) \
+            .filter(Version.project_id == self.project_id)
+        return ":".join(str(value) for value in self.session.execute(statement).one())
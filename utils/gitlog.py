@@ -0,0 +1,234 @@
+import codecs
+import logging
+import subprocess
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+# Control characters used to split the output of git log. They can't appear
+# in a commit hash, a name or a date and are very unlikely in a message
+RECORD_SEPARATOR = "\x1e"
+FIELD_SEPARATOR = "\x1f"
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_commits_numstat(scm_path: str, directory: str, since: datetime = None,
+                         rev: str = "HEAD", with_files: bool = False) -> Iterator[Dict]:
+    """
+    Stream the history of a repository with a single git log process
+
+    The commits are yielded from the oldest to the newest, merge commits are
+    skipped (same traversal as pydriller's Repository(only_no_merge=True)).
+    The line counts are taken from --numstat, binary files count as 0 lines.
+
+    Parameters:
+    -----------
+    - scm_path : str
+        Path to the git executable
+    - directory : str
+        Local folder where the repository was cloned
+    - since : datetime
+        Only return commits more recent than this date
+    - rev : str
+        Revision or range of revisions to walk
+    - with_files : bool
+        Add the list of modified files to the commits
+
+    Yield a dictionary per commit with the keys hash, committer, date,
+    message, insertions, deletions, lines and files. With with_files, the
+    key modified_files holds a list of (old_path, new_path, added, deleted)
+    """
+    pretty = FIELD_SEPARATOR.join(["%H", "%cn", "%cI", "%B"])
+    args = [scm_path, "-c", "core.quotepath=off", "--no-pager", "log", "--reverse", "--no-merges", "--numstat",
+            f"--pretty=format:{RECORD_SEPARATOR}{pretty}{FIELD_SEPARATOR}"]
+    if since:
+        args.append("--since=" + since.isoformat())
+    args.append(rev)
+
+    logging.info('Executed command line: ' + ' '.join(args))
+    yield from parse_commits_numstat(_read_git_output(args, directory), with_files)
+
+
+def parse_commits_numstat(chunks: Iterator[bytes], with_files: bool = False) -> Iterator[Dict]:
+    """
+    Parse the output of iter_commits_numstat's git log on the fly
+
+    Parameters:
+    -----------
+    - chunks : Iterator[bytes]
+        Raw output of git log, split anywhere
+    - with_files : bool
+        Add the list of modified files to the commits
+    """
+    for record in _split_records(chunks):
+        yield _parse_record(record, with_files)
+
+
+def iter_commits_name_status(scm_path: str, directory: str, rev: str = "HEAD") -> Iterator[Dict]:
+    """
+    Stream the history of a repository with the status of the modified files,
+    without computing any diff content (git log --name-status)
+
+    The commits are yielded from the oldest to the newest, merge commits are
+    skipped and renames are detected as pydriller does.
+
+    Parameters:
+    -----------
+    - scm_path : str
+        Path to the git executable
+    - directory : str
+        Local folder where the repository was cloned
+    - rev : str
+        Revision or range of revisions to walk
+
+    Yield a dictionary per commit with the keys hash, committer, date and
+    modified_files, a list of (old_path, new_path). old_path is None for an
+    added file, new_path is None for a deleted file
+    """
+    pretty = FIELD_SEPARATOR.join(["%H", "%cn", "%cI"])
+    args = [scm_path, "-c", "core.quotepath=off", "--no-pager", "log", "--reverse", "--no-merges",
+            "--name-status", "-M", f"--pretty=format:{RECORD_SEPARATOR}{pretty}{FIELD_SEPARATOR}", rev]
+
+    logging.info('Executed command line: ' + ' '.join(args))
+    yield from parse_commits_name_status(_read_git_output(args, directory))
+
+
+def parse_commits_name_status(chunks: Iterator[bytes]) -> Iterator[Dict]:
+    """
+    Parse the output of iter_commits_name_status's git log on the fly
+
+    Parameters:
+    -----------
+    - chunks : Iterator[bytes]
+        Raw output of git log, split anywhere
+    """
+    for record in _split_records(chunks):
+        commit_hash, committer, date, name_status = record.split(FIELD_SEPARATOR, 3)
+        yield {
+            "hash": commit_hash,
+            "committer": committer,
+            "date": datetime.fromisoformat(date),
+            "modified_files": _parse_name_status(name_status.splitlines())
+        }
+
+
+def _split_records(chunks: Iterator[bytes]) -> Iterator[str]:
+    # A multi-byte character might be split between two chunks, the decoder
+    # keeps its first bytes until the next chunk
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        records = buffer.split(RECORD_SEPARATOR)
+        # The last record might be incomplete, keep it for the next chunk
+        buffer = records.pop()
+        for record in records:
+            if record:
+                yield record
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+def _read_git_output(args: List[str], directory: str) -> Iterator[bytes]:
+    """
+    Stream the output of a git command, raise CalledProcessError once it is
+    all read if git failed (e.g. unknown revision), so it isn't taken for an
+    empty history. The caller may stop reading earlier
+    """
+    # stderr is written to a file, a pipe could fill up while stdout is read
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(args, cwd=directory, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            yield from _read_chunks(process.stdout)
+        finally:
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(process.returncode, args,
+                                                stderr=stderr.read().decode(errors="replace"))
+
+
+def _read_chunks(stream) -> Iterator[bytes]:
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _parse_record(record: str, with_files: bool) -> Dict:
+    commit_hash, committer, date, message, numstat = record.split(FIELD_SEPARATOR, 4)
+    modified_files = _parse_numstat(numstat.splitlines())
+    insertions = sum(added for _, _, added, _ in modified_files)
+    deletions = sum(deleted for _, _, _, deleted in modified_files)
+    commit = {
+        "hash": commit_hash,
+        "committer": committer,
+        "date": datetime.fromisoformat(date),
+        "message": message.strip(),
+        "insertions": insertions,
+        "deletions": deletions,
+        "lines": insertions + deletions,
+        "files": len(modified_files),
+    }
+    if with_files:
+        commit["modified_files"] = modified_files
+    return commit
+
+
+def _parse_numstat(lines: List[str]) -> List[Tuple[str, str, int, int]]:
+    modified_files = []
+    for line in lines:
+        if not line:
+            continue
+        raw_insertions, raw_deletions, path = line.split("\t", 2)
+        old_path, new_path = _parse_renamed_path(path)
+        modified_files.append((
+            old_path,
+            new_path,
+            int(raw_insertions) if raw_insertions != "-" else 0,
+            int(raw_deletions) if raw_deletions != "-" else 0
+        ))
+    return modified_files
+
+
+def _parse_name_status(lines: List[str]) -> List[Tuple[str, str]]:
+    modified_files = []
+    for line in lines:
+        if not line:
+            continue
+        status, *paths = line.split("\t")
+        if status[0] in "RC":
+            # Renamed or copied, with a similarity score e.g. R100
+            old_path, new_path = paths
+            if status[0] == "C":
+                old_path = None
+        elif status[0] == "A":
+            old_path, new_path = None, paths[0]
+        elif status[0] == "D":
+            old_path, new_path = paths[0], None
+        else:
+            old_path = new_path = paths[0]
+        modified_files.append((old_path, new_path))
+    return modified_files
+
+
+def _parse_renamed_path(path: str) -> Tuple[str, str]:
+    """
+    Split the paths of a renamed file as shown by --numstat
+    e.g. "src/{old => new}/File.java" or "old.py => new.py"
+    """
+    if " => " not in path:
+        return path, path
+    if "{" in path and "}" in path:
+        prefix, rest = path.split("{", 1)
+        renamed, suffix = rest.split("}", 1)
+        old, new = renamed.split(" => ", 1)
+        old_path = (prefix + old + suffix).replace("//", "/")
+        new_path = (prefix + new + suffix).replace("//", "/")
+        return old_path, new_path
+    old_path, new_path = path.split(" => ", 1)
+    return old_path, new_path
@@ -0,0 +1,74 @@
+import logging
+import subprocess
+from typing import Iterator, List, Tuple
+
+from utils.dirs import PathFilter
+
+# Mode of the symbolic links in a git tree, they are skipped as by a
+# glob of the working tree
+SYMLINK_MODE = "120000"
+
+
+class GitTree:
+    """
+    Files of a revision, read from the git object database without checkout
+
+    Attributes:
+    -----------
+     - scm_path     Path to the git executable
+     - repo_dir     Folder where the project is cloned
+     - rev          Tag or commit to read
+     - path_filter  Filter built from OTTM_INCLUDE_FOLDERS / OTTM_EXCLUDE_FOLDERS
+    """
+
+    def __init__(self, scm_path: str, repo_dir: str, rev: str, path_filter: PathFilter = None):
+        self.scm_path = scm_path
+        self.repo_dir = repo_dir
+        self.rev = rev
+        self.path_filter = path_filter
+
+    def list_files(self) -> Iterator[Tuple[str, str]]:
+        """
+        List the files of the revision with git ls-tree
+        Yield (path relative to the repository, blob hash)
+        """
+        args = [self.scm_path, "ls-tree", "-r", "-z", "--full-tree", self.rev]
+        logging.info('Executed command line: ' + ' '.join(args))
+        process = subprocess.run(args, cwd=self.repo_dir, stdout=subprocess.PIPE)
+        process.check_returncode()
+        for entry in process.stdout.split(b"\0"):
+            if not entry:
+                continue
+            info, path = entry.split(b"\t", 1)
+            mode, object_type, blob_hash = info.decode().split(" ")
+            if object_type != "blob" or mode == SYMLINK_MODE:
+                continue
+            path = path.decode("utf-8", errors="surrogateescape")
+            if self.path_filter is None or self.path_filter.match(path):
+                yield path, blob_hash
+
+    def read_blobs(self, blob_hashes: List[str]) -> Iterator[bytes]:
+        """
+        Stream the content of the blobs from a single git cat-file --batch process
+        The contents are yielded in the order of blob_hashes
+        """
+        if not blob_hashes:
+            return
+        args = [self.scm_path, "cat-file", "--batch"]
+        logging.info('Executed command line: ' + ' '.join(args))
+        process = subprocess.Popen(args, cwd=self.repo_dir, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            for blob_hash in blob_hashes:
+                process.stdin.write(blob_hash.encode() + b"\n")
+                process.stdin.flush()
+                # <hash> SP <type> SP <size> LF <content> LF
+                header = process.stdout.readline().split()
+                if len(header) != 3:
+                    raise ValueError(f"Blob {blob_hash} not found in {self.repo_dir}")
+                content = process.stdout.read(int(header[2]))
+                process.stdout.read(1)
+                yield content
+        finally:
+            process.stdin.close()
+            process.stdout.close()
+            process.wait()
@@ -1,11 +1,63 @@
 import os
 import json
+import logging
+import pickle
+from functools import lru_cache
+from typing import Dict, Tuple
 
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "resources")
+# Github's Linguist JSON map
+LANGUAGES_FILE = os.path.join(RESOURCES_DIR, "languages.json")
+# Indexes built from the JSON map, saved to skip the build at the next start
+LANGUAGES_INDEX_FILE = os.path.join(RESOURCES_DIR, "languages.pickle")
+
+_language_index = None
+
+def get_language_index() -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Return the extension -> language and filename -> language indexes
+    The first language of the Linguist map wins when several share a key
+    """
+    global _language_index
+    if _language_index is None:
+        _language_index = _load_language_index()
+    return _language_index
+
+def build_language_index(language_map: Dict) -> Tuple[Dict[str, str], Dict[str, str]]:
+    extensions = {}
+    filenames = {}
+    for language, properties in language_map.items():
+        for extension in properties.get("extensions", []):
+            extensions.setdefault(extension, language)
+        for filename in properties.get("filenames", []):
+            filenames.setdefault(filename, language)
+    return extensions, filenames
+
+def _load_language_index() -> Tuple[Dict[str, str], Dict[str, str]]:
+    try:
+        if os.path.getmtime(LANGUAGES_INDEX_FILE) >= os.path.getmtime(LANGUAGES_FILE):
+            with open(LANGUAGES_INDEX_FILE, mode="rb") as fd:
+                return pickle.load(fd)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    with open(LANGUAGES_FILE, mode="r") as fd:
+        index = build_language_index(json.load(fd))
+    try:
+        with open(LANGUAGES_INDEX_FILE, mode="wb") as fd:
+            pickle.dump(index, fd)
+    except OSError as e:
+        # Read-only installation, the index will be built again next time
+        logging.debug("Can't save the languages index: " + str(e))
+    return index
+
+@lru_cache(maxsize=4096)
 def guess_programing_language(file_extension):
     """
-    Guess what is the programming language from a file extension
-    
-    
+    Guess what is the programming language from a file extension,
+    a file name or a file path
+
+
     >>>guess_programing_language("php")
     PHP
     >>>guess_programing_language(".php")
@@ -24,28 +76,47 @@ def guess_programing_language(file_extension):
     None
     >>>guess_programing_language("cpp")
     C++
+    >>>guess_programing_language("Makefile")
+    Makefile
+    >>>guess_programing_language("test.h")
+    C
     """
-    # Clean the input
-    if (file_extension == ""):
+    if not file_extension:
         return None
-    elif "/" in file_extension:
-        file_extension = os.path.splitext(file_extension)[1]
-    if (file_extension == ""):
+    extensions, filenames = get_language_index()
+
+    if "/" not in file_extension:
+        if file_extension[0] != ".":
+            language = extensions.get("." + file_extension)
+        else:
+            language = extensions.get(file_extension)
+        if language is None:
+            # A file name without extension
+            language = filenames.get(file_extension)
+        if language is not None or "." not in file_extension[1:]:
+            return language
+
+    # A path or a file name at the root folder of the project
+    return guess_file_language(file_extension)
+
+@lru_cache(maxsize=4096)
+def guess_file_language(file_path):
+    """
+    Guess what is the programming language of a file path
+    Unlike guess_programing_language, a bare name is a file name, never an extension
+
+    >>>guess_file_language("src/Main.java")
+    Java
+    >>>guess_file_language("Makefile")
+    Makefile
+    >>>guess_file_language("java")
+    None
+    """
+    extensions, filenames = get_language_index()
+    file_name = os.path.basename(file_path)
+    if file_name in filenames:
+        return filenames[file_name]
+    file_extension = os.path.splitext(file_name)[1]
+    if file_extension == "":
         return None
-    if file_extension[0] != ".":
-        file_extension = "." + file_extension
-
-    # TODO : bug when the file is at the root folder of the project
-        
-    # Load the Github's Linguist JSON map
-    if hasattr(guess_programing_language, 'language_map') is False:
-        fd = open(os.path.dirname(os.path.realpath(__file__)) + "/resources/languages.json",mode='r')
-        guess_programing_language.language_map = json.load(fd)
-        fd.close()
-    
-    # Match with the most probable language
-    language_results = list(map(
-            lambda file_args: file_args[0] if file_extension in list(map(
-                lambda i: i, file_args[1].get("extensions", []))) else None, guess_programing_language.language_map.items()))
-    language_results = list(filter(None, language_results))
-    return language_results[0] if len(language_results) > 0 else None
+    return extensions.get(file_extension)
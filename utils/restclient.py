@@ -0,0 +1,265 @@
+import datetime
+import json
+import logging
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator
+
+from models.httpcache import HttpCache
+from utils.database import upsert_rows
+
+# Number of attempts of a request refused because of the rate limit
+MAX_ATTEMPTS = 3
+
+LINK_PATTERN = re.compile(r'<([^>]*)>;\s*rel="([^"]*)"')
+
+
+class RestResponse:
+    """
+    Response of a JSON REST API
+
+    Attributes:
+    -----------
+     - data         Decoded JSON body
+     - headers      Headers of the response
+     - links        URLs of the Link header by relation (next, last...)
+     - cached       True if the body was read from the cache (304 Not Modified)
+    """
+
+    def __init__(self, data, headers, links: Dict[str, str], cached: bool = False):
+        self.data = data
+        self.headers = headers
+        self.links = links
+        self.cached = cached
+
+
+class RestClient:
+    """
+    Client of a JSON REST API (GitHub, GitLab, Jira)
+
+    The responses are cached with their ETag: the next request of an URL sends
+    If-None-Match and a 304 Not Modified reuses the cached body, it doesn't
+    count in the rate limit of GitHub. When the budget of the rate limit is
+    spent, the requests wait for its reset. The pages of a list are fetched
+    concurrently when the Link header gives the last one.
+
+    Attributes:
+    -----------
+     - base_url     URL of the API, e.g. https://api.github.com
+     - headers      Headers sent with every request (authentication)
+     - workers      Number of concurrent requests
+     - retry_delay  Maximum number of seconds to wait for the reset of the rate limit
+     - timeout      Timeout of a request in seconds
+    """
+
+    def __init__(self, base_url: str, headers: Dict[str, str] = None, workers: int = 1,
+                 retry_delay: int = 3600, timeout: int = 60):
+        self.base_url = base_url.rstrip("/")
+        self.headers = headers or {}
+        self.workers = workers
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+        self.nb_requests = 0
+        self.nb_not_modified = 0
+        self.__cache = {}
+        self.__cache_updates = {}
+        self.__requested_urls = set()
+        self.__lock = threading.Lock()
+
+    def url(self, path: str, params: Dict = None) -> str:
+        url = self.base_url + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params, doseq=True)
+        return url
+
+    def load_cache(self, session, path: str = ""):
+        """Load the cached responses of the URLs starting with path"""
+        prefix = self.url(path)
+        entries = session.query(HttpCache.url, HttpCache.etag, HttpCache.link, HttpCache.body) \
+                         .filter(HttpCache.url.startswith(prefix, autoescape=True))
+        for url, etag, link, body in entries:
+            self.__cache[url] = {"url": url, "etag": etag, "link": link, "body": body}
+
+    def save_cache(self, session, batch_size: int = 1000):
+        """
+        Save the responses received since the cache was loaded, the caller commits
+        The loaded responses that weren't requested again are deleted: their URL
+        won't come back (e.g. a since parameter of a previous sync)
+        """
+        rows = list(self.__cache_updates.values())
+        for i in range(0, len(rows), batch_size):
+            upsert_rows(session, HttpCache.__table__, rows[i:i + batch_size],
+                        ["url"], ["etag", "link", "body", "updated_at"])
+        unused_urls = [url for url in self.__cache if url not in self.__requested_urls]
+        for i in range(0, len(unused_urls), batch_size):
+            session.query(HttpCache).filter(HttpCache.url.in_(unused_urls[i:i + batch_size])) \
+                   .delete(synchronize_session=False)
+        for url in unused_urls:
+            del self.__cache[url]
+        self.__cache_updates = {}
+        self.__requested_urls = set()
+
+    def get(self, path: str, params: Dict = None) -> RestResponse:
+        return self.get_url(self.url(path, params))
+
+    def get_url(self, url: str) -> RestResponse:
+        """
+        GET an URL, conditionally if it is cached
+        The request is sent again after the reset of the rate limit if it was exceeded
+        """
+        cached = self.__cache.get(url)
+        with self.__lock:
+            self.__requested_urls.add(url)
+        headers = dict(self.headers, Accept=self.headers.get("Accept", "application/json"))
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.__wait_for_rate_limit()
+            request = urllib.request.Request(url, headers=headers)
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    self.__update_rate_limit(response.headers)
+                    body = response.read().decode("utf-8")
+                    response_headers = response.headers
+                break
+            except urllib.error.HTTPError as error:
+                self.__update_rate_limit(error.headers)
+                if error.code == 304 and cached:
+                    with self.__lock:
+                        self.nb_not_modified += 1
+                    return RestResponse(json.loads(cached["body"]), error.headers,
+                                        _parse_link(cached["link"]), cached=True)
+                if error.code in (403, 429) and attempt < MAX_ATTEMPTS and self.__is_rate_limited(error.headers):
+                    logging.warning(f"Rate limit exceeded for {url}, attempt {attempt}/{MAX_ATTEMPTS}")
+                    continue
+                raise
+
+        link = response_headers.get("Link")
+        etag = response_headers.get("ETag")
+        with self.__lock:
+            self.nb_requests += 1
+            if etag:
+                self.__cache_updates[url] = {"url": url, "etag": etag, "link": link, "body": body,
+                                             "updated_at": datetime.datetime.utcnow()}
+        return RestResponse(json.loads(body), response_headers, _parse_link(link))
+
+    def get_pages(self, path: str, params: Dict = None) -> Iterator:
+        """
+        Yield the items of all the pages of a list, in the order of the pages
+        The pages after the first one are fetched concurrently if the Link header
+        of the first one gives the last page, one after another following the
+        next links otherwise (keyset pagination)
+        The list must be sorted on a key that doesn't change (e.g. the creation
+        date): an item moving during the concurrent fetch shifts the next pages,
+        another item would be skipped
+        """
+        response = self.get(path, params)
+        yield from response.data
+
+        last_url = response.links.get("last")
+        last_query = urllib.parse.parse_qs(urllib.parse.urlsplit(last_url).query) if last_url else {}
+        if "page" in last_query:
+            last_page = int(last_query["page"][0])
+            urls = [_with_page(last_url, page) for page in range(2, last_page + 1)]
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for page_response in executor.map(self.get_url, urls):
+                    yield from page_response.data
+        else:
+            # Keyset pagination, each page gives the next one: the next page is
+            # requested while the items of the current one are consumed
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                next_url = response.links.get("next")
+                next_response = executor.submit(self.get_url, next_url) if next_url else None
+                while next_response:
+                    response = next_response.result()
+                    next_url = response.links.get("next")
+                    next_response = executor.submit(self.get_url, next_url) if next_url else None
+                    yield from response.data
+
+    def get_offset_pages(self, path: str, params: Dict, items_key: str, start_param: str = "startAt",
+                         size_param: str = "maxResults", total_key: str = "total") -> Iterator:
+        """
+        Yield the items of all the pages of a list paginated by offset (Jira search),
+        in the order of the pages
+        The first page gives the total and the page size allowed by the server,
+        the next pages are fetched concurrently: as for get_pages, the list must be
+        sorted on a key that doesn't change
+        """
+        params = dict(params)
+        params[start_param] = 0
+        response = self.get(path, params)
+        yield from response.data[items_key]
+
+        total = response.data.get(total_key, 0)
+        page_size = response.data.get(size_param) or len(response.data[items_key])
+        if not page_size:
+            return
+        params[size_param] = page_size
+        urls = [self.url(path, dict(params, **{start_param: start}))
+                for start in range(page_size, total, page_size)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for page_response in executor.map(self.get_url, urls):
+                yield from page_response.data[items_key]
+
+    def __is_rate_limited(self, headers) -> bool:
+        return "Retry-After" in headers or self.rate_limit_remaining == 0
+
+    def __update_rate_limit(self, headers):
+        """Read the budget of the rate limit from the GitHub (X-RateLimit-*) or GitLab (RateLimit-*) headers"""
+        remaining = headers.get("X-RateLimit-Remaining", headers.get("RateLimit-Remaining"))
+        reset = headers.get("X-RateLimit-Reset", headers.get("RateLimit-Reset"))
+        retry_after = headers.get("Retry-After")
+        with self.__lock:
+            if retry_after is not None:
+                self.rate_limit_remaining = 0
+                self.rate_limit_reset = time.time() + int(retry_after)
+                return
+            if remaining is None:
+                return
+            remaining = int(remaining)
+            reset = int(reset) if reset is not None else None
+            if reset != self.rate_limit_reset or self.rate_limit_remaining is None:
+                # New window of the rate limit
+                self.rate_limit_remaining = remaining
+                self.rate_limit_reset = reset
+            else:
+                # The responses of concurrent requests come in any order
+                self.rate_limit_remaining = min(self.rate_limit_remaining, remaining)
+
+    def __wait_for_rate_limit(self):
+        """Take a request from the budget of the rate limit, wait for its reset if it is spent"""
+        with self.__lock:
+            if self.rate_limit_remaining is None or self.rate_limit_remaining > 0:
+                if self.rate_limit_remaining is not None:
+                    self.rate_limit_remaining -= 1
+                return
+            delay = self.retry_delay
+            if self.rate_limit_reset is not None:
+                delay = min(max(self.rate_limit_reset - time.time(), 0) + 1, self.retry_delay)
+        logging.info(f"Rate limit budget spent, waiting {delay:.0f} s for its reset")
+        time.sleep(delay)
+        with self.__lock:
+            # The budget of the new window is read from the next response
+            self.rate_limit_remaining = None
+
+
+def _parse_link(link: str) -> Dict[str, str]:
+    """Parse a Link header, e.g. <https://api.github.com/...&page=2>; rel="next" """
+    if not link:
+        return {}
+    return {rel: url for url, rel in LINK_PATTERN.findall(link)}
+
+
+def _with_page(url: str, page: int) -> str:
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qs(parts.query)
+    query["page"] = [str(page)]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query, doseq=True)))
@@ -0,0 +1,445 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from types import SimpleNamespace
+from typing import Dict, List
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from connectors.ck import CkConnector
+from connectors.fileanalyzer import FileAnalyzer
+from connectors.legacy import LegacyConnector
+from models.commit import Commit
+from models.metric import Metric
+from models.version import Version
+from utils.database import get_pipeline_progress, save_pipeline_progress
+from utils.dirs import PathFilter, TmpDirCopyFilteredWithEnv
+from utils.gittree import GitTree
+from utils.timeit import timeit
+
+LEGACY_STAGE = "legacy"
+CK_STAGE = "ck"
+LIZARD_STAGE = "lizard"
+# Status of a stage in the pipeline_progress table
+RUNNING_STATUS = "running"
+DONE_STATUS = "done"
+FAILED_STATUS = "failed"
+# Steps of the pipeline around the analysis of the versions by the workers
+PREPARE_STEP = "prepare"
+WRITE_STEP = "write"
+# Update of the file age index before the pipeline, the legacy files are read from it
+INDEX_STEP = "index"
+
+# Seconds between two checks of the prepared versions and of the running analyses
+POLL_DELAY = 0.1
+
+# Read only session of the worker process, used to look up the Lizard cache
+_session = None
+
+def _get_worker_context():
+    """
+    The worker processes aren't forked from the scheduler: a process forked while
+    the prepare thread runs a git command would keep its pipe open and block it
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+def _init_worker(target_database):
+    global _session
+    _session = sessionmaker(bind=create_engine(target_database))()
+
+def _get_metric_values(metric: Metric) -> Dict:
+    return {
+        column.name: getattr(metric, column.name)
+        for column in Metric.__table__.columns
+        if column.name not in ["metrics_id", "version_id"] and getattr(metric, column.name) is not None
+    }
+
+def _get_fingerprint(*inputs) -> str:
+    """Hash of the inputs of a stage, the stage is done again when they change"""
+    return hashlib.sha1(json.dumps(inputs, default=str).encode()).hexdigest()
+
+def _analyze_version(task: Dict) -> Dict:
+    """
+    Run the analyzers of a version inside a worker process
+    The database is only read here, the values are sent back to the parent process
+    A stage that fails doesn't prevent the values of the other ones from being saved
+    """
+    version = task["version"]
+    config = task["config"]
+    stages = task["stages"]
+    metric_values = {}
+    caches = {}
+    errors = {}
+    durations = {}
+    # A single worker analyzes the versions one after another, Lizard has its own processes
+    lizard_workers = config.lizard_workers if config.workers == 1 else 1
+
+    def run_lizard(directory, git_tree=None):
+        lizard = FileAnalyzer(directory=directory, version=version, session=_session, workers=lizard_workers,
+                              git_tree=git_tree)
+        metric = lizard.compute_metric(Metric())
+        return metric, lizard.get_cache_updates()
+
+    def run_legacy():
+        legacy = LegacyConnector(version.project_id, task["repo_dir"], version, _session, config,
+                                 first_commit_date=task["first_commit_date"])
+        legacy_files = list(legacy.compute_modified_legacy_files(version))
+        return Metric(nb_legacy_files=len(legacy_files)), legacy_files
+
+    def run_ck(directory, git_tree=None):
+        ck = CkConnector(directory=directory, version=version, session=_session, config=config, git_tree=git_tree)
+        metric = Metric()
+        if not ck.compute_metrics(metric):
+            raise RuntimeError("CK didn't produce any report")
+        return metric, ck.get_cache_updates()
+
+    def run_stage(stage, analyze, *args):
+        start = time.perf_counter()
+        try:
+            metric, caches[stage] = analyze(*args)
+            metric_values[stage] = _get_metric_values(metric)
+        except Exception as e:
+            errors[stage] = str(e)
+        finally:
+            _session.rollback()
+        durations[stage] = time.perf_counter() - start
+
+    if LEGACY_STAGE in stages:
+        run_stage(LEGACY_STAGE, run_legacy)
+
+    if config.source_backend == "git":
+        git_tree = GitTree(config.scm_path, task["repo_dir"], version.tag,
+                           PathFilter(config.include_folders, config.exclude_folders))
+        if LIZARD_STAGE in stages:
+            run_stage(LIZARD_STAGE, run_lizard, task["repo_dir"], git_tree)
+        if CK_STAGE in stages:
+            run_stage(CK_STAGE, run_ck, task["repo_dir"], git_tree)
+
+    if task["worktree"]:
+        with TmpDirCopyFilteredWithEnv(task["worktree"], config.include_folders,
+                                       config.exclude_folders) as tmp_work_dir:
+            if CK_STAGE in stages:
+                run_stage(CK_STAGE, run_ck, tmp_work_dir)
+
+            if config.source_backend == "checkout" and LIZARD_STAGE in stages:
+                run_stage(LIZARD_STAGE, run_lizard, tmp_work_dir)
+
+    return {
+        "version_id": version.version_id,
+        "metric_values": metric_values,
+        "caches": caches,
+        "errors": errors,
+        "durations": durations
+    }
+
+
+class PipelineMetrics:
+    """
+    Time spent in each step of the pipeline and depth of its queues,
+    to find out where the bottleneck is
+
+    Attributes:
+    -----------
+     - durations    Seconds spent by step, one value by version
+     - depths       Depths of the queues by name, one value by sample
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.depths = {}
+        self.__lock = threading.Lock()
+
+    def add_duration(self, step: str, seconds: float):
+        with self.__lock:
+            self.durations.setdefault(step, []).append(seconds)
+
+    def add_depth(self, queue_name: str, depth: int):
+        with self.__lock:
+            self.depths.setdefault(queue_name, []).append(depth)
+
+    def get_summary(self) -> List[str]:
+        lines = []
+        for step, durations in self.durations.items():
+            lines.append(f"Step {step}: {sum(durations):.2f} s for {len(durations)} version(s), "
+                         f"max {max(durations):.2f} s")
+        for queue_name, depths in self.depths.items():
+            lines.append(f"Queue {queue_name}: mean depth {sum(depths) / len(depths):.1f}, max {max(depths)}")
+        return lines
+
+
+class VersionAnalysisScheduler:
+    """
+    Analyze several versions in parallel
+
+    The versions go through a pipeline: a thread prepares them (checked out
+    into their own git worktree when the checkout source backend needs it)
+    into a bounded queue, the worker processes analyze them (legacy files,
+    CK and Lizard) and the current process, the only writer of the database,
+    saves the values sent back. The next versions are prepared and the
+    previous ones written while the workers analyze. The file age index that
+    the legacy files are read from is updated once before.
+
+    The stages of each version are recorded in the pipeline_progress table
+    with the fingerprint of their inputs and the version of their tool: a
+    stage is only done again if they changed or if it didn't complete.
+
+    Attributes:
+    -----------
+     - project_id   Identifier of the project
+     - repo_dir     Folder where the project is cloned
+     - session      Database connection managed by sqlachemy
+     - config       Configuration, OTTM_WORKERS gives the number of processes
+     - metrics      Durations of the steps and depths of the queues of the pipeline
+    """
+
+    def __init__(self, project_id, repo_dir, session, config):
+        self.project_id = project_id
+        self.repo_dir = repo_dir
+        self.session = session
+        self.configuration = config
+        self.metrics = PipelineMetrics()
+        self.__worktrees_dir = None
+        self.__worktree_lock = threading.Lock()
+
+    @timeit
+    def analyze_versions(self, versions: List[Version]):
+        """Analyze the versions, at most OTTM_WORKERS of them at the same time"""
+        logging.info('VersionAnalysisScheduler::analyze_versions')
+        first_commit_date = self.session.query(Commit.date) \
+                                        .filter(Commit.project_id == self.project_id) \
+                                        .order_by(Commit.date.asc()).limit(1).scalar()
+
+        progress = get_pipeline_progress(self.session, [version.version_id for version in versions],
+                                         self.configuration.batch_size)
+        pending = [(version, self.__get_pending_stages(version, progress)) for version in versions]
+        index_error = None
+        if any(LEGACY_STAGE in inputs for _, inputs in pending):
+            index_error = self.__update_file_age_index(first_commit_date)
+
+        tasks = []
+        for version, inputs in pending:
+            if index_error and LEGACY_STAGE in inputs:
+                save_pipeline_progress(self.session, version.version_id, LEGACY_STAGE, FAILED_STATUS,
+                                       error=index_error, **inputs.pop(LEGACY_STAGE))
+            if inputs:
+                tasks.append(self.__create_task(version, inputs, first_commit_date))
+            else:
+                logging.info('Analysis already done for version ' + version.name)
+        self.session.commit()
+
+        with tempfile.TemporaryDirectory() as worktrees_dir:
+            self.__worktrees_dir = worktrees_dir
+            # The versions prepared ahead of the workers, at most one per worker
+            prepared = queue.Queue(maxsize=self.configuration.workers)
+            with ProcessPoolExecutor(max_workers=self.configuration.workers,
+                                     mp_context=_get_worker_context(),
+                                     initializer=_init_worker,
+                                     initargs=(self.configuration.target_database,)) as executor:
+                threading.Thread(target=self.__prepare_tasks, args=(list(tasks), prepared), daemon=True).start()
+                running = {}
+                nb_pending = len(tasks)
+                while nb_pending or running:
+                    while nb_pending and len(running) < self.configuration.workers:
+                        self.metrics.add_depth("prepared", prepared.qsize())
+                        try:
+                            # Wait for a prepared version only if the workers have nothing to do
+                            task = prepared.get(timeout=None if not running else POLL_DELAY)
+                        except queue.Empty:
+                            break
+                        nb_pending -= 1
+                        if task["error"]:
+                            self.__fail_worktree_stages(task)
+                        if task["stages"]:
+                            self.__save_progress(task, task["stages"], RUNNING_STATUS)
+                            running[executor.submit(_analyze_version, task)] = task
+                        self.session.commit()
+
+                    done, _ = wait(running, timeout=POLL_DELAY if nb_pending else None,
+                                   return_when=FIRST_COMPLETED)
+                    self.metrics.add_depth("analyzed", len(done))
+                    for future in done:
+                        task = running.pop(future)
+                        start = time.perf_counter()
+                        self.__remove_worktree(task)
+                        try:
+                            result = future.result()
+                            for stage, seconds in result["durations"].items():
+                                self.metrics.add_duration(stage, seconds)
+                            self.__save_result(task, result)
+                        except Exception as e:
+                            logging.error("An error occurred while analyzing version " + task["version"].tag)
+                            logging.error(str(e))
+                            self.session.rollback()
+                            self.__save_progress(task, task["stages"], FAILED_STATUS, error=str(e))
+                            self.session.commit()
+                        self.metrics.add_duration(WRITE_STEP, time.perf_counter() - start)
+
+        for line in self.metrics.get_summary():
+            logging.info(line)
+
+    def __prepare_tasks(self, tasks: List[Dict], prepared: queue.Queue):
+        """Prepare the versions one after another, blocked when the queue is full"""
+        for task in tasks:
+            start = time.perf_counter()
+            try:
+                self.__add_worktree(task)
+            except Exception as e:
+                logging.error("An error occurred while preparing version " + task["version"].tag)
+                logging.error(str(e))
+                task["worktree"] = None
+                task["error"] = str(e)
+            self.metrics.add_duration(PREPARE_STEP, time.perf_counter() - start)
+            prepared.put(task)
+
+    def __get_pending_stages(self, version: Version, progress: Dict) -> Dict[str, Dict]:
+        """
+        Return the stages of the version to do with the fingerprint of their
+        inputs and the version of their tool
+        """
+        commit_hash = self.__rev_parse(version.tag + "^{commit}")
+        tree_hash = self.__rev_parse(version.tag + "^{tree}")
+        folders = [self.configuration.include_folders, self.configuration.exclude_folders]
+        inputs = {
+            LEGACY_STAGE: {"fingerprint": _get_fingerprint(commit_hash, self.configuration.legacy_percent),
+                           "tool_version": None},
+            LIZARD_STAGE: {"fingerprint": _get_fingerprint(tree_hash, *folders),
+                           "tool_version": FileAnalyzer.get_tool_version()}
+        }
+        if self.configuration.language == "Java":
+            # The values of the incremental analysis differ (classes analyzed apart)
+            ck_fingerprint = _get_fingerprint(tree_hash, *folders, self.configuration.ck_incremental)
+            inputs[CK_STAGE] = {"fingerprint": ck_fingerprint,
+                                "tool_version": CkConnector.get_tool_version(self.configuration)}
+
+        pending = {}
+        for stage, stage_inputs in inputs.items():
+            row = progress.get((version.version_id, stage))
+            if row is not None and row.status == DONE_STATUS and row.fingerprint == stage_inputs["fingerprint"] \
+                    and row.tool_version == stage_inputs["tool_version"]:
+                continue
+            pending[stage] = stage_inputs
+        return pending
+
+    def __rev_parse(self, rev: str) -> str:
+        """Hash of a git object, None if the revision doesn't exist"""
+        process = subprocess.run([self.configuration.scm_path, "rev-parse", "--verify", "--quiet", rev],
+                                 stdout=subprocess.PIPE, cwd=self.repo_dir)
+        return process.stdout.decode().strip() or None
+
+    def __update_file_age_index(self, first_commit_date) -> str:
+        """
+        Index the commits added since the last run, the legacy files of the
+        versions are then read by the workers. Return the error if it failed
+        """
+        start = time.perf_counter()
+        try:
+            legacy = LegacyConnector(self.project_id, self.repo_dir, None, self.session,
+                                     self.configuration, first_commit_date=first_commit_date)
+            legacy.update_file_age_index()
+            return None
+        except Exception as e:
+            logging.error("An error occurred while indexing the age of the files")
+            logging.error(str(e))
+            self.session.rollback()
+            return str(e)
+        finally:
+            self.metrics.add_duration(INDEX_STEP, time.perf_counter() - start)
+
+    def __fail_worktree_stages(self, task: Dict):
+        """The stages reading the worktree of a version that couldn't be prepared fail, the other ones run"""
+        failed = [stage for stage in task["stages"] if stage in (CK_STAGE, LIZARD_STAGE)]
+        self.__save_progress(task, failed, FAILED_STATUS, error=task["error"])
+        task["stages"] = [stage for stage in task["stages"] if stage not in failed]
+
+    def __create_task(self, version: Version, inputs: Dict[str, Dict], first_commit_date) -> Dict:
+        # Plain objects as ORM objects are bound to the session of this process
+        return {
+            "repo_dir": self.repo_dir,
+            "config": self.configuration,
+            "stages": list(inputs),
+            "inputs": inputs,
+            "first_commit_date": first_commit_date,
+            "worktree": None,
+            "error": None,
+            "version": SimpleNamespace(
+                version_id=version.version_id,
+                project_id=version.project_id,
+                name=version.name,
+                tag=version.tag,
+                start_date=version.start_date,
+                end_date=version.end_date
+            )
+        }
+
+    def __save_progress(self, task: Dict, stages: List[str], status: str, durations: Dict = None,
+                        error: str = None):
+        for stage in stages:
+            save_pipeline_progress(self.session, task["version"].version_id, stage, status,
+                                   (durations or {}).get(stage), error=error, **task["inputs"][stage])
+
+    def __add_worktree(self, task: Dict):
+        task["worktree"] = None
+        if self.configuration.source_backend == "git" or \
+                (CK_STAGE not in task["stages"] and LIZARD_STAGE not in task["stages"]):
+            return
+        worktree = os.path.join(self.__worktrees_dir, str(task["version"].version_id))
+        with self.__worktree_lock:
+            process = subprocess.run([self.configuration.scm_path, "worktree", "add", "--detach",
+                                      worktree, task["version"].tag],
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.repo_dir)
+        logging.info('Executed command line: ' + ' '.join(process.args))
+        if process.returncode != 0:
+            raise RuntimeError(f"Cannot check out version {task['version'].tag}: "
+                               + process.stderr.decode(errors="replace").strip())
+        task["worktree"] = worktree
+
+    def __remove_worktree(self, task: Dict):
+        if not task["worktree"]:
+            return
+        with self.__worktree_lock:
+            process = subprocess.run([self.configuration.scm_path, "worktree", "remove", "--force",
+                                      task["worktree"]],
+                                     stdout=subprocess.PIPE, cwd=self.repo_dir)
+        logging.info('Executed command line: ' + ' '.join(process.args))
+
+    def __save_result(self, task: Dict, result: Dict):
+        """Save the values of the stages that completed, the other ones are marked as failed"""
+        version_id = result["version_id"]
+        metric = self.session.query(Metric).filter(Metric.version_id == version_id).first()
+        if not metric:
+            metric = Metric(version_id=version_id)
+
+        for values in result["metric_values"].values():
+            for name, value in values.items():
+                setattr(metric, name, value)
+
+        if LIZARD_STAGE in result["caches"]:
+            FileAnalyzer.save_cache_updates(self.session, result["caches"][LIZARD_STAGE])
+        if CK_STAGE in result["caches"]:
+            CkConnector.save_cache_updates(self.session, result["caches"][CK_STAGE])
+        if LEGACY_STAGE in result["caches"]:
+            LegacyConnector.save_legacy_files(self.session, result["caches"][LEGACY_STAGE], version_id,
+                                              self.configuration.batch_size)
+
+        done = [stage for stage in task["stages"] if stage in result["metric_values"]]
+        self.__save_progress(task, done, DONE_STATUS, result["durations"])
+        for stage in task["stages"]:
+            if stage not in done:
+                error = result["errors"].get(stage, "Stage not run")
+                logging.error(f"Stage {stage} failed for version {task['version'].tag}: {error}")
+                self.__save_progress(task, [stage], FAILED_STATUS, result["durations"], error)
+
+        self.session.add(metric)
+        self.session.commit()
+        logging.info("Metrics added to database for version %s", version_id)